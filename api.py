@@ -1,13 +1,34 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from PIL import Image
-import ollama
+from fastapi import FastAPI, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
 import io
+import itertools
 import json
-from typing import Dict, Any
+import threading
+import time
+import zipfile
+from typing import Callable, Dict, Any, List, Optional, Tuple, Union
 import uvicorn
-import requests
+from PIL import Image
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+
+from backends import OLLAMA_KEEP_ALIVE, BackendPool, NoBackendAvailableError, create_backend, model_available, parse_keep_alive
+from cache import ResultCache, make_cache_key
+from cascade import CASCADE_CV_CONFIDENCE, CASCADE_FAST_AGREEMENT, CASCADE_FAST_MODEL, detection_agreement, parse_stages, run_cascade
+from cv_detector import CV_CONFIDENCE_THRESHOLD, detect_checkboxes
+from documents import BLANK_PAGE_STDDEV, PDF_SUPPORT, DocumentError, document_kind, iter_pages
+from fetcher import FetchError, FetchTooLargeError, ImageFetcher
+from inference import InferencePool, PoolSaturatedError, SingleFlight
+from ingest import IMAGE_KINDS, MAX_UPLOAD_BYTES, ImageTooLargeError, InvalidImageError, UploadTooLargeError, check_upload_head, describe_image
+from jobs import JobQueueFullError, JobScheduler, create_job_store
+from metrics import TOKEN_BUCKETS, MetricsRegistry
+from parsing import STRUCTURED_OUTPUT, IncrementalJSONParser, output_format, parse_analysis
+from preprocess import PreprocessConfig, preprocess_image
+from prompts import ANALYSIS_PROMPT, MODEL_NAME, REGION_PROMPT
+from sinks import create_sink, result_record
+from templates import TemplateMismatchError, TemplateRegistry
+from tiling import crop_tiles, merge_results, plan_tiles
 
 
 
@@ -27,50 +48,638 @@ app.add_middleware(
 
 
 
-# Model configuration
-MODEL_NAME = "granite3.2-vision:2b"
+# Model server (or fake stand-in) used for inference
+backend = create_backend(model=MODEL_NAME)
+
+# How long Ollama keeps the model loaded after each call
+KEEP_ALIVE = parse_keep_alive(OLLAMA_KEEP_ALIVE)
+
+# Constrained decoding requested from Ollama so completions are valid JSON
+OUTPUT_FORMAT = output_format(STRUCTURED_OUTPUT)
+
+# Seconds between attempts to pull and warm up the model when one fails
+MODEL_PREPARE_RETRY = 10
+
+# Model readiness reported by /ready: starting, pulling, warming, ready or failed
+model_state: Dict[str, Any] = {"state": "starting", "error": None, "pulled": False, "warmup_ms": None}
+
+# Normalization applied to images before inference
+preprocess_config = PreprocessConfig.from_env()
+
+# Shared pool that runs the blocking ollama calls off the event loop
+inference_pool = InferencePool()
+
+# Cache of analysis results keyed by image content, model and prompt
+result_cache = ResultCache()
+
+# Shared keep-alive HTTP client for /analyze-checkboxes-url
+image_fetcher = ImageFetcher()
+
+# Coalesces concurrent analyses of the same image into one inference
+in_flight_analyses = SingleFlight()
+
+# Known form layouts answered without the model
+template_registry = TemplateRegistry()
+
+# Background writer persisting results (RESULT_SINK), or None
+result_sink = create_sink()
+
+# Batch upload limits: images, and their total size once unzipped
+MAX_BATCH_ITEMS = 200
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+
+# Bytes read from an upload to check its type and dimensions before the rest
+UPLOAD_HEAD_BYTES = 64 * 1024
+
+# Batch item contents: the bytes, or the error that rejected the upload
+BatchPayload = Union[bytes, ValueError]
+
+# Analysis modes: the vision model, the classical CV detector, CV with a
+# fallback to the model when the detector is unsure, the model on page regions,
+# or the stages of the model cascade
+ANALYSIS_MODES = ("llm", "cv", "hybrid", "tiled", "cascade")
+
+# Stages tried in cascade mode, cheapest first (CASCADE_STAGES)
+cascade_stages = parse_stages()
+
+# Metrics exposed on /metrics
+metrics = MetricsRegistry()
+http_requests = metrics.histogram(
+    "checkbox_http_request_duration_seconds", "HTTP request latency", ("route", "method", "status")
+)
+http_in_flight = metrics.gauge("checkbox_http_requests_in_flight", "HTTP requests currently being served")
+stage_seconds = metrics.histogram(
+    "checkbox_stage_duration_seconds", "Time spent in each analysis stage", ("stage",)
+)
+cache_lookups = metrics.counter("checkbox_result_cache_lookups_total", "Result cache lookups", ("result",))
+parse_results = metrics.counter(
+    "checkbox_parse_results_total", "Model completions parsed into a result or left as raw text", ("result",)
+)
+cv_answers = metrics.counter(
+    "checkbox_cv_results_total", "CV detector runs answered directly or escalated to the model", ("result",)
+)
+blank_pages = metrics.counter("checkbox_blank_pages_total", "Document pages skipped as blank")
+cascade_answers = metrics.counter("checkbox_cascade_answers_total", "Cascade requests by the stage that answered", ("stage",))
+model_prompt_tokens = metrics.histogram(
+    "checkbox_model_prompt_tokens", "Prompt tokens evaluated per model call", buckets=TOKEN_BUCKETS
+)
+model_eval_tokens = metrics.histogram(
+    "checkbox_model_eval_tokens", "Tokens generated per model call", buckets=TOKEN_BUCKETS
+)
+model_durations = metrics.histogram(
+    "checkbox_model_duration_seconds", "Durations reported by Ollama per model call", ("phase",)
+)
+metrics.gauge("checkbox_inference_in_flight", "Inferences running on the pool", lambda: inference_pool.in_flight)
+metrics.gauge("checkbox_inference_queue_depth", "Inferences waiting for a pool worker", lambda: inference_pool.queue_depth)
+metrics.gauge("checkbox_job_queue_depth", "Background jobs waiting to run", lambda: job_scheduler.queue_depth)
+
+
+def _observe_timings(timings: Dict[str, float]) -> None:
+    """Record ``<stage>_ms`` timings in the stage histogram"""
+    for name, value in timings.items():
+        stage_seconds.observe(value / 1000, stage=name[:-3] if name.endswith("_ms") else name)
+
+
+def _record_model_stats(response: Dict[str, Any]) -> None:
+    """Record the token counts and durations Ollama reports with a completion"""
+    if "prompt_eval_count" in response:
+        model_prompt_tokens.observe(response["prompt_eval_count"])
+    if "eval_count" in response:
+        model_eval_tokens.observe(response["eval_count"])
+    for phase in ("total", "load", "prompt_eval", "eval"):
+        duration = response.get(f"{phase}_duration")
+        if duration is not None:
+            model_durations.observe(duration / 1e9, phase=phase)
+
+
+def _server_timing(timings: Dict[str, float]) -> str:
+    """Format stage timings as a Server-Timing header value"""
+    return ", ".join(
+        f"{name[:-3] if name.endswith('_ms') else name};dur={value}"
+        for name, value in timings.items()
+    )
+
+
+def _elapsed_ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+def _run_model(image_bytes: bytes, prompt: str = ANALYSIS_PROMPT, model: str = MODEL_NAME) -> Dict[str, Any]:
+    """Send the image to the model and return the chat response"""
+    response = backend.chat(
+        model=model,
+        messages=[
+            {
+                "role": "user",
+                "content": prompt,
+                "images": [image_bytes]
+            }
+        ],
+        format=OUTPUT_FORMAT,
+        keep_alive=KEEP_ALIVE
+    )
+    _record_model_stats(response)
+    return response
+
+
+def _stream_model(image_bytes: bytes, on_chunk: Callable[[str], None], cancelled: threading.Event) -> str:
+    """
+    Stream the completion, passing each chunk to ``on_chunk``, and return the full text
+
+    Stops early and closes the model stream once ``cancelled`` is set, e.g.
+    when the client has disconnected.
+    """
+    chunks = []
+    stream = backend.chat(
+        model=MODEL_NAME,
+        messages=[
+            {
+                "role": "user",
+                "content": ANALYSIS_PROMPT,
+                "images": [image_bytes]
+            }
+        ],
+        stream=True,
+        format=OUTPUT_FORMAT,
+        keep_alive=KEEP_ALIVE
+    )
+    try:
+        for part in stream:
+            if cancelled.is_set():
+                break
+            chunk = part['message']['content']
+            chunks.append(chunk)
+            on_chunk(chunk)
+            if part.get('done'):
+                _record_model_stats(part)
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return "".join(chunks)
+
+
+def _parse_analysis(analysis_result: str) -> Dict[str, Any]:
+    """Parse the model output into a normalized result, falling back to the raw text"""
+    parsed_result = parse_analysis(analysis_result)
+    parse_results.inc(result="failed" if "raw_response" in parsed_result else "parsed")
+    return parsed_result
+
+
+def _cache_key(image_data: bytes, prompt: str, model: str = MODEL_NAME) -> str:
+    """Result cache key for an image analysed with ``prompt`` under the current configuration"""
+    return make_cache_key(
+        image_data, model, prompt, f"{preprocess_config.fingerprint()}|format={STRUCTURED_OUTPUT}"
+    )
+
+
+async def _analyze_uncached(image_data: bytes, cache_key: str, model: str = MODEL_NAME) -> Dict[str, Any]:
+    """Preprocess the image, run the model and store a parseable result in the cache"""
+    timings = {}
+    started = time.perf_counter()
+    image_bytes, image_info = await run_in_threadpool(preprocess_image, image_data, preprocess_config)
+    timings["preprocess_ms"] = _elapsed_ms(time.perf_counter() - started)
+
+    # Send to model for analysis
+    response, queue_wait, inference = await inference_pool.run_timed(
+        _run_model, image_bytes, ANALYSIS_PROMPT, model
+    )
+    timings["queue_wait_ms"] = _elapsed_ms(queue_wait)
+    timings["inference_ms"] = _elapsed_ms(inference)
+
+    started = time.perf_counter()
+    parsed_result = _parse_analysis(response['message']['content'])
+    timings["parse_ms"] = _elapsed_ms(time.perf_counter() - started)
+    _observe_timings(timings)
+
+    # Unparseable output is not cached so a retry gets a fresh completion
+    if "raw_response" not in parsed_result:
+        await run_in_threadpool(result_cache.set, cache_key, {
+            "image_info": image_info,
+            "checkbox_analysis": parsed_result
+        })
+    return {
+        "image_info": image_info,
+        "checkbox_analysis": parsed_result,
+        "timings": timings
+    }
+
+
+async def _analyze_tiles_uncached(image_data: bytes, cache_key: str, model: str = MODEL_NAME) -> Dict[str, Any]:
+    """Run the model on overlapping regions of the page concurrently and merge the results"""
+    timings = {}
+    started = time.perf_counter()
+    image_info = await run_in_threadpool(describe_image, image_data)
+    detection = await run_in_threadpool(detect_checkboxes, image_data)
+    tiles = plan_tiles(tuple(detection["image_size"]), [box["bbox"] for box in detection["boxes"]])
+    crops = await run_in_threadpool(crop_tiles, image_data, tiles)
+    timings["tiling_ms"] = _elapsed_ms(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    prepared = [await run_in_threadpool(preprocess_image, crop, preprocess_config) for crop in crops]
+    timings["preprocess_ms"] = _elapsed_ms(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    runs = await asyncio.gather(*[
+        inference_pool.run_timed(_run_model, tile_bytes, REGION_PROMPT, model)
+        for tile_bytes, _ in prepared
+    ])
+    timings["queue_wait_ms"] = _elapsed_ms(max(queue_wait for _, queue_wait, _ in runs))
+    timings["inference_ms"] = _elapsed_ms(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    tile_results = [_parse_analysis(response['message']['content']) for response, _, _ in runs]
+    parsed_results = [result for result in tile_results if "raw_response" not in result]
+    parsed_result = merge_results(parsed_results)
+    timings["parse_ms"] = _elapsed_ms(time.perf_counter() - started)
+    _observe_timings(timings)
+
+    image_info["tiles"] = [
+        {"bbox": list(tile), "parsed": "raw_response" not in result}
+        for tile, result in zip(tiles, tile_results)
+    ]
+    if len(parsed_results) < len(tile_results):
+        # Keep the unparseable tile output, as the single-shot path does
+        parsed_result["raw_response"] = "\n\n".join(
+            result["raw_response"] for result in tile_results if "raw_response" in result
+        )
+    else:
+        await run_in_threadpool(result_cache.set, cache_key, {
+            "image_info": image_info,
+            "checkbox_analysis": parsed_result
+        })
+    return {
+        "image_info": image_info,
+        "checkbox_analysis": parsed_result,
+        "timings": timings
+    }
+
+
+async def _analyze_with_model(image_data: bytes, tiled: bool = False, model: str = MODEL_NAME) -> Dict[str, Any]:
+    """
+    Run the model pipeline for raw image bytes, consulting the result cache
+
+    Args:
+        image_data: Raw image bytes
+        tiled: Analyze overlapping page regions instead of the whole page
+        model: Vision model to ask (the cascade's fast stage uses a smaller one)
+
+    Returns:
+        Dict with ``image_info``, ``checkbox_analysis``, ``cached`` and
+        per-stage ``timings`` in milliseconds
+    """
+    mode = "tiled" if tiled else "llm"
+    started = time.perf_counter()
+    cache_key = _cache_key(image_data, REGION_PROMPT if tiled else ANALYSIS_PROMPT, model)
+    cached_result = await run_in_threadpool(result_cache.get, cache_key)
+    cache_lookup_ms = _elapsed_ms(time.perf_counter() - started)
+    _observe_timings({"cache_lookup_ms": cache_lookup_ms})
+    cache_lookups.inc(result="hit" if cached_result is not None else "miss")
+    if cached_result is not None:
+        return {
+            "image_info": dict(cached_result["image_info"]),
+            "checkbox_analysis": cached_result["checkbox_analysis"],
+            "cached": True,
+            "mode": mode,
+            "timings": {"cache_lookup_ms": cache_lookup_ms}
+        }
+
+    analyze = _analyze_tiles_uncached if tiled else _analyze_uncached
+    analysis = await in_flight_analyses.do(
+        cache_key, lambda: analyze(image_data, cache_key, model)
+    )
+    return {
+        "image_info": dict(analysis["image_info"]),
+        "checkbox_analysis": analysis["checkbox_analysis"],
+        "cached": False,
+        "mode": mode,
+        "timings": dict(analysis["timings"])
+    }
+
+
+def _detect(image_data: bytes) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Run the CV detector, returning (image_info, detection)"""
+    image_info = describe_image(image_data)
+    return image_info, detect_checkboxes(image_data)
+
+
+def _match_template(image_data: bytes) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Look the page up in the template registry, returning (image_info, match)"""
+    image_info = describe_image(image_data)
+    return image_info, template_registry.match(image_data)
+
+
+async def _analyze_image(image_data: bytes, mode: str = "llm", labels: bool = False) -> Dict[str, Any]:
+    """
+    Analyze raw image bytes with a registered template, the model, the CV
+    detector or both
+
+    Args:
+        image_data: Raw image bytes
+        mode: ``llm``, ``cv``, ``hybrid``, ``tiled`` or ``cascade``
+        labels: In hybrid and cascade mode, always ask a model so results
+            carry the printed option labels instead of box ids
+
+    Returns:
+        Dict with ``image_info``, ``checkbox_analysis``, ``cached``, ``mode``
+        (the path that produced the answer) and per-stage ``timings``; CV and
+        hybrid results also carry the detector's ``detections``, template
+        results the matched ``template`` and cascade results their ``routing``
+    """
+    template_timings = {}
+    if len(template_registry):
+        started = time.perf_counter()
+        image_info, match = await run_in_threadpool(_match_template, image_data)
+        template_timings["template_ms"] = _elapsed_ms(time.perf_counter() - started)
+        _observe_timings(template_timings)
+        if match is not None and match["confidence"] >= CV_CONFIDENCE_THRESHOLD:
+            return {
+                "image_info": image_info,
+                "checkbox_analysis": match["checkbox_analysis"],
+                "cached": False,
+                "mode": "template",
+                "template": {
+                    "template_id": match["template_id"],
+                    "name": match["name"],
+                    "distance": match["distance"],
+                    "alignment": match["alignment"]
+                },
+                "detections": {"boxes": match["boxes"], "confidence": match["confidence"]},
+                "timings": template_timings
+            }
+
+    analysis = await _analyze_untemplated(image_data, mode, labels)
+    analysis["timings"].update(template_timings)
+    return analysis
+
+
+async def _analyze_untemplated(image_data: bytes, mode: str, labels: bool) -> Dict[str, Any]:
+    """Analyze a page that matched no template, as requested by ``mode``"""
+    if mode in ("llm", "tiled"):
+        return await _analyze_with_model(image_data, tiled=mode == "tiled")
+    if mode == "cascade":
+        return await _analyze_cascade(image_data, labels)
+
+    started = time.perf_counter()
+    image_info, detection = await run_in_threadpool(_detect, image_data)
+    cv_ms = _elapsed_ms(time.perf_counter() - started)
+    _observe_timings({"cv_ms": cv_ms})
+
+    confident = bool(detection["boxes"]) and detection["confidence"] >= CV_CONFIDENCE_THRESHOLD
+    if mode == "cv" or (confident and not labels):
+        cv_answers.inc(result="answered")
+        return {
+            "image_info": image_info,
+            "checkbox_analysis": {box["id"]: box["state"] for box in detection["boxes"]},
+            "cached": False,
+            "mode": "cv",
+            "detections": detection,
+            "timings": {"cv_ms": cv_ms}
+        }
+
+    # Unsure (or labels requested): fall back to the model
+    cv_answers.inc(result="escalated")
+    analysis = await _analyze_with_model(image_data)
+    analysis["detections"] = detection
+    analysis["timings"]["cv_ms"] = cv_ms
+    return analysis
+
+
+async def _analyze_cascade(image_data: bytes, labels: bool) -> Dict[str, Any]:
+    """Answer with the cheapest cascade stage that is confident enough, recording the route"""
+    context: Dict[str, Any] = {}
+
+    async def cv_stage(context: Dict[str, Any]):
+        image_info, detection = await run_in_threadpool(_detect, image_data)
+        context["detection"] = detection
+        analysis = {
+            "image_info": image_info,
+            "checkbox_analysis": {box["id"]: box["state"] for box in detection["boxes"]},
+            "cached": False,
+            "mode": "cv",
+            "timings": {}
+        }
+        # Box ids carry no labels, so the detector never answers when labels are wanted
+        confident = bool(detection["boxes"]) and not labels
+        return analysis, detection["confidence"] if confident else None
+
+    async def fast_stage(context: Dict[str, Any]):
+        analysis = await _analyze_with_model(image_data, model=CASCADE_FAST_MODEL)
+        return analysis, detection_agreement(analysis["checkbox_analysis"], context.get("detection"))
+
+    async def model_stage(context: Dict[str, Any]):
+        return await _analyze_with_model(image_data), None
+
+    analysis, routing = await run_cascade(
+        cascade_stages,
+        {"cv": cv_stage, "fast": fast_stage, "model": model_stage},
+        {"cv": CASCADE_CV_CONFIDENCE, "fast": CASCADE_FAST_AGREEMENT},
+        context
+    )
+    answered_by = routing[-1]["stage"]
+    cascade_answers.inc(stage=answered_by)
+
+    stage_timings = {f"cascade_{step['stage']}_ms": step["ms"] for step in routing}
+    _observe_timings(stage_timings)
+    analysis["timings"].update(stage_timings)
+    if "detection" in context:
+        analysis["detections"] = context["detection"]
+    analysis["routing"] = {
+        "answered_by": answered_by,
+        "model": {"cv": None, "fast": CASCADE_FAST_MODEL, "model": MODEL_NAME}[answered_by],
+        "stages": routing
+    }
+    return analysis
+
+
+def _persist_result(source: str, analysis: Dict[str, Any]) -> None:
+    """Queue a finished analysis for the result sink; never blocks the request"""
+    if result_sink is None:
+        return
+    result_sink.submit(result_record(
+        source, analysis["checkbox_analysis"], analysis["mode"], MODEL_NAME, cached=analysis["cached"]
+    ))
+
+
+def _invalid_mode_response(mode: str) -> JSONResponse:
+    """400 returned for an unknown ``mode`` parameter"""
+    return JSONResponse(
+        status_code=400,
+        content={
+            "status_code": 400,
+            "message": f"Invalid mode '{mode}', expected one of: {', '.join(ANALYSIS_MODES)}",
+            "data": None
+        }
+    )
+
 
-# Document verifier prompt
-DOCUMENT_VERIFIER_PROMPT = """
-You are an intelligent document verifier. Your job is to analyze images of documents and determine their meaning.
+async def _read_upload(file: UploadFile, kinds=IMAGE_KINDS, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """
+    Read an upload after checking its size, magic bytes and image header
+
+    The upload is rejected from its recorded size and its first
+    ``UPLOAD_HEAD_BYTES`` before the body is read, and the body is then read
+    in a single call so the returned bytes are the only copy.
 
-Specifically, you can understand checkboxes in photos. You can identify which options are checked or unchecked.
+    Raises:
+        UploadTooLargeError: if the upload is larger than ``max_bytes``
+        InvalidImageError: if the file type is not one of ``kinds``
+        ImageTooLargeError: if the image header declares too many pixels
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"Upload is {file.size} bytes, limit is {max_bytes}")
+    head = await file.read(UPLOAD_HEAD_BYTES)
+    check_upload_head(head, kinds)
+    if len(head) < UPLOAD_HEAD_BYTES:
+        return head
+    await file.seek(0)
+    data = await file.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise UploadTooLargeError(f"Upload exceeds the {max_bytes} byte limit")
+    return data
 
-IMPORTANT: Only analyze checkboxes that are actually visible in the image. Do not include any fields or options that are not present.
 
-Options may be True/False or multiple choice. For grouped options (like Gender, Race, etc.), use nested JSON structure.
+def _upload_error_content(error: ValueError) -> Dict[str, Any]:
+    """Response envelope for a rejected upload: 413 over the size or pixel limits, 400 for unsupported files"""
+    if isinstance(error, (UploadTooLargeError, ImageTooLargeError)):
+        return {
+            "status_code": 413,
+            "message": f"Upload is too large: {str(error)}",
+            "data": None
+        }
+    return {
+        "status_code": 400,
+        "message": f"Invalid image format: {str(error)}",
+        "data": None
+    }
+
+
+def _upload_error_response(error: ValueError) -> JSONResponse:
+    """413 for uploads over the size or pixel limits, 400 for unsupported files"""
+    content = _upload_error_content(error)
+    return JSONResponse(status_code=content["status_code"], content=content)
+
+
+async def _run_job(image_data: bytes) -> Dict[str, Any]:
+    """Job handler: analyze the image, waiting for pool capacity instead of failing"""
+    while True:
+        try:
+            return await _analyze_image(image_data)
+        except PoolSaturatedError:
+            await asyncio.sleep(0.5)
+
+
+# Background scheduler for POST /jobs
+job_scheduler = JobScheduler(create_job_store(), _run_job)
+
+
+def _saturated_response(error: Exception) -> JSONResponse:
+    """503 returned when the inference pool or the model servers cannot accept more work"""
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "1"},
+        content={
+            "status_code": 503,
+            "message": f"Server is busy, try again later: {str(error)}",
+            "data": None
+        }
+    )
+
 
-For example, if the image contains:
-- A simple checkbox for "Option A" that is checked
-- A simple checkbox for "Option B" that is unchecked  
-- A grouped set like "Gender" with "Male" unchecked and "Female" checked
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Track in-flight requests and request latency per route"""
+    http_in_flight.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        http_in_flight.dec()
+        route = request.scope.get("route")
+        http_requests.observe(
+            time.perf_counter() - started,
+            route=route.path if route is not None else "unmatched",
+            method=request.method,
+            status=status
+        )
 
-Your response should look like this:
-{
-    "Option A": "Checked",
-    "Option B": "Unchecked",
-    "Gender": {
-        "Male": "Unchecked",
-        "Female": "Checked"
+def _warm_up_model() -> None:
+    """Load the model into memory with a one-token answer about a tiny image"""
+    image_bytes_io = io.BytesIO()
+    Image.new("RGB", (32, 32), "white").save(image_bytes_io, format="PNG")
+    request = {
+        "model": MODEL_NAME,
+        "messages": [{"role": "user", "content": "Reply with OK.", "images": [image_bytes_io.getvalue()]}],
+        "options": {"num_predict": 1},
+        "keep_alive": KEEP_ALIVE
     }
-}
+    if isinstance(backend, BackendPool):
+        # Every server needs its own copy of the model loaded
+        backend.chat_each(**request)
+    else:
+        backend.chat(**request)
+
+
+async def _prepare_model() -> None:
+    """Pull the model only if it is missing, then warm it up; retries until it succeeds"""
+    while True:
+        try:
+            models = await run_in_threadpool(backend.list)
+            # The cascade's fast model is pulled too, but only the main model is warmed up
+            required = [MODEL_NAME] + ([CASCADE_FAST_MODEL] if "fast" in cascade_stages else [])
+            for model in required:
+                if not model_available(models, model):
+                    model_state["state"] = "pulling"
+                    await run_in_threadpool(backend.pull, model)
+                    model_state["pulled"] = True
+
+            model_state["state"] = "warming"
+            started = time.perf_counter()
+            await run_in_threadpool(_warm_up_model)
+            model_state["warmup_ms"] = _elapsed_ms(time.perf_counter() - started)
+            model_state.update(state="ready", error=None)
+            print(f"Model {MODEL_NAME} is ready (warm-up took {model_state['warmup_ms']} ms)")
+            return
+        except Exception as e:
+            model_state.update(state="failed", error=str(e))
+            print(f"Warning: Could not prepare model {MODEL_NAME}: {e}")
+            await asyncio.sleep(MODEL_PREPARE_RETRY)
 
-Use "Checked" for selected options and "Unchecked" for unselected options. For grouped options, create nested objects with the group name as the key.
 
-ONLY include checkboxes and options that are actually visible in the image. Do not add any fields that are not present. Don't add any text that doesn't appear in the image.
+# Background task started on startup
+model_preparation = None
 
-Analyze the attached image and provide your results. Be as brief and accurate as possible. Do not include any additional text or explanations.
-"""
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the model on startup"""
-    try:
-        # Pull the model if not already available
-        ollama.pull(MODEL_NAME)
-        print(f"Model {MODEL_NAME} is ready")
-    except Exception as e:
-        print(f"Warning: Could not pull model {MODEL_NAME}: {e}")
+    """Start preparing the model in the background and start the job workers"""
+    global model_preparation
+    # Startup finishes immediately; /ready reports when the model is loaded
+    model_preparation = asyncio.ensure_future(_prepare_model())
+
+    if isinstance(backend, BackendPool):
+        backend.start_health_checks(MODEL_NAME)
+    await job_scheduler.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop job workers, release the inference threads, cache storage and shared metrics and flush the result sink"""
+    if model_preparation is not None:
+        model_preparation.cancel()
+    await job_scheduler.stop()
+    if isinstance(backend, BackendPool):
+        backend.stop_health_checks()
+    await image_fetcher.close()
+    inference_pool.shutdown()
+    result_cache.close()
+    template_registry.close()
+    metrics.close()
+    if result_sink is not None:
+        # Writes what is still queued before the process exits
+        await run_in_threadpool(result_sink.close)
 
 @app.get("/")
 async def root():
@@ -91,8 +700,8 @@ async def health_check():
     """Detailed health check"""
     try:
         # Test if ollama is available
-        models = ollama.list()
-        model_available = any(model['name'].startswith(MODEL_NAME) for model in models['models'])
+        models = await run_in_threadpool(backend.list)
+        available = model_available(models, MODEL_NAME)
         
         return JSONResponse(
             status_code=200,
@@ -102,8 +711,16 @@ async def health_check():
                 "data": {
                     "status": "healthy",
                     "model": MODEL_NAME,
-                    "model_available": model_available,
-                    "ollama_running": True
+                    "model_available": available,
+                    "ollama_running": True,
+                    "inference_pool": inference_pool.stats(),
+                    "result_cache": result_cache.stats(),
+                    "in_flight_analyses": in_flight_analyses.stats(),
+                    "job_queue_depth": job_scheduler.queue_depth,
+                    "templates": template_registry.stats(),
+                    "url_fetcher": image_fetcher.stats(),
+                    "backends": backend.stats() if isinstance(backend, BackendPool) else None,
+                    "result_sink": result_sink.stats() if result_sink is not None else None
                 }
             }
         )
@@ -121,17 +738,49 @@ async def health_check():
             }
         )
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 only once the model is pulled and loaded"""
+    ready = model_state["state"] == "ready"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status_code": 200 if ready else 503,
+            "message": "Model is ready" if ready else f"Model is not ready: {model_state['state']}",
+            "data": {
+                "model": MODEL_NAME,
+                "keep_alive": KEEP_ALIVE,
+                **model_state
+            }
+        }
+    )
+
+@app.get("/metrics")
+async def get_metrics() -> PlainTextResponse:
+    """Prometheus metrics for request latency, pipeline stages, model usage and queues"""
+    # Rendering reads the other workers' samples when metrics are shared
+    text = await run_in_threadpool(metrics.render)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
 @app.post("/analyze-checkboxes")
-async def analyze_checkboxes(file: UploadFile = File(...)) -> JSONResponse:
+async def analyze_checkboxes(file: UploadFile = File(...), mode: str = "llm", labels: bool = False) -> JSONResponse:
     """
     Analyze checkboxes in an uploaded image
     
     Args:
         file: Image file (PNG, JPEG, etc.)
+        mode: ``llm`` (vision model), ``cv`` (classical detector),
+            ``hybrid`` (detector, falling back to the model when unsure),
+            ``tiled`` (vision model on overlapping page regions) or
+            ``cascade`` (detector, then a fast model, then the vision model,
+            stopping at the first confident answer)
+        labels: In hybrid and cascade mode, always use a model for labelled results
         
     Returns:
         JSONResponse with checkbox analysis results
     """
+    if mode not in ANALYSIS_MODES:
+        return _invalid_mode_response(mode)
     
     # Validate file type
     if not file.content_type.startswith('image/'):
@@ -144,88 +793,462 @@ async def analyze_checkboxes(file: UploadFile = File(...)) -> JSONResponse:
             }
         )
     
+    # Reject oversized and unsupported uploads before reading them in full
+    started = time.perf_counter()
     try:
-        # Read and process the image
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Get image info
-        image_info = {
-            "size": image.size,
-            "mode": image.mode,
-            "format": image.format
+        image_data = await _read_upload(file)
+    except (UploadTooLargeError, InvalidImageError) as e:
+        return _upload_error_response(e)
+    upload_read_ms = _elapsed_ms(time.perf_counter() - started)
+
+    try:
+        # Analyze the image off the event loop
+        analysis = await _analyze_image(image_data, mode, labels)
+        analysis["timings"]["upload_read_ms"] = upload_read_ms
+        _observe_timings({"upload_read_ms": upload_read_ms})
+        _persist_result(file.filename, analysis)
+
+        data = {
+            "image_info": analysis["image_info"],
+            "checkbox_analysis": analysis["checkbox_analysis"],
+            "filename": file.filename,
+            "cached": analysis["cached"],
+            "mode": analysis["mode"],
+            "timings": analysis["timings"]
         }
+        for key in ("template", "detections", "routing"):
+            if key in analysis:
+                data[key] = analysis[key]
         
-        # Convert image to bytes for ollama
-        image_bytes_io = io.BytesIO()
-        if image.format == 'PNG':
-            image.save(image_bytes_io, format='PNG')
-        else:
-            image.save(image_bytes_io, format='JPEG')
-        image_bytes = image_bytes_io.getvalue()
-        
-        # Send to model for analysis
-        response = ollama.chat(
-            model=MODEL_NAME,
-            messages=[
-                {
-                    "role": "user", 
-                    "content": DOCUMENT_VERIFIER_PROMPT, 
-                    "images": [image_bytes]
-                }
-            ]
+        return JSONResponse(
+            status_code=200,
+            headers={"Server-Timing": _server_timing(analysis["timings"])},
+            content={
+                "status_code": 200,
+                "message": "Image analysis completed successfully",
+                "data": data
+            }
         )
         
-        # Parse the response
-        analysis_result = response['message']['content']
-        
-        # Try to parse as JSON
+    except InvalidImageError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": f"Invalid image format: {str(e)}",
+                "data": None
+            }
+        )
+    except (PoolSaturatedError, NoBackendAvailableError) as e:
+        return _saturated_response(e)
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status_code": 500,
+                "message": f"Error processing image: {str(e)}",
+                "data": None
+            }
+        )
+
+def _expand_batch_upload(
+    filename: str, content_type: str, data: bytes, max_items: int = MAX_BATCH_ITEMS, max_bytes: int = MAX_BATCH_BYTES
+) -> List[Tuple[str, BatchPayload]]:
+    """
+    Turn one uploaded part into (filename, payload) items, unpacking zip archives
+
+    Zip entries over ``MAX_UPLOAD_BYTES`` get the error as their payload, so
+    they are reported on their own line without failing the batch. The
+    archive's directory is checked against ``max_items`` and ``max_bytes``
+    before any entry is decompressed.
+
+    Raises:
+        ValueError: if the archive holds more than ``max_items`` files
+        UploadTooLargeError: if the entries add up to more than ``max_bytes`` uncompressed
+        zipfile.BadZipFile: if the archive cannot be read
+    """
+    is_zip = content_type in ("application/zip", "application/x-zip-compressed") or filename.lower().endswith(".zip")
+    if not is_zip:
+        return [(filename, data)]
+
+    items = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        entries = [
+            entry for entry in sorted(archive.infolist(), key=lambda info: info.filename)
+            if not entry.is_dir() and not entry.filename.startswith("__MACOSX/")
+        ]
+        if len(entries) > max_items:
+            raise ValueError(f"Archive {filename} holds {len(entries)} images; at most {max_items} fit in the batch")
+        unpacked_bytes = sum(entry.file_size for entry in entries if entry.file_size <= MAX_UPLOAD_BYTES)
+        if unpacked_bytes > max_bytes:
+            raise UploadTooLargeError(f"Archive {filename} unpacks to {unpacked_bytes} bytes; at most {max_bytes} fit in the batch")
+        for entry in entries:
+            if entry.file_size > MAX_UPLOAD_BYTES:
+                items.append((entry.filename, UploadTooLargeError(
+                    f"{entry.filename} is {entry.file_size} bytes uncompressed, limit is {MAX_UPLOAD_BYTES}"
+                )))
+                continue
+            items.append((entry.filename, archive.read(entry)))
+    return items
+
+
+async def _analyze_batch_item(
+    index: int, filename: str, image_data: BatchPayload, slots: asyncio.Semaphore, mode: str = "llm"
+) -> Dict[str, Any]:
+    """Analyze one batch item, turning failures into a per-item error record"""
+    if isinstance(image_data, ValueError):
+        # Rejected when the upload was read
+        return {"index": index, "filename": filename, **_upload_error_content(image_data)}
+    async with slots:
         try:
-            # Clean up the response if it has markdown code blocks
-            if analysis_result.startswith('```json'):
-                analysis_result = analysis_result.strip('```json').strip('```').strip()
-            elif analysis_result.startswith('```'):
-                analysis_result = analysis_result.strip('```').strip()
-            
-            parsed_result = json.loads(analysis_result)
-        except json.JSONDecodeError:
-            # If JSON parsing fails, return raw response
-            parsed_result = {"raw_response": analysis_result}
+            analysis = await _analyze_image(image_data, mode)
+        except InvalidImageError as e:
+            return {
+                "index": index,
+                "filename": filename,
+                "status_code": 400,
+                "message": f"Invalid image format: {str(e)}",
+                "data": None
+            }
+        except (PoolSaturatedError, NoBackendAvailableError) as e:
+            return {
+                "index": index,
+                "filename": filename,
+                "status_code": 503,
+                "message": f"Server is busy, try again later: {str(e)}",
+                "data": None
+            }
+        except Exception as e:
+            return {
+                "index": index,
+                "filename": filename,
+                "status_code": 500,
+                "message": f"Error processing image: {str(e)}",
+                "data": None
+            }
+
+    _persist_result(filename, analysis)
+    return {
+        "index": index,
+        "filename": filename,
+        "status_code": 200,
+        "message": "Image analysis completed successfully",
+        "data": analysis
+    }
+
+
+@app.post("/analyze-checkboxes/stream")
+async def analyze_checkboxes_stream(file: UploadFile = File(...)):
+    """
+    Analyze checkboxes in an uploaded image, streaming results as they are generated
+    
+    Args:
+        file: Image file (PNG, JPEG, etc.)
         
+    Returns:
+        NDJSON stream of events: ``token`` for each generated chunk, ``field``
+        for each top-level checkbox or group as soon as it is complete, then a
+        final ``done`` (with the full result) or ``error`` event.
+    """
+    if not file.content_type.startswith('image/'):
         return JSONResponse(
-            status_code=200,
+            status_code=400,
             content={
-                "status_code": 200,
-                "message": "Image analysis completed successfully",
+                "status_code": 400,
+                "message": "File must be an image",
+                "data": None
+            }
+        )
+    if not inference_pool.has_capacity():
+        return _saturated_response(PoolSaturatedError("Inference queue is full"))
+
+    try:
+        image_data = await _read_upload(file)
+    except (UploadTooLargeError, InvalidImageError) as e:
+        return _upload_error_response(e)
+    filename = file.filename
+
+    async def stream_events():
+        cache_key = _cache_key(image_data, ANALYSIS_PROMPT)
+        try:
+            cached_result = await run_in_threadpool(result_cache.get, cache_key)
+            if cached_result is not None:
+                for key, value in cached_result["checkbox_analysis"].items():
+                    yield json.dumps({"event": "field", "key": key, "value": value}) + "\n"
+                yield json.dumps({
+                    "event": "done",
+                    "data": {
+                        "image_info": cached_result["image_info"],
+                        "checkbox_analysis": cached_result["checkbox_analysis"],
+                        "filename": filename,
+                        "cached": True
+                    }
+                }) + "\n"
+                return
+
+            image_bytes, image_info = await run_in_threadpool(preprocess_image, image_data, preprocess_config)
+
+            # Chunks are produced on a pool thread and handed to the event loop
+            loop = asyncio.get_running_loop()
+            chunks: asyncio.Queue = asyncio.Queue()
+            cancelled = threading.Event()
+            inference = asyncio.ensure_future(inference_pool.run(
+                _stream_model, image_bytes,
+                lambda chunk: loop.call_soon_threadsafe(chunks.put_nowait, chunk),
+                cancelled
+            ))
+            inference.add_done_callback(lambda _: chunks.put_nowait(None))
+
+            parser = IncrementalJSONParser()
+            try:
+                while True:
+                    chunk = await chunks.get()
+                    if chunk is None:
+                        break
+                    yield json.dumps({"event": "token", "content": chunk}) + "\n"
+                    for key, value in parser.feed(chunk):
+                        yield json.dumps({"event": "field", "key": key, "value": value}) + "\n"
+                analysis_result = await inference
+            finally:
+                # Stops the worker thread between chunks if the client went away
+                cancelled.set()
+                inference.cancel()
+
+            parsed_result = _parse_analysis(analysis_result)
+            if "raw_response" not in parsed_result:
+                await run_in_threadpool(result_cache.set, cache_key, {
+                    "image_info": image_info,
+                    "checkbox_analysis": parsed_result
+                })
+            yield json.dumps({
+                "event": "done",
                 "data": {
                     "image_info": image_info,
                     "checkbox_analysis": parsed_result,
-                    "filename": file.filename
+                    "filename": filename,
+                    "cached": False
                 }
+            }) + "\n"
+        except InvalidImageError as e:
+            yield json.dumps({"event": "error", "status_code": 400, "message": f"Invalid image format: {str(e)}"}) + "\n"
+        except (PoolSaturatedError, NoBackendAvailableError) as e:
+            yield json.dumps({"event": "error", "status_code": 503, "message": f"Server is busy, try again later: {str(e)}"}) + "\n"
+        except Exception as e:
+            yield json.dumps({"event": "error", "status_code": 500, "message": f"Error processing image: {str(e)}"}) + "\n"
+
+    return StreamingResponse(stream_events(), media_type="application/x-ndjson")
+
+@app.post("/analyze-checkboxes/batch")
+async def analyze_checkboxes_batch(files: List[UploadFile] = File(...), mode: str = "llm"):
+    """
+    Analyze checkboxes in many images, streaming results as they finish
+    
+    Args:
+        files: Image files and/or zip archives of images
+        mode: ``llm``, ``cv``, ``hybrid``, ``tiled`` or ``cascade``, as for /analyze-checkboxes
+        
+    Returns:
+        NDJSON stream with one line per image, in completion order. Each line
+        carries the item's ``index`` in upload order so clients can reorder.
+    """
+    if mode not in ANALYSIS_MODES:
+        return _invalid_mode_response(mode)
+
+    items: List[Tuple[str, BatchPayload]] = []
+    batch_bytes = 0
+    try:
+        for upload in files:
+            # Stop before reading (or unzipping) anything past the limits
+            if len(items) >= MAX_BATCH_ITEMS:
+                raise ValueError(f"Batch is limited to {MAX_BATCH_ITEMS} images")
+            try:
+                data = await _read_upload(upload, IMAGE_KINDS | {"zip"})
+            except (UploadTooLargeError, InvalidImageError) as e:
+                # Reported as this item's line; the rest of the batch still runs
+                items.append((upload.filename or "", e))
+                continue
+            expanded = _expand_batch_upload(
+                upload.filename or "", upload.content_type or "", data,
+                MAX_BATCH_ITEMS - len(items), MAX_BATCH_BYTES - batch_bytes
+            )
+            batch_bytes += sum(len(payload) for _, payload in expanded if isinstance(payload, bytes))
+            if batch_bytes > MAX_BATCH_BYTES:
+                raise UploadTooLargeError(f"Batch is limited to {MAX_BATCH_BYTES} bytes of images")
+            items.extend(expanded)
+    except UploadTooLargeError as e:
+        return _upload_error_response(e)
+    except zipfile.BadZipFile as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": f"Invalid zip archive: {str(e)}",
+                "data": None
             }
         )
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": str(e),
+                "data": None
+            }
+        )
+
+    if not items:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": "No images found in upload",
+                "data": None
+            }
+        )
+
+    async def stream_results():
+        # Keep at most one batch item per inference worker in flight so a large
+        # batch queues here instead of overflowing the shared pool
+        slots = asyncio.Semaphore(inference_pool.max_concurrency)
+        tasks = [
+            asyncio.ensure_future(_analyze_batch_item(index, filename, data, slots, mode))
+            for index, (filename, data) in enumerate(items)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/analyze-document")
+async def analyze_document(file: UploadFile = File(...), mode: str = "llm", skip_blank: bool = True):
+    """
+    Analyze every page of a multi-page PDF or TIFF, streaming results per page
+    
+    Args:
+        file: PDF, TIFF or single image
+        mode: ``llm``, ``cv``, ``hybrid``, ``tiled`` or ``cascade``, as for /analyze-checkboxes
+        skip_blank: Report blank pages without analysing them
         
-    except Exception as e:
+    Returns:
+        NDJSON stream with one line per page, in completion order. Pages are
+        decoded one at a time as inference slots free up, so only a few are
+        held in memory at once.
+    """
+    if mode not in ANALYSIS_MODES:
+        return _invalid_mode_response(mode)
+
+    try:
+        data = await _read_upload(file, IMAGE_KINDS | {"pdf"})
+    except (UploadTooLargeError, InvalidImageError) as e:
+        return _upload_error_response(e)
+    if document_kind(data) == "pdf" and not PDF_SUPPORT:
         return JSONResponse(
-            status_code=500,
+            status_code=501,
             content={
-                "status_code": 500,
-                "message": f"Error processing image: {str(e)}",
+                "status_code": 501,
+                "message": "PDF input is not available: install pypdfium2",
                 "data": None
             }
         )
+    filename = file.filename or ""
+
+    # Decode the first page up front so an unreadable upload gets a plain 400
+    pages = iter_pages(data, blank_threshold=BLANK_PAGE_STDDEV if skip_blank else None)
+    try:
+        first_page = await run_in_threadpool(next, pages, None)
+    except (DocumentError, InvalidImageError) as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": f"Invalid document: {str(e)}",
+                "data": None
+            }
+        )
+
+    async def stream_pages():
+        # Inference slots, plus a window on decoded pages so rendering stays
+        # just ahead of inference instead of decoding the whole document
+        slots = asyncio.Semaphore(inference_pool.max_concurrency)
+        window = asyncio.Semaphore(inference_pool.max_concurrency * 2)
+        remaining = itertools.chain([first_page], pages)
+        tasks = set()
+
+        async def analyze_page(page: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                result = await _analyze_batch_item(
+                    page["page"] - 1, f"{filename}#page={page['page']}", page.pop("image_bytes"), slots, mode
+                )
+            finally:
+                window.release()
+            return {"page": page["page"], **result}
+
+        try:
+            while True:
+                await window.acquire()
+                try:
+                    page = await run_in_threadpool(next, remaining, None)
+                except (DocumentError, InvalidImageError) as e:
+                    window.release()
+                    yield json.dumps({
+                        "page": None,
+                        "status_code": 400,
+                        "message": f"Invalid document: {str(e)}",
+                        "data": None
+                    }) + "\n"
+                    break
+                if page is None:
+                    window.release()
+                    break
+                if page["blank"]:
+                    window.release()
+                    blank_pages.inc()
+                    yield json.dumps({
+                        "page": page["page"],
+                        "status_code": 200,
+                        "message": "Blank page skipped",
+                        "data": {"blank": True, "size": page["size"]}
+                    }) + "\n"
+                    continue
+                tasks.add(asyncio.ensure_future(analyze_page(page)))
+
+                for task in [task for task in tasks if task.done()]:
+                    tasks.discard(task)
+                    yield json.dumps(await task) + "\n"
+
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            try:
+                pages.close()
+            except ValueError:
+                # Still decoding a page on a pool thread; it is dropped when done
+                pass
+
+    return StreamingResponse(stream_pages(), media_type="application/x-ndjson")
 
 @app.post("/analyze-checkboxes-url")
-async def analyze_checkboxes_from_url(image_url: str) -> JSONResponse:
+async def analyze_checkboxes_from_url(image_url: str, mode: str = "llm", labels: bool = False) -> JSONResponse:
     """
     Analyze checkboxes from an image URL
     
     Args:
         image_url: URL of the image to analyze
+        mode: ``llm``, ``cv``, ``hybrid``, ``tiled`` or ``cascade``, as for /analyze-checkboxes
+        labels: In hybrid and cascade mode, always use a model for labelled results
         
     Returns:
         JSONResponse with checkbox analysis results
     """
+    if mode not in ANALYSIS_MODES:
+        return _invalid_mode_response(mode)
+
     try:
         if not image_url:
             return JSONResponse(
@@ -238,10 +1261,19 @@ async def analyze_checkboxes_from_url(image_url: str) -> JSONResponse:
             )
         
         # Download image from URL
+        started = time.perf_counter()
         try:
-            response = requests.get(image_url)
-            response.raise_for_status()
-        except requests.RequestException as e:
+            image_data = await image_fetcher.fetch(image_url)
+        except FetchTooLargeError as e:
+            return JSONResponse(
+                status_code=413,
+                content={
+                    "status_code": 413,
+                    "message": f"Image at URL is too large: {str(e)}",
+                    "data": None
+                }
+            )
+        except FetchError as e:
             return JSONResponse(
                 status_code=400,
                 content={
@@ -251,10 +1283,12 @@ async def analyze_checkboxes_from_url(image_url: str) -> JSONResponse:
                 }
             )
         
+        download_ms = _elapsed_ms(time.perf_counter() - started)
+        
         # Process the image
         try:
-            image = Image.open(io.BytesIO(response.content))
-        except Exception as e:
+            analysis = await _analyze_image(image_data, mode, labels)
+        except InvalidImageError as e:
             return JSONResponse(
                 status_code=400,
                 content={
@@ -263,63 +1297,23 @@ async def analyze_checkboxes_from_url(image_url: str) -> JSONResponse:
                     "data": None
                 }
             )
-        
-        # Get image info
-        image_info = {
-            "size": image.size,
-            "mode": image.mode,
-            "format": image.format,
-            "url": image_url
-        }
-        
-        # Convert image to bytes for ollama
-        image_bytes_io = io.BytesIO()
-        if image.format == 'PNG':
-            image.save(image_bytes_io, format='PNG')
-        else:
-            image.save(image_bytes_io, format='JPEG')
-        image_bytes = image_bytes_io.getvalue()
-        
-        # Send to model for analysis
-        ollama_response = ollama.chat(
-            model=MODEL_NAME,
-            messages=[
-                {
-                    "role": "user", 
-                    "content": DOCUMENT_VERIFIER_PROMPT, 
-                    "images": [image_bytes]
-                }
-            ]
-        )
-        
-        # Parse the response
-        analysis_result = ollama_response['message']['content']
-        
-        # Try to parse as JSON
-        try:
-            # Clean up the response if it has markdown code blocks
-            if analysis_result.startswith('```json'):
-                analysis_result = analysis_result.strip('```json').strip('```').strip()
-            elif analysis_result.startswith('```'):
-                analysis_result = analysis_result.strip('```').strip()
-            
-            parsed_result = json.loads(analysis_result)
-        except json.JSONDecodeError:
-            # If JSON parsing fails, return raw response
-            parsed_result = {"raw_response": analysis_result}
+        analysis["image_info"]["url"] = image_url
+        analysis["timings"]["download_ms"] = download_ms
+        _observe_timings({"download_ms": download_ms})
+        _persist_result(image_url, analysis)
         
         return JSONResponse(
             status_code=200,
+            headers={"Server-Timing": _server_timing(analysis["timings"])},
             content={
                 "status_code": 200,
                 "message": "Image analysis completed successfully",
-                "data": {
-                    "image_info": image_info,
-                    "checkbox_analysis": parsed_result
-                }
+                "data": analysis
             }
         )
         
+    except (PoolSaturatedError, NoBackendAvailableError) as e:
+        return _saturated_response(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -330,6 +1324,204 @@ async def analyze_checkboxes_from_url(image_url: str) -> JSONResponse:
             }
         )
 
+@app.post("/jobs")
+async def submit_job(file: UploadFile = File(...)) -> JSONResponse:
+    """
+    Queue an image for background checkbox analysis
+    
+    Args:
+        file: Image file (PNG, JPEG, etc.)
+        
+    Returns:
+        JSONResponse (202) with the job id to poll at /jobs/{job_id}
+    """
+    if not file.content_type.startswith('image/'):
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": "File must be an image",
+                "data": None
+            }
+        )
+
+    try:
+        image_data = await _read_upload(file)
+        job = await job_scheduler.submit(file.filename, image_data)
+    except (UploadTooLargeError, InvalidImageError) as e:
+        return _upload_error_response(e)
+    except JobQueueFullError as e:
+        return JSONResponse(
+            status_code=503,
+            headers={"Retry-After": "5"},
+            content={
+                "status_code": 503,
+                "message": f"Server is busy, try again later: {str(e)}",
+                "data": None
+            }
+        )
+
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status_code": 202,
+            "message": "Job accepted",
+            "data": {
+                "job_id": job["job_id"],
+                "status": job["status"],
+                "status_url": f"/jobs/{job['job_id']}"
+            }
+        }
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> JSONResponse:
+    """
+    Get the status, timings and result of a background job
+    
+    Args:
+        job_id: Id returned by POST /jobs
+        
+    Returns:
+        JSONResponse with the job record
+    """
+    job = await job_scheduler.get(job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "status_code": 404,
+                "message": "Job not found",
+                "data": None
+            }
+        )
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status_code": 200,
+            "message": f"Job {job['status']}",
+            "data": job
+        }
+    )
+
+@app.post("/templates")
+async def register_template(
+    file: UploadFile = File(...),
+    name: str = Form(""),
+    fields: Optional[str] = Form(None)
+) -> JSONResponse:
+    """
+    Register a blank form layout so matching pages skip the model
+    
+    Args:
+        file: Image of the blank form
+        name: Template name
+        fields: Optional JSON object in the model's result format naming the
+            form's checkboxes (values are ignored); when omitted the model
+            analyzes the form once to provide the labels
+        
+    Returns:
+        JSONResponse (201) with the registered template
+    """
+    if not file.content_type.startswith('image/'):
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": "File must be an image",
+                "data": None
+            }
+        )
+
+    try:
+        image_data = await _read_upload(file)
+    except (UploadTooLargeError, InvalidImageError) as e:
+        return _upload_error_response(e)
+    try:
+        await run_in_threadpool(describe_image, image_data)
+        if fields is not None:
+            structure = json.loads(fields)
+            if not isinstance(structure, dict):
+                raise ValueError("fields must be a JSON object")
+        else:
+            image_bytes, _ = await run_in_threadpool(preprocess_image, image_data, preprocess_config)
+            response = await inference_pool.run(_run_model, image_bytes)
+            structure = _parse_analysis(response['message']['content'])
+            if "raw_response" in structure:
+                return JSONResponse(
+                    status_code=422,
+                    content={
+                        "status_code": 422,
+                        "message": "Could not read the form's labels from the model output; pass fields explicitly",
+                        "data": {"raw_response": structure["raw_response"]}
+                    }
+                )
+        template = await run_in_threadpool(template_registry.register, image_data, structure, name or file.filename)
+    except InvalidImageError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": f"Invalid image format: {str(e)}",
+                "data": None
+            }
+        )
+    except (TemplateMismatchError, ValueError) as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "status_code": 400,
+                "message": f"Could not register template: {str(e)}",
+                "data": None
+            }
+        )
+    except (PoolSaturatedError, NoBackendAvailableError) as e:
+        return _saturated_response(e)
+
+    return JSONResponse(
+        status_code=201,
+        content={
+            "status_code": 201,
+            "message": "Template registered",
+            "data": template
+        }
+    )
+
+@app.get("/templates")
+async def list_templates() -> JSONResponse:
+    """List registered form templates"""
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status_code": 200,
+            "message": "Templates retrieved",
+            "data": template_registry.list()
+        }
+    )
+
+@app.delete("/templates/{template_id}")
+async def delete_template(template_id: str) -> JSONResponse:
+    """Remove a registered form template"""
+    if not await run_in_threadpool(template_registry.delete, template_id):
+        return JSONResponse(
+            status_code=404,
+            content={
+                "status_code": 404,
+                "message": "Template not found",
+                "data": None
+            }
+        )
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "status_code": 200,
+            "message": "Template deleted",
+            "data": {"template_id": template_id}
+        }
+    )
+
 if __name__ == "__main__":
     
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,398 @@
+"""
+Inference backends used by the API.
+
+``OllamaBackend`` talks to an Ollama server. ``FakeBackend`` imitates the
+Ollama chat API with a fixed delay and canned answer so the API, the load
+tests and benchmarks can run on machines without a model. The backend the API
+uses is chosen with ``OLLAMA_BACKEND`` (``ollama`` or ``fake``).
+
+``BackendPool`` spreads calls over several backends (``OLLAMA_HOSTS``). It
+routes each call to the healthy node with the fewest outstanding requests,
+caps the requests in flight per node, and retries a failed call on another
+node. A node is marked down after repeated failures (passive checks) or a
+failed model listing (active checks) and is probed again after a cool-down.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Union
+
+import ollama
+
+# Backend configuration
+OLLAMA_BACKEND = os.getenv("OLLAMA_BACKEND", "ollama")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "")
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS", "")
+FAKE_OLLAMA_DELAY = float(os.getenv("FAKE_OLLAMA_DELAY", "1.0"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Backend pool configuration
+BACKEND_MAX_CONCURRENCY = int(os.getenv("BACKEND_MAX_CONCURRENCY", "2"))
+BACKEND_FAILURE_THRESHOLD = int(os.getenv("BACKEND_FAILURE_THRESHOLD", "3"))
+BACKEND_RETRY_AFTER = float(os.getenv("BACKEND_RETRY_AFTER", "10"))
+BACKEND_HEALTH_INTERVAL = float(os.getenv("BACKEND_HEALTH_INTERVAL", "15"))
+
+# Answer returned by FakeBackend unless another one is given
+FAKE_RESPONSE = {
+    "Option A": "Checked",
+    "Option B": "Unchecked",
+    "Gender": {
+        "Male": "Unchecked",
+        "Female": "Checked"
+    }
+}
+
+
+class OllamaBackend:
+    """Backend that forwards calls to an Ollama server"""
+
+    def __init__(self, host: Optional[str] = None):
+        self.host = host or None
+        self.client = ollama.Client(host=self.host)
+
+    def chat(self, **kwargs) -> Union[Mapping[str, Any], Iterator[Mapping[str, Any]]]:
+        return self.client.chat(**kwargs)
+
+    def list(self) -> Mapping[str, Any]:
+        return self.client.list()
+
+    def pull(self, model: str) -> Mapping[str, Any]:
+        return self.client.pull(model)
+
+
+class FakeBackend:
+    """Stand-in for Ollama that answers after a configurable delay"""
+
+    def __init__(self, delay: float = FAKE_OLLAMA_DELAY, response: Optional[Dict[str, Any]] = None, model: str = ""):
+        self.delay = delay
+        self.content = json.dumps(response if response is not None else FAKE_RESPONSE, indent=2)
+        self.model = model
+        self.calls = 0
+
+    def _stats(self, elapsed: float) -> Dict[str, Any]:
+        # Mirror the timing fields Ollama reports (durations in nanoseconds)
+        eval_count = max(1, len(self.content) // 4)
+        return {
+            "done": True,
+            "total_duration": int(elapsed * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": 600,
+            "prompt_eval_duration": int(elapsed * 0.2 * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(elapsed * 0.8 * 1e9)
+        }
+
+    def chat(self, model: str = "", messages=None, stream: bool = False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self._stream(model)
+        started = time.perf_counter()
+        time.sleep(self.delay)
+        response = {"model": model, "message": {"role": "assistant", "content": self.content}}
+        response.update(self._stats(time.perf_counter() - started))
+        return response
+
+    def _stream(self, model: str) -> Iterator[Dict[str, Any]]:
+        started = time.perf_counter()
+        pieces = [self.content[i:i + 8] for i in range(0, len(self.content), 8)]
+        for piece in pieces:
+            time.sleep(self.delay / len(pieces))
+            yield {"model": model, "message": {"role": "assistant", "content": piece}, "done": False}
+        final = {"model": model, "message": {"role": "assistant", "content": ""}}
+        final.update(self._stats(time.perf_counter() - started))
+        yield final
+
+    def list(self) -> Dict[str, Any]:
+        return {"models": [{"name": self.model or "fake"}]}
+
+    def pull(self, model: str) -> Dict[str, Any]:
+        return {"status": "success"}
+
+
+def parse_keep_alive(value: str) -> Union[float, str]:
+    """
+    Turn an ``OLLAMA_KEEP_ALIVE`` value into what Ollama expects
+
+    Durations such as ``30m`` are passed through; bare numbers are seconds,
+    and a negative number keeps the model loaded indefinitely.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def model_available(listing: Mapping[str, Any], model: str) -> bool:
+    """Whether a model listing (``backend.list()``) includes ``model``"""
+    return any(entry['name'].startswith(model) for entry in listing['models'])
+
+
+class NoBackendAvailableError(Exception):
+    """Raised when every backend in a pool is down or has failed the call"""
+
+
+def _retryable(error: Exception) -> bool:
+    """Whether a failed call may succeed on another node"""
+    if isinstance(error, ollama.ResponseError):
+        # Server errors and a model missing on that node are node problems;
+        # other client errors would fail everywhere
+        return error.status_code >= 500 or error.status_code in (-1, 404)
+    return True
+
+
+class _Node:
+    def __init__(self, name: str, backend):
+        self.name = name
+        self.backend = backend
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.down_until = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.last_error = ""
+
+
+class BackendPool:
+    """Load-balancing, health-aware router over several backends"""
+
+    def __init__(
+        self,
+        backends: Mapping[str, Any],
+        max_concurrency: int = BACKEND_MAX_CONCURRENCY,
+        failure_threshold: int = BACKEND_FAILURE_THRESHOLD,
+        retry_after: float = BACKEND_RETRY_AFTER,
+        health_interval: float = BACKEND_HEALTH_INTERVAL
+    ):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.retry_after = retry_after
+        self.health_interval = health_interval
+        self._nodes = [_Node(name, backend) for name, backend in backends.items()]
+        self._changed = threading.Condition()
+        self._health_thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.retries = 0
+
+    def _available(self, node: _Node, now: float) -> bool:
+        # Down nodes get one trial request again after the cool-down
+        return node.healthy or now >= node.down_until
+
+    def _acquire(self, exclude: Sequence[_Node]) -> _Node:
+        """Reserve the usable node with the fewest outstanding requests, waiting for a free slot"""
+        with self._changed:
+            while True:
+                now = time.monotonic()
+                usable = [
+                    node for node in self._nodes
+                    if node not in exclude and self._available(node, now)
+                ]
+                if not usable:
+                    raise NoBackendAvailableError("No healthy inference backend is available")
+                free = [node for node in usable if node.outstanding < self.max_concurrency]
+                if free:
+                    node = min(free, key=lambda node: (node.outstanding, node.calls))
+                    node.outstanding += 1
+                    node.calls += 1
+                    if not node.healthy:
+                        # Hold the half-open node back until the trial finishes
+                        node.down_until = now + self.retry_after
+                    return node
+                self._changed.wait(timeout=1.0)
+
+    def _release(self, node: _Node, error: Optional[Exception] = None) -> None:
+        with self._changed:
+            node.outstanding -= 1
+            if error is None:
+                node.failures = 0
+                node.healthy = True
+            elif _retryable(error):
+                node.errors += 1
+                node.failures += 1
+                node.last_error = str(error)
+                if node.failures >= self.failure_threshold or not node.healthy:
+                    self._mark_down(node)
+            self._changed.notify_all()
+
+    def _mark_down(self, node: _Node) -> None:
+        node.healthy = False
+        node.down_until = time.monotonic() + self.retry_after
+
+    def _acquire_next(self, tried: List[_Node]) -> _Node:
+        """Reserve a node that has not been tried for this call yet"""
+        try:
+            node = self._acquire(tried)
+        except NoBackendAvailableError:
+            if tried:
+                raise NoBackendAvailableError(
+                    f"All inference backends failed, last error: {tried[-1].last_error}"
+                ) from None
+            raise
+        tried.append(node)
+        return node
+
+    def chat(self, **kwargs):
+        if kwargs.get("stream"):
+            return self._stream(**kwargs)
+        tried: List[_Node] = []
+        while True:
+            node = self._acquire_next(tried)
+            try:
+                response = node.backend.chat(**kwargs)
+            except Exception as e:
+                self._release(node, e)
+                if not _retryable(e):
+                    raise
+                self.retries += 1
+                continue
+            self._release(node)
+            return response
+
+    def _stream(self, **kwargs) -> Iterator[Mapping[str, Any]]:
+        tried: List[_Node] = []
+        while True:
+            node = self._acquire_next(tried)
+            try:
+                parts = iter(node.backend.chat(**kwargs))
+                # Ollama sends the request lazily; a node that fails before the
+                # first chunk can still be swapped for another one
+                first = next(parts)
+            except StopIteration:
+                self._release(node)
+                return
+            except Exception as e:
+                self._release(node, e)
+                if not _retryable(e):
+                    raise
+                self.retries += 1
+                continue
+            break
+
+        error = None
+        try:
+            yield first
+            yield from parts
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(node, error)
+
+    def list(self) -> Dict[str, Any]:
+        """Models available on any reachable node"""
+        models: Dict[str, Any] = {}
+        errors = []
+        for node in self._nodes:
+            try:
+                for entry in node.backend.list()['models']:
+                    models.setdefault(entry['name'], entry)
+            except Exception as e:
+                errors.append(f"{node.name}: {e}")
+        if errors and not models:
+            raise NoBackendAvailableError("; ".join(errors))
+        return {"models": list(models.values())}
+
+    def chat_each(self, **kwargs) -> Dict[str, Optional[str]]:
+        """Send the same chat call to every node, e.g. to load the model everywhere; returns errors by node"""
+        errors: Dict[str, Optional[str]] = {}
+        for node in self._nodes:
+            try:
+                node.backend.chat(**kwargs)
+                errors[node.name] = None
+            except Exception as e:
+                errors[node.name] = str(e)
+        if all(errors.values()):
+            raise NoBackendAvailableError("; ".join(f"{name}: {error}" for name, error in errors.items()))
+        return errors
+
+    def pull(self, model: str) -> Dict[str, Any]:
+        """Pull ``model`` on every node"""
+        errors = []
+        for node in self._nodes:
+            try:
+                node.backend.pull(model)
+            except Exception as e:
+                errors.append(f"{node.name}: {e}")
+        if len(errors) == len(self._nodes):
+            raise NoBackendAvailableError("; ".join(errors))
+        return {"status": "success", "errors": errors}
+
+    def check_health(self, model: str = "") -> Dict[str, Any]:
+        """
+        Actively check every node the way ``/health`` checks a single server
+
+        A node is healthy if it answers a model listing and, when ``model``
+        is given, has that model.
+        """
+        for node in self._nodes:
+            try:
+                listing = node.backend.list()
+                healthy = not model or model_available(listing, model)
+                error = "" if healthy else f"model {model} not available"
+            except Exception as e:
+                healthy, error = False, str(e)
+            with self._changed:
+                if healthy:
+                    node.healthy = True
+                    node.failures = 0
+                elif node.healthy or time.monotonic() >= node.down_until:
+                    node.last_error = error
+                    self._mark_down(node)
+                self._changed.notify_all()
+        return self.stats()
+
+    def start_health_checks(self, model: str = "") -> None:
+        """Check node health every ``health_interval`` seconds in a background thread"""
+        if self._health_thread is not None or self.health_interval <= 0:
+            return
+        self._stopping.clear()
+
+        def run():
+            while not self._stopping.wait(self.health_interval):
+                self.check_health(model)
+
+        self._health_thread = threading.Thread(target=run, name="backend-health", daemon=True)
+        self._health_thread.start()
+
+    def stop_health_checks(self) -> None:
+        self._stopping.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=5)
+            self._health_thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-node routing and health state"""
+        with self._changed:
+            return {
+                "retries": self.retries,
+                "nodes": [
+                    {
+                        "name": node.name,
+                        "healthy": node.healthy,
+                        "outstanding": node.outstanding,
+                        "calls": node.calls,
+                        "errors": node.errors,
+                        "last_error": node.last_error
+                    }
+                    for node in self._nodes
+                ]
+            }
+
+
+def create_backend(kind: str = OLLAMA_BACKEND, model: str = "", hosts: str = OLLAMA_HOSTS):
+    """
+    Build the backend selected by ``OLLAMA_BACKEND``
+
+    A comma-separated ``hosts`` list (``OLLAMA_HOSTS``) builds a
+    ``BackendPool`` of Ollama servers instead of a single one.
+    """
+    if kind == "fake":
+        return FakeBackend(model=model)
+    names = [host.strip() for host in hosts.split(",") if host.strip()]
+    if names:
+        return BackendPool({host: OllamaBackend(host) for host in names})
+    return OllamaBackend(OLLAMA_HOST)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Offline evaluation of the model cascade.
+
+Runs every labelled synthetic form through the vision model alone (``llm``
+mode) and through the cascade (``cascade`` mode) and reports how much latency
+the cascade saves and how much accuracy it gives up. A share of the forms get
+a stray pen mark inside an unticked box, which makes the CV detector unsure
+and forces escalation.
+
+Both models are stubbed: ``LabelledBackend`` answers with the form's true
+result after a per-model delay, flipping each field with a per-model error
+rate, so the evaluation runs anywhere and is reproducible. CV answers carry
+box ids rather than labels; they are scored by comparing states in reading
+order, which is the order the synthetic forms list their fields in.
+
+Usage:
+    python benchmarks/cascade_eval.py --forms 20 --degraded 0.3 --output cascade.json
+"""
+
+import argparse
+import asyncio
+import copy
+import io
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+# Make the top-level modules importable when run from the benchmarks folder
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backends import FakeBackend  # noqa: E402
+from cv_detector import detect_checkboxes  # noqa: E402
+from forms import generate_form  # noqa: E402
+from preprocess_benchmark import agreement, flatten  # noqa: E402
+
+FAST_MODEL = "fast-stub"
+
+
+class LabelledBackend(FakeBackend):
+    """FakeBackend answering with the current form's true result, per-model delay and error rate"""
+
+    def __init__(self, delays, error_rates, seed: int = 0):
+        super().__init__(delay=0)
+        self.delays = delays
+        self.error_rates = error_rates
+        self.rng = random.Random(seed)
+        self.expected = {}
+        self.calls_by_model = {}
+
+    def _answer(self, model: str):
+        answer = copy.deepcopy(self.expected)
+        rate = self.error_rates.get(model, 0.0)
+        for group in [answer] + [value for value in answer.values() if isinstance(value, dict)]:
+            for key, value in group.items():
+                if not isinstance(value, dict) and self.rng.random() < rate:
+                    group[key] = "Unchecked" if value == "Checked" else "Checked"
+        return answer
+
+    def chat(self, model: str = "", messages=None, stream: bool = False, **kwargs):
+        self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+        # Calls are sequential in this evaluation, so per-call state is safe
+        self.delay = self.delays.get(model, 0.0)
+        self.content = json.dumps(self._answer(model))
+        return super().chat(model, messages, stream, **kwargs)
+
+
+def add_stray_mark(image_bytes: bytes, seed: int) -> bytes:
+    """Draw a short stroke inside one unticked box, like a pen resting on the page"""
+    rng = random.Random(seed)
+    empty = [box for box in detect_checkboxes(image_bytes)["boxes"] if box["state"] == "Unchecked"]
+    if not empty:
+        return image_bytes
+    x0, y0, x1, y1 = rng.choice(empty)["bbox"]
+    image = Image.open(io.BytesIO(image_bytes))
+    draw = ImageDraw.Draw(image)
+    middle = (y0 + y1) // 2
+    draw.line([x0 + (x1 - x0) // 4, middle, x0 + (x1 - x0) // 2, middle + 2], fill=0, width=3)
+    image_bytes_io = io.BytesIO()
+    image.save(image_bytes_io, format="PNG")
+    return image_bytes_io.getvalue()
+
+
+def accuracy(expected, result, by_position: bool) -> float:
+    """Fraction of expected fields answered correctly"""
+    if not by_position:
+        return agreement(expected, result) or 0.0
+    expected_states = list(flatten(expected).values())
+    states = list(result.values())
+    correct = sum(1 for want, got in zip(expected_states, states) if want == got)
+    return correct / len(expected_states)
+
+
+def load_forms(count: int, degraded: float):
+    """(name, bytes, expected) for ``count`` forms, a ``degraded`` share of them with a stray mark"""
+    forms = []
+    for seed in range(count):
+        image_bytes, expected = generate_form(seed=seed)
+        name = f"synthetic-{seed}.png"
+        if seed < round(count * degraded):
+            image_bytes = add_stray_mark(image_bytes, seed)
+            name = f"synthetic-{seed}-marked.png"
+        forms.append((name, image_bytes, expected))
+    return forms
+
+
+async def run(api, backend, forms):
+    results = []
+    for name, image_bytes, expected in forms:
+        backend.expected = expected
+        row = {"image": name}
+        for mode in ("llm", "cascade"):
+            started = time.perf_counter()
+            analysis = await api._analyze_image(image_bytes, mode)
+            row[f"{mode}_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            row[f"{mode}_accuracy"] = round(accuracy(expected, analysis["checkbox_analysis"], analysis["mode"] == "cv"), 4)
+            if mode == "cascade":
+                row["answered_by"] = analysis["routing"]["answered_by"]
+                row["routing"] = analysis["routing"]["stages"]
+        results.append(row)
+        print(json.dumps({key: value for key, value in row.items() if key != "routing"}))
+    return results
+
+
+def summarize(results):
+    count = len(results)
+    llm_ms = sum(row["llm_ms"] for row in results)
+    cascade_ms = sum(row["cascade_ms"] for row in results)
+    llm_accuracy = sum(row["llm_accuracy"] for row in results) / count
+    cascade_accuracy = sum(row["cascade_accuracy"] for row in results) / count
+    answered_by = {}
+    for row in results:
+        answered_by[row["answered_by"]] = answered_by.get(row["answered_by"], 0) + 1
+    return {
+        "forms": count,
+        "llm_mean_ms": round(llm_ms / count, 2),
+        "cascade_mean_ms": round(cascade_ms / count, 2),
+        "latency_saved_pct": round(100 * (1 - cascade_ms / llm_ms), 1) if llm_ms else None,
+        "llm_accuracy": round(llm_accuracy, 4),
+        "cascade_accuracy": round(cascade_accuracy, 4),
+        "accuracy_lost_pct_points": round(100 * (llm_accuracy - cascade_accuracy), 2),
+        "answered_by": answered_by
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cascade latency/accuracy evaluation with stubbed models")
+    parser.add_argument("--forms", type=int, default=20, help="Labelled synthetic forms to generate")
+    parser.add_argument("--degraded", type=float, default=0.3, help="Share of forms with a stray mark the CV detector is unsure about")
+    parser.add_argument("--stages", default="cv,fast,model", help="CASCADE_STAGES to evaluate")
+    parser.add_argument("--model-delay", type=float, default=2.0, help="Seconds the main model stub takes per call")
+    parser.add_argument("--fast-delay", type=float, default=0.4, help="Seconds the fast model stub takes per call")
+    parser.add_argument("--model-error", type=float, default=0.0, help="Chance the main model stub gets a field wrong")
+    parser.add_argument("--fast-error", type=float, default=0.05, help="Chance the fast model stub gets a field wrong")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    # Cascade settings are read when the API module is imported
+    os.environ["CASCADE_STAGES"] = args.stages
+    os.environ["CASCADE_FAST_MODEL"] = FAST_MODEL
+    import api
+    from cache import ResultCache
+    from templates import TemplateRegistry
+
+    backend = LabelledBackend(
+        delays={api.MODEL_NAME: args.model_delay, FAST_MODEL: args.fast_delay},
+        error_rates={api.MODEL_NAME: args.model_error, FAST_MODEL: args.fast_error}
+    )
+    api.backend = backend
+    api.result_cache = ResultCache(max_entries=0, path="")
+    api.template_registry = TemplateRegistry(path="")
+
+    results = asyncio.run(run(api, backend, load_forms(args.forms, args.degraded)))
+    report = {
+        "config": {
+            "stages": api.cascade_stages,
+            "model_delay_s": args.model_delay,
+            "fast_delay_s": args.fast_delay,
+            "model_error": args.model_error,
+            "fast_error": args.fast_error,
+            "degraded": args.degraded
+        },
+        "summary": summarize(results),
+        "model_calls": backend.calls_by_model,
+        "images": results
+    }
+    print(json.dumps({key: value for key, value in report.items() if key != "images"}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Synthetic checkbox forms for benchmarks.
+
+``generate_form`` draws a white page with labelled checkboxes in a grid, some
+of them ticked, and returns the PNG bytes together with the expected answer in
+the same nested structure the model produces.
+"""
+
+import io
+import random
+from typing import Any, Dict, Tuple
+
+from PIL import Image, ImageDraw
+
+GROUPS = {
+    "Gender": ["Male", "Female", "Other"],
+    "Marital Status": ["Single", "Married", "Divorced", "Widowed"],
+    "Contact Preference": ["Email", "Phone", "Mail"],
+    "Insurance": ["Medicare", "Medicaid", "Private", "None"]
+}
+
+SINGLE_OPTIONS = ["Military Service", "Consent Given", "Smoker", "Allergies", "Returning Patient"]
+
+
+def generate_form(
+    seed: int = 0,
+    width: int = 1240,
+    height: int = 1754,
+    box_size: int = 28,
+    groups: int = 4,
+    singles: int = 5,
+    noise: bool = True
+) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Draw a synthetic form
+
+    Args:
+        seed: Random seed; the same seed gives the same form
+        width, height: Page size in pixels (default is A4 at 150 DPI)
+        box_size: Checkbox edge length in pixels
+        groups: Number of grouped questions to draw
+        singles: Number of standalone checkboxes to draw
+        noise: Add faint speckles so every seed gives distinct image bytes
+
+    Returns:
+        Tuple of (png_bytes, expected_result)
+    """
+    rng = random.Random(seed)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    expected: Dict[str, Any] = {}
+
+    margin = 80
+    line_height = box_size * 2
+    y = margin
+    draw.text((margin, y), f"Patient Intake Form #{seed}", fill=0)
+    y += line_height
+
+    def draw_box(x: int, y: int, checked: bool) -> None:
+        draw.rectangle([x, y, x + box_size, y + box_size], outline=0, width=3)
+        if checked:
+            inset = box_size // 5
+            draw.line([x + inset, y + inset, x + box_size - inset, y + box_size - inset], fill=0, width=4)
+            draw.line([x + box_size - inset, y + inset, x + inset, y + box_size - inset], fill=0, width=4)
+
+    for name in list(GROUPS)[:groups]:
+        draw.text((margin, y + box_size // 3), name, fill=0)
+        y += line_height
+        chosen = rng.randrange(len(GROUPS[name]))
+        expected[name] = {}
+        x = margin
+        for index, option in enumerate(GROUPS[name]):
+            checked = index == chosen
+            draw_box(x, y, checked)
+            draw.text((x + box_size + 10, y + box_size // 3), option, fill=0)
+            expected[name][option] = "Checked" if checked else "Unchecked"
+            x += (width - 2 * margin) // len(GROUPS[name])
+        y += line_height
+
+    for option in SINGLE_OPTIONS[:singles]:
+        checked = rng.random() < 0.5
+        draw_box(margin, y, checked)
+        draw.text((margin + box_size + 10, y + box_size // 3), option, fill=0)
+        expected[option] = "Checked" if checked else "Unchecked"
+        y += line_height
+
+    if noise:
+        for _ in range(200):
+            image.putpixel((rng.randrange(width), rng.randrange(height)), rng.randrange(200, 250))
+
+    image_bytes_io = io.BytesIO()
+    image.save(image_bytes_io, format="PNG")
+    return image_bytes_io.getvalue(), expected
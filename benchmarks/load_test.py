@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Load test and latency benchmark for the checkbox detection API.
+
+Drives ``POST /analyze-checkboxes`` at a fixed concurrency, either in-process
+(the FastAPI app is called directly through an ASGI transport) or over HTTP
+against a running server. Images come from ``sample_photos/`` plus generated
+synthetic forms. By default the in-process mode swaps the model for a
+``FakeBackend`` with a configurable delay, so the numbers can be produced on a
+machine without Ollama; start a server with ``OLLAMA_BACKEND=fake`` to do the
+same over HTTP.
+
+Reports throughput and p50/p95/p99 latency overall and per pipeline stage
+(upload read, preprocessing, queue wait, inference, JSON parse) and writes
+them as JSON so runs of different versions can be diffed.
+
+Usage:
+    python benchmarks/load_test.py --requests 200 --concurrency 8 --fake-delay 0.5 --output run.json
+    python benchmarks/load_test.py --url http://localhost:8000 --requests 50 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+# Make the top-level modules importable when run from the benchmarks folder
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from forms import generate_form  # noqa: E402
+
+SAMPLE_DIR = ROOT_DIR / "sample_photos"
+
+# Stage timings reported by the API, in pipeline order
+STAGES = ["upload_read_ms", "cache_lookup_ms", "preprocess_ms", "queue_wait_ms", "inference_ms", "parse_ms"]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of ``values``"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return round(ordered[rank], 2)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2) if values else None,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 2) if values else None
+    }
+
+
+def load_images(synthetic: int, include_samples: bool):
+    """(name, bytes, content_type) tuples used round-robin by the workers"""
+    images = []
+    if include_samples:
+        for path in sorted(SAMPLE_DIR.iterdir()):
+            if path.suffix.lower() in (".png", ".jpg", ".jpeg"):
+                content_type = "image/png" if path.suffix.lower() == ".png" else "image/jpeg"
+                images.append((path.name, path.read_bytes(), content_type))
+    for seed in range(synthetic):
+        image_bytes, _ = generate_form(seed=seed)
+        images.append((f"synthetic-{seed}.png", image_bytes, "image/png"))
+    return images
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def run_load(client: httpx.AsyncClient, images, total: int, concurrency: int):
+    """Send ``total`` requests with ``concurrency`` workers and collect per-request records"""
+    records = []
+    counter = iter(range(total))
+
+    async def worker():
+        for index in counter:
+            name, image_bytes, content_type = images[index % len(images)]
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/analyze-checkboxes",
+                    files={"file": (name, image_bytes, content_type)}
+                )
+                status = response.status_code
+                body = response.json()
+            except Exception as e:
+                status, body = 0, {"message": str(e)}
+            record = {
+                "image": name,
+                "status": status,
+                "latency_ms": (time.perf_counter() - started) * 1000,
+                "timings": {},
+                "cached": False
+            }
+            if status == 200 and body.get("data"):
+                record["timings"] = body["data"].get("timings", {})
+                record["cached"] = body["data"].get("cached", False)
+            records.append(record)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return records, time.perf_counter() - started
+
+
+def build_report(records, elapsed: float, config: Dict) -> Dict:
+    succeeded = [r for r in records if r["status"] == 200]
+    status_counts: Dict[str, int] = {}
+    for record in records:
+        status_counts[str(record["status"])] = status_counts.get(str(record["status"]), 0) + 1
+
+    stages = {}
+    for stage in STAGES:
+        values = [r["timings"][stage] for r in succeeded if stage in r["timings"]]
+        if values:
+            stages[stage] = summarize(values)
+
+    return {
+        "config": config,
+        "environment": {
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform()
+        },
+        "requests": len(records),
+        "succeeded": len(succeeded),
+        "cached": sum(1 for r in succeeded if r["cached"]),
+        "status_counts": status_counts,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(succeeded) / elapsed, 2) if elapsed else None,
+        "latency_ms": summarize([r["latency_ms"] for r in succeeded]),
+        "stages_ms": stages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the checkbox detection API")
+    parser.add_argument("--url", help="Base URL of a running server; omit to drive the app in-process")
+    parser.add_argument("--requests", type=int, default=100, help="Total requests to send")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--synthetic", type=int, default=20, help="Synthetic forms to generate")
+    parser.add_argument("--no-samples", action="store_true", help="Skip the images in sample_photos/")
+    parser.add_argument("--fake-delay", type=float, default=0.5, help="FakeBackend delay in seconds (in-process only)")
+    parser.add_argument("--real-backend", action="store_true", help="Use the configured Ollama backend in-process")
+    parser.add_argument("--keep-cache", action="store_true", help="Leave the result cache enabled (in-process only)")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.synthetic, not args.no_samples)
+    config = {
+        "mode": "http" if args.url else "in-process",
+        "url": args.url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "images": len(images),
+        "fake_delay_s": None if (args.url or args.real_backend) else args.fake_delay,
+        "cache": bool(args.url or args.keep_cache)
+    }
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        import api
+        from backends import FakeBackend
+        from cache import ResultCache
+
+        if not args.real_backend:
+            api.backend = FakeBackend(delay=args.fake_delay, model=api.MODEL_NAME)
+        if not args.keep_cache:
+            api.result_cache = ResultCache(max_entries=0, path="")
+        config["inference_pool"] = api.inference_pool.stats()
+        client = httpx.AsyncClient(app=api.app, base_url="http://benchmark", timeout=None)
+
+    async def run():
+        async with client:
+            return await run_load(client, images, args.requests, args.concurrency)
+
+    records, elapsed = asyncio.run(run())
+    report = build_report(records, elapsed, config)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
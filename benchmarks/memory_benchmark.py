@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Peak memory of upload handling, before and after streamed uploads.
+
+Each scenario is posted to ``/analyze-checkboxes`` by concurrent clients, in
+a fresh process per run so peak RSS is not inherited from an earlier one:
+
+- ``scan``: a large, legitimate JPEG scan
+- ``bomb``: a small PNG whose header declares a huge, blank page
+- ``oversize``: an upload twice as large as ``MAX_UPLOAD_BYTES``
+
+The ``legacy`` variant reproduces the old handling in the same tree: the
+upload is read whole with ``file.read()``, JPEGs are decoded at full size and
+only Pillow's default pixel limit applies. The ``streamed`` variant is the
+current code. The report gives the status codes, the peak RSS growth while
+the requests ran, and the peak of Python-level allocations (upload buffers)
+from ``tracemalloc``. The model is a ``FakeBackend``.
+
+Usage:
+    python benchmarks/memory_benchmark.py --concurrency 8 --output memory.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from pathlib import Path
+
+# Make the top-level modules importable when run from the benchmarks folder
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+SCENARIOS = ("scan", "bomb", "oversize")
+VARIANTS = ("legacy", "streamed")
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+def make_bomb(side: int) -> bytes:
+    """A grayscale PNG of ``side`` x ``side`` white pixels, compressed to a few hundred KB"""
+    row = b"\x00" + b"\xff" * side
+    compressor = zlib.compressobj(9)
+    body = b"".join(compressor.compress(row) for _ in range(side)) + compressor.flush()
+    header = struct.pack(">IIBBBBB", side, side, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", body) + _png_chunk(b"IEND", b"")
+
+
+def make_scan(width: int, height: int) -> bytes:
+    """A large JPEG of a synthetic form, like a high-resolution scan"""
+    from forms import generate_form
+    from PIL import Image
+
+    form_bytes, _ = generate_form(seed=0)
+    page = Image.open(io.BytesIO(form_bytes)).convert("RGB").resize((width, height), Image.BILINEAR)
+    image_bytes_io = io.BytesIO()
+    page.save(image_bytes_io, format="JPEG", quality=90)
+    return image_bytes_io.getvalue()
+
+
+def make_upload(scenario: str, max_bytes: int) -> bytes:
+    """Upload bytes for a scenario"""
+    if scenario == "scan":
+        return make_scan(6000, 8000)
+    if scenario == "bomb":
+        # Below twice Pillow's default limit, where it only warns
+        return make_bomb(12000)
+    return make_scan(1200, 1600) + os.urandom(2 * max_bytes)
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor
+
+
+def child(scenario: str, variant: str, upload_path: str, concurrency: int, fake_delay: float, max_upload_mb: int):
+    """Run one scenario and print its measurements as JSON"""
+    os.environ["MAX_UPLOAD_BYTES"] = str(max_upload_mb * 1024 * 1024)
+    if variant == "legacy":
+        # Only Pillow's default limit, as before MAX_IMAGE_PIXELS existed
+        os.environ["MAX_IMAGE_PIXELS"] = "0"
+
+    import httpx
+    from PIL import JpegImagePlugin
+
+    import api
+    from backends import FakeBackend
+    from cache import ResultCache
+    from templates import TemplateRegistry
+
+    api.backend = FakeBackend(delay=fake_delay)
+    api.result_cache = ResultCache(max_entries=0, path="")
+    api.template_registry = TemplateRegistry(path="")
+    if variant == "legacy":
+        async def read_whole(file, kinds=None, max_bytes=None):
+            return await file.read()
+
+        api._read_upload = read_whole
+        JpegImagePlugin.JpegImageFile.draft = lambda self, mode, size: None
+
+    data = Path(upload_path).read_bytes()
+    filename, content_type = ("bomb.png", "image/png") if scenario == "bomb" else (f"{scenario}.jpg", "image/jpeg")
+    # Build the request body up front so the client's copies are not measured
+    boundary = "memory-benchmark"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+    async def post_all():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            responses = await asyncio.gather(*(
+                client.post("/analyze-checkboxes", content=body, headers=headers)
+                for _ in range(concurrency)
+            ))
+        return [response.status_code for response in responses]
+
+    baseline_rss = _peak_rss_mb()
+    tracemalloc.start()
+    started = time.perf_counter()
+    statuses = asyncio.run(post_all())
+    elapsed = time.perf_counter() - started
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({
+        "scenario": scenario,
+        "variant": variant,
+        "upload_bytes": len(data),
+        "statuses": sorted(set(statuses)),
+        "rss_growth_mb": round(_peak_rss_mb() - baseline_rss, 1),
+        "python_peak_mb": round(traced_peak / (1024 * 1024), 1),
+        "elapsed_s": round(elapsed, 2)
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload memory benchmark, legacy versus streamed handling")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scenarios to run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous uploads per run")
+    parser.add_argument("--fake-delay", type=float, default=0.1, help="Seconds the fake model takes per answer")
+    parser.add_argument("--max-upload-mb", type=int, default=4, help="MAX_UPLOAD_BYTES for the runs, in MiB")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--child", nargs=3, metavar=("SCENARIO", "VARIANT", "UPLOAD"), help=argparse.SUPPRESS)
+    parser.add_argument("--generate", nargs=2, metavar=("SCENARIO", "UPLOAD"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child, args.concurrency, args.fake_delay, args.max_upload_mb)
+        return
+    if args.generate:
+        Path(args.generate[1]).write_bytes(make_upload(args.generate[0], args.max_upload_mb * 1024 * 1024))
+        return
+
+    # Uploads are generated in their own process too: Linux keeps the peak RSS
+    # across fork and exec, so building them here would inflate every run's
+    # baseline
+    options = ["--concurrency", str(args.concurrency), "--fake-delay", str(args.fake_delay), "--max-upload-mb", str(args.max_upload_mb)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scenario in args.scenarios:
+            upload_path = str(Path(tmp_dir) / scenario)
+            subprocess.run([sys.executable, __file__, "--generate", scenario, upload_path] + options, check=True)
+            for variant in VARIANTS:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", scenario, variant, upload_path] + options,
+                    capture_output=True, text=True, check=True
+                ).stdout
+                row = json.loads(output.strip().splitlines()[-1])
+                results.append(row)
+                print(json.dumps(row))
+
+    summary = {}
+    for scenario in args.scenarios:
+        rows = {row["variant"]: row for row in results if row["scenario"] == scenario}
+        legacy, streamed = rows["legacy"], rows["streamed"]
+        summary[scenario] = {
+            "legacy_rss_growth_mb": legacy["rss_growth_mb"],
+            "streamed_rss_growth_mb": streamed["rss_growth_mb"],
+            "rss_saved_pct": round(100 * (1 - streamed["rss_growth_mb"] / legacy["rss_growth_mb"]), 1) if legacy["rss_growth_mb"] else None,
+            "legacy_python_peak_mb": legacy["python_peak_mb"],
+            "streamed_python_peak_mb": streamed["python_peak_mb"],
+            "legacy_statuses": legacy["statuses"],
+            "streamed_statuses": streamed["statuses"]
+        }
+    report = {
+        "config": {"concurrency": args.concurrency, "fake_delay_s": args.fake_delay, "max_upload_mb": args.max_upload_mb},
+        "summary": summary,
+        "runs": results
+    }
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark the preprocessing stage on the sample photos.
+
+For every preprocessing profile this reports how long preprocessing takes and
+how many bytes reach the model. Unless ``--skip-inference`` is given, each
+image is also sent to Ollama and the model latency and agreement with the
+unprocessed (full resolution) answer are recorded, which shows the latency
+versus accuracy trade-off of each profile.
+
+Usage:
+    python benchmarks/preprocess_benchmark.py [--skip-inference] [--output results.json]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# Make the top-level modules importable when run from the benchmarks folder
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from preprocess import PreprocessConfig, preprocess_image  # noqa: E402
+
+SAMPLE_DIR = ROOT_DIR / "sample_photos"
+
+# Profiles compared against the untouched image
+PROFILES = {
+    "original": PreprocessConfig(exif_transpose=False, max_long_edge=0),
+    "default": PreprocessConfig(),
+    "edge_1024": PreprocessConfig(max_long_edge=1024),
+    "edge_768_gray": PreprocessConfig(max_long_edge=768, grayscale=True),
+    "edge_768_gray_crop": PreprocessConfig(max_long_edge=768, grayscale=True, autocrop=True)
+}
+
+
+def flatten(result, prefix=""):
+    """Flatten nested checkbox JSON into {"Group/Label": value}"""
+    if not isinstance(result, dict):
+        return {}
+    fields = {}
+    for key, value in result.items():
+        path = f"{prefix}/{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            fields.update(flatten(value, path))
+        else:
+            fields[path] = value
+    return fields
+
+
+def agreement(baseline, candidate):
+    """Fraction of baseline fields the candidate reproduces exactly"""
+    expected = flatten(baseline)
+    if not expected:
+        return None
+    actual = flatten(candidate)
+    return sum(1 for key, value in expected.items() if actual.get(key) == value) / len(expected)
+
+
+def run_model(image_bytes):
+    """Run one inference through the API pipeline and time it"""
+    import api
+
+    started = time.perf_counter()
+    parsed = api._parse_analysis(api._run_model(image_bytes)['message']['content'])
+    return parsed, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocessing latency/accuracy benchmark")
+    parser.add_argument("--skip-inference", action="store_true", help="Only time preprocessing")
+    parser.add_argument("--repeat", type=int, default=5, help="Preprocessing repetitions per image")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    images = sorted(p for p in SAMPLE_DIR.iterdir() if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+    results = []
+
+    for path in images:
+        image_data = path.read_bytes()
+        baseline = None
+
+        for name, config in PROFILES.items():
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                image_bytes, image_info = preprocess_image(image_data, config)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            row = {
+                "image": path.name,
+                "profile": name,
+                "input_bytes": len(image_data),
+                "output_bytes": len(image_bytes),
+                "output_size": image_info["preprocessing"].get("output_size", image_info["size"]),
+                "transforms": image_info["preprocessing"]["transforms"],
+                "preprocess_ms": round(min(timings), 2)
+            }
+
+            if not args.skip_inference:
+                parsed, inference_ms = run_model(image_bytes)
+                if name == "original":
+                    baseline = parsed
+                row["inference_ms"] = round(inference_ms, 1)
+                row["agreement"] = agreement(baseline, parsed)
+
+            results.append(row)
+            print(json.dumps(row))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
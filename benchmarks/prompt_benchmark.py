@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Compare the full and compact answer formats.
+
+Every image is sent with the full prompt (``"Checked"``/``"Unchecked"``,
+indented JSON) and with the compact one (``1``/``0``, minified JSON). The
+report gives the output tokens and latency of both, and, for the synthetic
+forms, whether the expanded compact answer matches the expected result.
+
+By default the model is a stub that answers with each form's true result in
+the requested format. Its output tokens are estimated by splitting the answer
+into words, punctuation and whitespace runs, and decoding takes
+``--token-ms`` per token plus ``--prompt-ms`` per call. Pass
+``--real-backend`` to measure the configured Ollama server instead, which
+reports its own ``eval_count``.
+
+Usage:
+    python benchmarks/prompt_benchmark.py --synthetic 10 --output prompts.json
+    python benchmarks/prompt_benchmark.py --real-backend --repeat 3
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+# Make the top-level modules importable when run from the benchmarks folder
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backends import FakeBackend  # noqa: E402
+from forms import generate_form  # noqa: E402
+from preprocess import preprocess_image  # noqa: E402
+from preprocess_benchmark import agreement, flatten  # noqa: E402
+from prompts import COMPACT_PROMPT, DOCUMENT_VERIFIER_PROMPT  # noqa: E402
+
+SAMPLE_DIR = ROOT_DIR / "sample_photos"
+
+# Rough tokenizer for the stub: words, punctuation and whitespace runs
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]|\s+")
+
+
+def compact(result):
+    """The compact form of a result: 1/0 instead of state names"""
+    return {
+        key: compact(value) if isinstance(value, dict) else int(value == "Checked")
+        for key, value in result.items()
+    }
+
+
+class FormatStubBackend(FakeBackend):
+    """FakeBackend answering with the current form's result in the format the prompt asks for"""
+
+    def __init__(self, compact_prompt: str, prompt_ms: float, token_ms: float):
+        super().__init__(delay=0)
+        self.compact_prompt = compact_prompt
+        self.prompt_ms = prompt_ms
+        self.token_ms = token_ms
+        self.expected = {}
+
+    def _stats(self, elapsed: float):
+        stats = super()._stats(elapsed)
+        stats["eval_count"] = len(TOKEN_PATTERN.findall(self.content))
+        return stats
+
+    def chat(self, model: str = "", messages=None, stream: bool = False, **kwargs):
+        # Calls are sequential in this benchmark, so per-call state is safe
+        if messages[0]["content"] == self.compact_prompt:
+            self.content = json.dumps(compact(self.expected), separators=(",", ":"))
+        else:
+            self.content = json.dumps(self.expected, indent=4)
+        tokens = len(TOKEN_PATTERN.findall(self.content))
+        self.delay = (self.prompt_ms + tokens * self.token_ms) / 1000
+        return super().chat(model, messages, stream, **kwargs)
+
+
+def load_images(synthetic: int, include_samples: bool):
+    """(name, bytes, expected result or None) tuples"""
+    images = []
+    if include_samples:
+        for path in sorted(SAMPLE_DIR.iterdir()):
+            if path.suffix.lower() in (".png", ".jpg", ".jpeg"):
+                images.append((path.name, path.read_bytes(), None))
+    for seed in range(synthetic):
+        image_bytes, expected = generate_form(seed=seed)
+        images.append((f"synthetic-{seed}.png", image_bytes, expected))
+    return images
+
+
+def run(api, images, repeat: int, stub):
+    prompts = {"full": DOCUMENT_VERIFIER_PROMPT, "compact": COMPACT_PROMPT}
+    results = []
+    for name, image_data, expected in images:
+        if stub is not None:
+            if expected is None:
+                continue
+            stub.expected = expected
+        image_bytes, _ = preprocess_image(image_data, api.preprocess_config)
+        row = {"image": name, "fields": len(flatten(expected)) if expected else None}
+        answers = {}
+        for style, prompt in prompts.items():
+            tokens = []
+            latencies = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                response = api._run_model(image_bytes, prompt)
+                latencies.append((time.perf_counter() - started) * 1000)
+                tokens.append(response.get("eval_count") or 0)
+            answers[style] = api._parse_analysis(response['message']['content'])
+            row[f"{style}_tokens"] = round(sum(tokens) / repeat, 1)
+            row[f"{style}_ms"] = round(sum(latencies) / repeat, 2)
+            if expected is not None:
+                row[f"{style}_agreement"] = agreement(expected, answers[style])
+        row["same_answer"] = answers["full"] == answers["compact"]
+        results.append(row)
+        print(json.dumps(row))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full versus compact answer format benchmark")
+    parser.add_argument("--synthetic", type=int, default=10, help="Synthetic forms to generate")
+    parser.add_argument("--no-samples", action="store_true", help="Skip the images in sample_photos/ (always skipped with the stub)")
+    parser.add_argument("--repeat", type=int, default=1, help="Calls per image and prompt")
+    parser.add_argument("--real-backend", action="store_true", help="Use the configured Ollama backend instead of the stub")
+    parser.add_argument("--prompt-ms", type=float, default=300.0, help="Stub: milliseconds per call before decoding")
+    parser.add_argument("--token-ms", type=float, default=25.0, help="Stub: milliseconds per generated token")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    import api
+    from cache import ResultCache
+
+    stub = None
+    if not args.real_backend:
+        stub = FormatStubBackend(COMPACT_PROMPT, args.prompt_ms, args.token_ms)
+        api.backend = stub
+    api.result_cache = ResultCache(max_entries=0, path="")
+
+    results = run(api, load_images(args.synthetic, not args.no_samples), max(1, args.repeat), stub)
+    totals = {
+        key: sum(row[key] for row in results)
+        for key in ("full_tokens", "compact_tokens", "full_ms", "compact_ms")
+    }
+    report = {
+        "config": {
+            "backend": "ollama" if args.real_backend else "stub",
+            "structured_output": api.STRUCTURED_OUTPUT,
+            "prompt_ms": None if args.real_backend else args.prompt_ms,
+            "token_ms": None if args.real_backend else args.token_ms
+        },
+        "images": results,
+        "full_tokens": round(totals["full_tokens"], 1),
+        "compact_tokens": round(totals["compact_tokens"], 1),
+        "token_reduction_pct": round(100 * (1 - totals["compact_tokens"] / totals["full_tokens"]), 1) if totals["full_tokens"] else None,
+        "full_total_ms": round(totals["full_ms"], 2),
+        "compact_total_ms": round(totals["compact_ms"], 2),
+        "latency_reduction_pct": round(100 * (1 - totals["compact_ms"] / totals["full_ms"]), 1) if totals["full_ms"] else None,
+        "answers_match": all(row["same_answer"] for row in results)
+    }
+    print(json.dumps({key: value for key, value in report.items() if key != "images"}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Stub Ollama servers for testing multi-backend routing without a model.
+
+Each stub answers ``GET /api/tags``, ``POST /api/pull`` and ``POST /api/chat``
+(streaming or not) like Ollama does, after a configurable delay and with a
+canned checkbox result. A stub can also be told to fail every chat call with a
+given HTTP status, to exercise retries and health checks.
+
+Usage:
+    python benchmarks/stub_ollama.py --ports 11501 11502 --delay 0.5
+    OLLAMA_HOSTS=http://127.0.0.1:11501,http://127.0.0.1:11502 python api.py
+"""
+
+import argparse
+import http.server
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Make the top-level modules importable when run from the benchmarks folder
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from backends import FAKE_RESPONSE  # noqa: E402
+
+
+class StubOllamaHandler(http.server.BaseHTTPRequestHandler):
+    """Imitates the parts of the Ollama HTTP API the checkbox service uses"""
+
+    protocol_version = "HTTP/1.1"
+    model = "granite3.2-vision:2b"
+    delay = 0.5
+    fail_status = 0
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.model}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.chat_calls += self.path == "/api/chat"
+        if self.path == "/api/pull":
+            self._send_json(200, {"status": "success"})
+            return
+        if self.path != "/api/chat":
+            self._send_json(404, {"error": "not found"})
+            return
+        if self.fail_status:
+            self._send_json(self.fail_status, {"error": f"stub failure on port {self.server.server_address[1]}"})
+            return
+
+        started = time.perf_counter()
+        time.sleep(self.delay)
+        content = json.dumps(FAKE_RESPONSE, indent=2)
+        stats = {
+            "model": request.get("model", self.model),
+            "done": True,
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "prompt_eval_count": 600,
+            "eval_count": max(1, len(content) // 4)
+        }
+        if request.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            lines = [
+                {"model": stats["model"], "message": {"role": "assistant", "content": content[i:i + 16]}, "done": False}
+                for i in range(0, len(content), 16)
+            ]
+            lines.append(dict(stats, message={"role": "assistant", "content": ""}))
+            for line in lines:
+                chunk = (json.dumps(line) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self._send_json(200, dict(stats, message={"role": "assistant", "content": content}))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port: int = 0, delay: float = 0.5, fail_status: int = 0, model: str = StubOllamaHandler.model):
+    """Start a stub server on a background thread; returns the server (``server.url`` is its base URL)"""
+    handler = type("ConfiguredStubOllamaHandler", (StubOllamaHandler,), {
+        "delay": delay, "fail_status": fail_status, "model": model
+    })
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.chat_calls = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama servers for routing tests")
+    parser.add_argument("--ports", type=int, nargs="+", default=[11501, 11502], help="Ports to listen on")
+    parser.add_argument("--delay", type=float, default=0.5, help="Seconds each chat call takes")
+    parser.add_argument("--fail-status", type=int, default=0, help="Answer every chat call with this HTTP status")
+    args = parser.parse_args()
+
+    servers = [start_stub_server(port, args.delay, args.fail_status) for port in args.ports]
+    print("OLLAMA_HOSTS=" + ",".join(server.url for server in servers))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compare single-shot and tiled inference.
+
+Every benchmark image (``sample_photos/`` plus generated synthetic forms) is
+analysed once as a whole page and once in tiled mode, with the result cache
+disabled. The report gives the latency of both per image and in total, the
+number of tiles, and, for the synthetic forms, how many fields each mode got
+right. It ends with whether tiling lowered total latency.
+
+Tiles only run in parallel up to ``MAX_CONCURRENT_INFERENCES`` and only help if
+the Ollama server itself serves requests in parallel (``OLLAMA_NUM_PARALLEL``).
+
+Usage:
+    python benchmarks/tiling_benchmark.py --synthetic 5 --output tiling.json
+    python benchmarks/tiling_benchmark.py --fake-delay 0.5   # pipeline overhead only, no model
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+# Make the top-level modules importable when run from the benchmarks folder
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from forms import generate_form  # noqa: E402
+from preprocess_benchmark import agreement  # noqa: E402
+
+SAMPLE_DIR = ROOT_DIR / "sample_photos"
+
+
+def load_images(synthetic: int, include_samples: bool):
+    """(name, bytes, expected result or None) tuples"""
+    images = []
+    if include_samples:
+        for path in sorted(SAMPLE_DIR.iterdir()):
+            if path.suffix.lower() in (".png", ".jpg", ".jpeg"):
+                images.append((path.name, path.read_bytes(), None))
+    for seed in range(synthetic):
+        image_bytes, expected = generate_form(seed=seed)
+        images.append((f"synthetic-{seed}.png", image_bytes, expected))
+    return images
+
+
+async def analyze(api, image_bytes: bytes, mode: str):
+    started = time.perf_counter()
+    analysis = await api._analyze_image(image_bytes, mode)
+    return analysis, round((time.perf_counter() - started) * 1000, 2)
+
+
+async def run(api, images):
+    results = []
+    for name, image_bytes, expected in images:
+        single, single_ms = await analyze(api, image_bytes, "llm")
+        tiled, tiled_ms = await analyze(api, image_bytes, "tiled")
+        result = {
+            "image": name,
+            "single_ms": single_ms,
+            "tiled_ms": tiled_ms,
+            "tiles": len(tiled["image_info"].get("tiles", [])),
+            "speedup": round(single_ms / tiled_ms, 2) if tiled_ms else None
+        }
+        if expected is not None:
+            result["single_agreement"] = agreement(expected, single["checkbox_analysis"])
+            result["tiled_agreement"] = agreement(expected, tiled["checkbox_analysis"])
+        results.append(result)
+        print(json.dumps(result))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-shot versus tiled inference benchmark")
+    parser.add_argument("--synthetic", type=int, default=5, help="Synthetic forms to generate")
+    parser.add_argument("--no-samples", action="store_true", help="Skip the images in sample_photos/")
+    parser.add_argument("--fake-delay", type=float, help="Use a FakeBackend with this delay instead of Ollama")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    import api
+    from backends import FakeBackend
+    from cache import ResultCache
+
+    if args.fake_delay is not None:
+        api.backend = FakeBackend(delay=args.fake_delay, model=api.MODEL_NAME)
+    api.result_cache = ResultCache(max_entries=0, path="")
+
+    results = asyncio.run(run(api, load_images(args.synthetic, not args.no_samples)))
+    single_total = sum(r["single_ms"] for r in results)
+    tiled_total = sum(r["tiled_ms"] for r in results)
+    report = {
+        "config": {
+            "backend": "fake" if args.fake_delay is not None else "ollama",
+            "fake_delay_s": args.fake_delay,
+            "max_concurrent_inferences": api.inference_pool.max_concurrency
+        },
+        "images": results,
+        "single_total_ms": round(single_total, 2),
+        "tiled_total_ms": round(tiled_total, 2),
+        "tiling_lowered_latency": tiled_total < single_total
+    }
+    print(json.dumps({key: value for key, value in report.items() if key != "images"}, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
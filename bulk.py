@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Bulk checkbox analysis for backfills.
+
+Walks directories and glob patterns, decodes and preprocesses the images in a
+process pool (so PIL work does not hold the GIL the inference threads need)
+and sends them to the model with a bounded number of calls in flight. Results
+are appended to a JSONL file as they complete, or written to Parquet in parts
+of ``--parquet-rows`` rows (needs ``pyarrow``).
+
+The output doubles as the checkpoint: on start the files already present in it
+are skipped, so a killed run picks up where it stopped. Files that failed are
+retried only with ``--retry-errors``.
+
+Usage:
+    python bulk.py scans/ "archive/**/*.tif" --output results.jsonl
+    python bulk.py scans/ --output results.parquet --workers 8 --concurrency 4
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from backends import OLLAMA_KEEP_ALIVE, create_backend, parse_keep_alive
+from cv_detector import detect_checkboxes
+from ingest import open_image
+from parsing import output_format, parse_analysis
+from preprocess import PreprocessConfig, preprocess_image
+from prompts import ANALYSIS_PROMPT, MODEL_NAME
+from sinks import SINK_KINDS, ResultSink, create_sink, result_record
+
+# Extensions picked up when walking a directory
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp", ".gif"}
+
+# Columns of the Parquet output; nested values are stored as JSON text
+PARQUET_COLUMNS = ("path", "status", "mode", "image_info", "checkbox_analysis", "error", "prepare_ms", "inference_ms")
+
+
+def iter_inputs(patterns: Iterable[str]) -> Iterator[str]:
+    """Image paths under the given directories, files and glob patterns, each once"""
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = (
+                os.path.join(root, name)
+                for root, _, names in os.walk(pattern)
+                for name in names
+            )
+            paths = sorted(path for path in paths if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+        else:
+            paths = sorted(glob.glob(pattern, recursive=True))
+        for path in paths:
+            path = os.path.abspath(path)
+            if path not in seen and os.path.isfile(path):
+                seen.add(path)
+                yield path
+
+
+def prepare_file(path: str, config: PreprocessConfig, mode: str) -> Dict[str, Any]:
+    """
+    Read and preprocess one image (runs in a worker process)
+
+    In ``cv`` mode the classical detector runs here as well, so no model call
+    is needed for the file. Any error is recorded on the file's record, so one
+    unreadable scan does not stop the run.
+    """
+    start = time.perf_counter()
+    record: Dict[str, Any] = {"path": path, "mode": mode}
+    try:
+        with open(path, "rb") as f:
+            image_data = f.read()
+        if mode == "cv":
+            # Same format and pixel limits as the preprocessing path
+            open_image(image_data)
+            detection = detect_checkboxes(image_data)
+            record["image_info"] = {"size": detection["image_size"]}
+            record["checkbox_analysis"] = {box["id"]: box["state"] for box in detection["boxes"]}
+            record["status"] = "ok"
+        else:
+            record["image_bytes"], record["image_info"] = preprocess_image(image_data, config)
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["prepare_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return record
+
+
+class JsonlWriter:
+    """Appends one JSON object per line, flushed as each result arrives"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def completed(self) -> Dict[str, str]:
+        """Status of every file already in the output, keyed by path"""
+        done: Dict[str, str] = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "rb") as f:
+            data = f.read()
+        # A run killed mid-write leaves a partial last line; drop it
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            done[record["path"]] = record.get("status", "ok")
+        return done
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetWriter:
+    """
+    Writes results as numbered part files in a directory
+
+    Rows are buffered and written ``rows_per_part`` at a time; each part is
+    written to a temporary name and renamed, so a part is either complete or
+    absent after a crash.
+    """
+
+    def __init__(self, path: str, rows_per_part: int = 1000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow") from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.rows_per_part = max(1, rows_per_part)
+        self._rows: List[Dict[str, Any]] = []
+        os.makedirs(path, exist_ok=True)
+
+    def _parts(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.path, "part-*.parquet")))
+
+    def completed(self) -> Dict[str, str]:
+        done: Dict[str, str] = {}
+        for part in self._parts():
+            table = self._pq.read_table(part, columns=["path", "status"])
+            done.update(zip(table.column("path").to_pylist(), table.column("status").to_pylist()))
+        return done
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._rows.append(record)
+        if len(self._rows) >= self.rows_per_part:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        columns = {name: [] for name in PARQUET_COLUMNS}
+        for record in self._rows:
+            for name in PARQUET_COLUMNS:
+                value = record.get(name)
+                if name in ("image_info", "checkbox_analysis") and value is not None:
+                    value = json.dumps(value)
+                columns[name].append(value)
+        parts = self._parts()
+        number = int(os.path.basename(parts[-1])[5:10]) + 1 if parts else 0
+        target = os.path.join(self.path, f"part-{number:05d}.parquet")
+        self._pq.write_table(self._pa.table(columns), target + ".tmp")
+        os.replace(target + ".tmp", target)
+        self._rows = []
+
+    def close(self) -> None:
+        self.flush()
+
+
+def create_writer(path: str, output_format: Optional[str] = None, parquet_rows: int = 1000):
+    """JSONL or Parquet writer, chosen by ``output_format`` or the output extension"""
+    output_format = output_format or ("parquet" if path.endswith(".parquet") else "jsonl")
+    if output_format == "parquet":
+        return ParquetWriter(path, parquet_rows)
+    return JsonlWriter(path)
+
+
+def model_analyzer(model: str = MODEL_NAME, prompt: str = ANALYSIS_PROMPT) -> Callable[[bytes], Dict[str, Any]]:
+    """Function sending one preprocessed image to the model and parsing its answer"""
+    backend = create_backend(model=model)
+    keep_alive = parse_keep_alive(OLLAMA_KEEP_ALIVE)
+    answer_format = output_format()
+
+    def analyze(image_bytes: bytes) -> Dict[str, Any]:
+        response = backend.chat(
+            model=model,
+            messages=[{"role": "user", "content": prompt, "images": [image_bytes]}],
+            format=answer_format,
+            keep_alive=keep_alive
+        )
+        return parse_analysis(response['message']['content'])
+
+    return analyze
+
+
+def run(
+    paths: Iterable[str],
+    writer,
+    analyze,
+    mode: str = "llm",
+    workers: int = 4,
+    concurrency: int = 2,
+    config: Optional[PreprocessConfig] = None,
+    sink: Optional[ResultSink] = None,
+    progress_every: int = 50
+) -> Dict[str, int]:
+    """
+    Stream files through the preprocessing pool and the inference threads
+
+    At most ``workers * 2`` files are being prepared and ``concurrency * 2``
+    prepared images wait for the model at any time, so memory stays bounded
+    however many files there are.
+
+    Args:
+        paths: Files to analyse
+        writer: ``JsonlWriter`` or ``ParquetWriter`` receiving each record
+        analyze: Callable taking the preprocessed image bytes and returning
+            the parsed checkbox analysis
+        mode: ``llm`` or ``cv``
+        workers: Preprocessing processes
+        concurrency: Model calls in flight
+        config: Preprocessing configuration (defaults from the environment)
+        sink: Result sink that also receives every successful record
+
+    Returns:
+        Counts of ``ok`` and ``error`` records written
+    """
+    config = config or PreprocessConfig.from_env()
+    counts = {"ok": 0, "error": 0}
+    start = time.perf_counter()
+
+    def infer(record: Dict[str, Any]) -> Dict[str, Any]:
+        image_bytes = record.pop("image_bytes")
+        infer_start = time.perf_counter()
+        try:
+            record["checkbox_analysis"] = analyze(image_bytes)
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["inference_ms"] = round((time.perf_counter() - infer_start) * 1000, 2)
+        return record
+
+    def finish(record: Dict[str, Any]) -> None:
+        writer.write(record)
+        if sink is not None and record["status"] == "ok":
+            sink.submit(result_record(
+                record["path"], record["checkbox_analysis"], mode, MODEL_NAME if mode == "llm" else None
+            ))
+        counts[record["status"]] += 1
+        written = counts["ok"] + counts["error"]
+        if progress_every and written % progress_every == 0:
+            rate = written / (time.perf_counter() - start)
+            print(f"{written} files, {counts['error']} errors, {rate:.2f} files/s", file=sys.stderr)
+
+    paths = iter(paths)
+    exhausted = False
+    preparing = set()
+    inferring = set()
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as processes, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as threads:
+        try:
+            while True:
+                while not exhausted and len(preparing) < workers * 2 and len(inferring) < concurrency * 2:
+                    path = next(paths, None)
+                    if path is None:
+                        exhausted = True
+                        break
+                    preparing.add(processes.submit(prepare_file, path, config, mode))
+                if not preparing and not inferring:
+                    break
+
+                done, _ = wait(preparing | inferring, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    if future in preparing:
+                        preparing.discard(future)
+                        if "image_bytes" in record:
+                            inferring.add(threads.submit(infer, record))
+                            continue
+                    else:
+                        inferring.discard(future)
+                    finish(record)
+        except KeyboardInterrupt:
+            # Keep what finished; unwritten files are picked up on the next run
+            for future in preparing | inferring:
+                future.cancel()
+            print("Interrupted, finishing in-flight model calls", file=sys.stderr)
+            for future in inferring:
+                if not future.cancelled():
+                    finish(future.result())
+        finally:
+            writer.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a directory or glob of scanned forms")
+    parser.add_argument("inputs", nargs="+", help="Directories, files or glob patterns (quote ** patterns)")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file, or Parquet directory when ending in .parquet")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), help="Override the format implied by --output")
+    parser.add_argument("--mode", choices=("llm", "cv"), default="llm", help="Vision model or the CV detector alone")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Decode/preprocess processes")
+    parser.add_argument("--concurrency", type=int, default=2, help="Model calls in flight")
+    parser.add_argument("--parquet-rows", type=int, default=1000, help="Rows per Parquet part file")
+    parser.add_argument("--retry-errors", action="store_true", help="Re-run files that failed in an earlier run")
+    parser.add_argument("--limit", type=int, help="Stop after this many new files")
+    parser.add_argument("--sink", choices=SINK_KINDS, default="none", help="Also persist results to this result sink")
+    parser.add_argument("--sink-path", default="", help="File for the jsonl and sqlite sinks")
+    args = parser.parse_args()
+
+    writer = create_writer(args.output, args.format, args.parquet_rows)
+    completed = writer.completed()
+    skip = {path for path, status in completed.items() if status == "ok" or not args.retry_errors}
+    paths = (path for path in iter_inputs(args.inputs) if path not in skip)
+    if args.limit:
+        paths = (path for _, path in zip(range(args.limit), paths))
+    if skip:
+        print(f"Resuming: {len(skip)} files already in {args.output}", file=sys.stderr)
+
+    analyze = model_analyzer() if args.mode == "llm" else None
+    sink = create_sink(args.sink, args.sink_path)
+    start = time.perf_counter()
+    try:
+        counts = run(paths, writer, analyze, args.mode, args.workers, args.concurrency, sink=sink)
+    finally:
+        if sink is not None:
+            sink.close()
+    elapsed = time.perf_counter() - start
+    report = {**counts, "elapsed_s": round(elapsed, 2), "output": args.output}
+    if sink is not None:
+        report["sink"] = sink.stats()
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Content-addressed cache for checkbox analysis results.
+
+Results are keyed by a hash of the image bytes, the model name and the prompt,
+so resubmitting the same scan skips inference while a model or prompt change
+invalidates old entries automatically. Entries live in an in-memory LRU tier
+and, when ``RESULT_CACHE_PATH`` is set, in a SQLite tier that survives restarts
+and is shared by every worker process pointing at the same file. Every write
+to the SQLite tier also deletes expired rows and the oldest rows beyond
+``RESULT_CACHE_DISK_MAX``, so the file does not grow without bound.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Cache configuration
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+RESULT_CACHE_DISK_MAX = int(os.getenv("RESULT_CACHE_DISK_MAX", "10000"))
+
+
+def make_cache_key(image_data: bytes, model_name: str, prompt: str, variant: str = "") -> str:
+    """
+    Build the cache key for an image analysed with a given model and prompt
+
+    ``variant`` identifies anything else that changes the model input, such as
+    the preprocessing configuration.
+    """
+    image_hash = hashlib.sha256(image_data).hexdigest()
+    prompt_hash = hashlib.sha256((prompt + variant).encode("utf-8")).hexdigest()
+    return f"{image_hash}:{model_name}:{prompt_hash}"
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional SQLite) cache with TTL expiry"""
+
+    def __init__(
+        self,
+        max_entries: int = RESULT_CACHE_SIZE,
+        ttl: float = RESULT_CACHE_TTL,
+        path: str = RESULT_CACHE_PATH,
+        max_disk_entries: int = RESULT_CACHE_DISK_MAX
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            # WAL lets worker processes read while another one writes
+            self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            self._db.commit()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def _remember(self, key: str, value: Dict[str, Any], created: float) -> None:
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for ``key`` or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if not self._expired(row[1]):
+                        value = json.loads(row[0])
+                        self._remember(key, value, row[1])
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store ``value`` under ``key`` in every enabled tier"""
+        created = time.time()
+        with self._lock:
+            self._remember(key, value, created)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), created)
+                )
+                self._prune(created)
+                self._db.commit()
+
+    def _prune(self, now: float) -> None:
+        """Delete expired rows and the oldest rows beyond ``max_disk_entries``"""
+        if self.ttl > 0:
+            self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        if self.max_disk_entries > 0:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for health reporting"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "disk_enabled": self._db is not None,
+                "max_disk_entries": self.max_disk_entries,
+                "hits": self.memory_hits + self.disk_hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
+
+    def close(self) -> None:
+        """Close the SQLite tier if it is open"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
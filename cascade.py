@@ -0,0 +1,150 @@
+"""
+Model cascade: cheap stages first, the vision model only when needed.
+
+A request in ``cascade`` mode runs the stages in ``CASCADE_STAGES`` in order
+and stops at the first one confident enough to answer:
+
+- ``cv``: the classical checkbox detector, accepted when every box is at least
+  ``CASCADE_CV_CONFIDENCE`` confident (answers by box id, not label).
+- ``fast``: a smaller vision model (``CASCADE_FAST_MODEL``), accepted when its
+  answer agrees with the detector's box count and number of ticked boxes to
+  at least ``CASCADE_FAST_AGREEMENT``. Without a detection to check against
+  the fast answer is not trusted.
+- ``model``: the main vision model, which always answers.
+
+Each stage's latency, confidence and outcome is recorded so responses can
+show how they were routed. A stage that fails moves the request on to the next
+one, except when the inference pool is saturated or no backend is available:
+sending the request to a larger model then would only add load, so the error
+is raised for the caller to answer with 503.
+"""
+
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backends import NoBackendAvailableError
+from cv_detector import CV_CONFIDENCE_THRESHOLD
+from inference import PoolSaturatedError
+from templates import flatten_fields
+
+# Cascade configuration
+CASCADE_STAGES = os.getenv("CASCADE_STAGES", "cv,fast,model")
+CASCADE_FAST_MODEL = os.getenv("CASCADE_FAST_MODEL", "")
+CASCADE_CV_CONFIDENCE = float(os.getenv("CASCADE_CV_CONFIDENCE", str(CV_CONFIDENCE_THRESHOLD)))
+CASCADE_FAST_AGREEMENT = float(os.getenv("CASCADE_FAST_AGREEMENT", "1.0"))
+
+# Errors that mean the system is overloaded rather than that a stage failed
+OVERLOAD_ERRORS = (PoolSaturatedError, NoBackendAvailableError)
+
+STAGES = ("cv", "fast", "model")
+
+# (analysis, confidence) returned by a stage; confidence None means "unknown"
+StageResult = Tuple[Dict[str, Any], Optional[float]]
+StageHandler = Callable[[Dict[str, Any]], Awaitable[StageResult]]
+
+
+def parse_stages(value: str = CASCADE_STAGES, fast_model: str = CASCADE_FAST_MODEL) -> List[str]:
+    """
+    Stage names from a comma-separated list, ending with ``model``
+
+    ``fast`` is dropped when no fast model is configured.
+    """
+    stages = []
+    for name in (part.strip() for part in value.split(",")):
+        if not name or name in stages or (name == "fast" and not fast_model):
+            continue
+        if name not in STAGES:
+            raise ValueError(f"Unknown cascade stage '{name}', expected one of: {', '.join(STAGES)}")
+        stages.append(name)
+    if "model" in stages:
+        stages.remove("model")
+    return stages + ["model"]
+
+
+def _states(result: Dict[str, Any]) -> List[str]:
+    """Leaf states of a nested result, in order"""
+    states = []
+    for path in flatten_fields(result):
+        value: Any = result
+        for key in path:
+            value = value[key]
+        states.append(value)
+    return states
+
+
+def detection_agreement(result: Dict[str, Any], detection: Optional[Dict[str, Any]]) -> Optional[float]:
+    """
+    How well a model answer matches what the detector saw on the page
+
+    Compares the number of fields and the number of ticked ones with the
+    detected boxes; 1.0 when both match, lower as either drifts. None when
+    there is no detection to compare with.
+    """
+    if not detection or not detection.get("boxes") or "raw_response" in result:
+        return None
+    states = _states(result)
+    boxes = detection["boxes"]
+    checked = sum(1 for state in states if state == "Checked")
+    expected_checked = sum(1 for box in boxes if box["state"] == "Checked")
+    drift = abs(len(states) - len(boxes)) + abs(checked - expected_checked)
+    return round(max(0.0, 1.0 - drift / len(boxes)), 3)
+
+
+async def run_cascade(
+    stages: List[str],
+    handlers: Dict[str, StageHandler],
+    thresholds: Dict[str, float],
+    context: Optional[Dict[str, Any]] = None
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Run stages in order until one answers with enough confidence
+
+    Args:
+        stages: Stage names; the last one always answers
+        handlers: Async callable per stage taking a shared context dict (where
+            earlier stages leave e.g. the detection) and returning
+            (analysis, confidence)
+        thresholds: Lowest confidence at which each stage's answer is used
+        context: Dict shared with the handlers, for callers that want to see
+            what the stages left in it
+
+    Returns:
+        Tuple of (analysis of the answering stage, routing), where routing
+        lists each stage run with its ``ms``, ``confidence`` and whether it
+        ``answered``. A stage that raises is recorded with its ``error`` and
+        skipped, unless it is the last one.
+
+    Raises:
+        PoolSaturatedError, NoBackendAvailableError: from any stage, without
+            trying the stages after it
+    """
+    context = {} if context is None else context
+    routing: List[Dict[str, Any]] = []
+    for index, stage in enumerate(stages):
+        last = index == len(stages) - 1
+        started = time.perf_counter()
+        try:
+            analysis, confidence = await handlers[stage](context)
+        except OVERLOAD_ERRORS:
+            raise
+        except Exception as e:
+            if last:
+                raise
+            routing.append({
+                "stage": stage,
+                "ms": round((time.perf_counter() - started) * 1000, 2),
+                "answered": False,
+                "error": str(e)
+            })
+            continue
+        answered = last or (confidence is not None and confidence >= thresholds.get(stage, 1.0))
+        routing.append({
+            "stage": stage,
+            "ms": round((time.perf_counter() - started) * 1000, 2),
+            "confidence": confidence,
+            "answered": answered
+        })
+        if answered:
+            return analysis, routing
+    raise RuntimeError("Cascade has no stages")
@@ -0,0 +1,133 @@
+"""
+Multi-page document ingestion.
+
+Scanned forms often arrive as multi-page PDFs or TIFFs. ``iter_pages`` decodes
+one page at a time, so a long document never has all of its pages in memory.
+PDF pages are rasterized at ``DOCUMENT_DPI``, and TIFF frames scanned at a
+higher resolution are shrunk to it. Pages with almost no pixel variation are
+reported as blank so they never reach the model.
+
+PDF support needs the optional ``pypdfium2`` package; TIFFs and single images
+only need Pillow.
+"""
+
+import io
+import os
+from typing import Any, Dict, Iterator, Optional
+
+from PIL import Image, ImageOps, ImageStat
+
+from ingest import open_image
+
+try:
+    import pypdfium2
+except ImportError:  # PDF input is optional
+    pypdfium2 = None
+
+# Document configuration
+DOCUMENT_DPI = int(os.getenv("DOCUMENT_DPI", "200"))
+DOCUMENT_MAX_PAGES = int(os.getenv("DOCUMENT_MAX_PAGES", "200"))
+BLANK_PAGE_STDDEV = float(os.getenv("BLANK_PAGE_STDDEV", "4.0"))
+
+PDF_SUPPORT = pypdfium2 is not None
+
+# Side of the thumbnail the blank-page check looks at
+BLANK_CHECK_SIZE = 256
+
+
+class DocumentError(ValueError):
+    """Raised when an upload is not a readable PDF, TIFF or image"""
+
+
+def document_kind(data: bytes) -> str:
+    """``pdf``, ``tiff`` or ``image``, from the leading magic bytes"""
+    if data[:5] == b"%PDF-":
+        return "pdf"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return "image"
+
+
+def is_blank(page: Image.Image, threshold: float = BLANK_PAGE_STDDEV) -> bool:
+    """True if the page's gray levels barely vary, checked on a small thumbnail"""
+    thumbnail = page.convert("L")
+    thumbnail.thumbnail((BLANK_CHECK_SIZE, BLANK_CHECK_SIZE))
+    return ImageStat.Stat(thumbnail).stddev[0] < threshold
+
+
+def _resample_to_dpi(frame: Image.Image, dpi: int) -> Image.Image:
+    """Shrink a scanned frame whose recorded resolution is above ``dpi``"""
+    source_dpi = frame.info.get("dpi", (0, 0))[0]
+    if not dpi or not source_dpi or source_dpi <= dpi:
+        return frame
+    scale = dpi / float(source_dpi)
+    return frame.resize(
+        (max(1, round(frame.width * scale)), max(1, round(frame.height * scale))),
+        Image.LANCZOS
+    )
+
+
+def _pdf_pages(data: bytes, dpi: int) -> Iterator[Image.Image]:
+    if pypdfium2 is None:
+        raise DocumentError("PDF input needs the pypdfium2 package (pip install pypdfium2)")
+    try:
+        document = pypdfium2.PdfDocument(data)
+    except Exception as e:
+        raise DocumentError(f"Cannot read PDF: {e}") from e
+    try:
+        for index in range(len(document)):
+            page = document[index]
+            try:
+                yield page.render(scale=dpi / 72).to_pil()
+            finally:
+                page.close()
+    finally:
+        document.close()
+
+
+def _image_frames(data: bytes, dpi: int) -> Iterator[Image.Image]:
+    image = open_image(data)
+    for index in range(getattr(image, "n_frames", 1)):
+        image.seek(index)
+        # Copy the frame so the next seek does not change it
+        yield _resample_to_dpi(ImageOps.exif_transpose(image), dpi)
+
+
+def iter_pages(
+    data: bytes,
+    dpi: int = DOCUMENT_DPI,
+    max_pages: int = DOCUMENT_MAX_PAGES,
+    blank_threshold: Optional[float] = BLANK_PAGE_STDDEV
+) -> Iterator[Dict[str, Any]]:
+    """
+    Decode a document lazily, one page per iteration
+
+    Args:
+        data: PDF, TIFF or single image bytes
+        dpi: Resolution PDF pages are rendered at and TIFF frames reduced to
+        max_pages: Pages read before stopping with ``DocumentError``
+        blank_threshold: Gray-level standard deviation below which a page is
+            blank; None disables the check
+
+    Yields:
+        Dicts with ``page`` (1-based), ``size``, ``blank`` and, for pages that
+        are not blank, ``image_bytes`` (PNG)
+
+    Raises:
+        DocumentError: if the document cannot be read or has too many pages
+        InvalidImageError: if an image or TIFF cannot be decoded
+    """
+    pages = _pdf_pages(data, dpi) if document_kind(data) == "pdf" else _image_frames(data, dpi)
+    for number, page in enumerate(pages, start=1):
+        if number > max_pages:
+            raise DocumentError(f"Document has more than {max_pages} pages")
+        result: Dict[str, Any] = {"page": number, "size": list(page.size), "blank": False}
+        if blank_threshold is not None and is_blank(page, blank_threshold):
+            result["blank"] = True
+        else:
+            if page.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+                page = page.convert("RGB")
+            image_bytes_io = io.BytesIO()
+            page.save(image_bytes_io, format="PNG")
+            result["image_bytes"] = image_bytes_io.getvalue()
+        yield result
@@ -0,0 +1,165 @@
+"""
+Pooled HTTP fetching of remote images for ``/analyze-checkboxes-url``.
+
+A single ``httpx.AsyncClient`` is shared by all requests so connections are
+kept alive and reused. Downloads are streamed with connect/read timeouts and
+abort as soon as they exceed ``URL_FETCH_MAX_BYTES``. Responses that carry an
+``ETag`` or ``Last-Modified`` header are remembered, and repeated URLs are
+revalidated with a conditional GET so unchanged images are not downloaded again.
+The remembered bodies are capped at ``URL_FETCH_CACHE_BYTES`` in total (least
+recently used go first), and bodies above ``URL_FETCH_CACHE_ENTRY_BYTES`` are
+not kept at all.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import httpx
+
+# Fetch configuration
+URL_FETCH_MAX_BYTES = int(os.getenv("URL_FETCH_MAX_BYTES", str(20 * 1024 * 1024)))
+URL_FETCH_CONNECT_TIMEOUT = float(os.getenv("URL_FETCH_CONNECT_TIMEOUT", "5"))
+URL_FETCH_READ_TIMEOUT = float(os.getenv("URL_FETCH_READ_TIMEOUT", "30"))
+URL_FETCH_MAX_CONNECTIONS = int(os.getenv("URL_FETCH_MAX_CONNECTIONS", "20"))
+URL_FETCH_CACHE_SIZE = int(os.getenv("URL_FETCH_CACHE_SIZE", "64"))
+URL_FETCH_CACHE_BYTES = int(os.getenv("URL_FETCH_CACHE_BYTES", str(64 * 1024 * 1024)))
+URL_FETCH_CACHE_ENTRY_BYTES = int(os.getenv("URL_FETCH_CACHE_ENTRY_BYTES", str(4 * 1024 * 1024)))
+
+
+class FetchError(Exception):
+    """Raised when a remote image cannot be downloaded"""
+
+
+class FetchTooLargeError(FetchError):
+    """Raised when a remote image exceeds the configured size limit"""
+
+
+class ImageFetcher:
+    """Download images over a shared keep-alive connection pool"""
+
+    def __init__(
+        self,
+        max_bytes: int = URL_FETCH_MAX_BYTES,
+        connect_timeout: float = URL_FETCH_CONNECT_TIMEOUT,
+        read_timeout: float = URL_FETCH_READ_TIMEOUT,
+        max_connections: int = URL_FETCH_MAX_CONNECTIONS,
+        cache_size: int = URL_FETCH_CACHE_SIZE,
+        cache_bytes: int = URL_FETCH_CACHE_BYTES,
+        cache_entry_bytes: int = URL_FETCH_CACHE_ENTRY_BYTES
+    ):
+        self.max_bytes = max_bytes
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections
+        )
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        self.cache_entry_bytes = min(cache_entry_bytes, cache_bytes)
+        self._cached_bytes = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._validated: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.downloads = 0
+        self.not_modified = 0
+        self.bytes_downloaded = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                follow_redirects=True
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _remember(self, url: str, response: httpx.Response, body: bytes) -> None:
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        with self._lock:
+            # Any earlier version of this URL is stale now
+            previous = self._validated.pop(url, None)
+            if previous is not None:
+                self._cached_bytes -= len(previous["body"])
+            if self.cache_size <= 0 or not (etag or last_modified) or len(body) > self.cache_entry_bytes:
+                return
+            self._validated[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "body": body
+            }
+            self._cached_bytes += len(body)
+            while len(self._validated) > self.cache_size or self._cached_bytes > self.cache_bytes:
+                _, evicted = self._validated.popitem(last=False)
+                self._cached_bytes -= len(evicted["body"])
+
+    async def fetch(self, url: str) -> bytes:
+        """
+        Download ``url`` and return its body
+
+        Raises:
+            FetchTooLargeError: if the body is larger than ``max_bytes``
+            FetchError: for invalid URLs, network errors and non-2xx responses
+        """
+        with self._lock:
+            cached = self._validated.get(url)
+        headers = {}
+        if cached is not None:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            async with self._get_client().stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and cached is not None:
+                    self.not_modified += 1
+                    with self._lock:
+                        if url in self._validated:
+                            self._validated.move_to_end(url)
+                    return cached["body"]
+
+                response.raise_for_status()
+
+                content_length = response.headers.get("content-length")
+                if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                    raise FetchTooLargeError(
+                        f"Image is {content_length} bytes, limit is {self.max_bytes}"
+                    )
+
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body.extend(chunk)
+                    if len(body) > self.max_bytes:
+                        raise FetchTooLargeError(f"Image exceeds the {self.max_bytes} byte limit")
+        except httpx.HTTPStatusError as e:
+            raise FetchError(f"{e.response.status_code} error for url: {url}") from e
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            raise FetchError(str(e) or e.__class__.__name__) from e
+
+        body = bytes(body)
+        self.downloads += 1
+        self.bytes_downloaded += len(body)
+        self._remember(url, response, body)
+        return body
+
+    def stats(self) -> Dict[str, int]:
+        """Download counters for health reporting"""
+        with self._lock:
+            cached_urls = len(self._validated)
+            cached_bytes = self._cached_bytes
+        return {
+            "downloads": self.downloads,
+            "not_modified": self.not_modified,
+            "bytes_downloaded": self.bytes_downloaded,
+            "cached_urls": cached_urls,
+            "cached_bytes": cached_bytes
+        }
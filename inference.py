@@ -0,0 +1,147 @@
+"""
+Bounded worker pool for blocking model inference.
+
+Ollama calls are synchronous and can take several seconds, so they are run on a
+dedicated thread pool instead of the event loop. The pool caps how many
+inferences run at once and how many may wait for a slot; once both are full new
+work is rejected immediately so the API can answer with 503 instead of queueing
+forever.
+
+Concurrent requests for the same image are coalesced with ``SingleFlight`` so a
+burst of identical uploads costs a single inference.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+# Pool configuration
+MAX_CONCURRENT_INFERENCES = int(os.getenv("MAX_CONCURRENT_INFERENCES", "2"))
+MAX_QUEUED_INFERENCES = int(os.getenv("MAX_QUEUED_INFERENCES", "16"))
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the inference pool and its wait queue are both full"""
+
+
+class InferencePool:
+    """Run blocking callables on a bounded thread pool with a queue-depth cap"""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_INFERENCES, max_queue: int = MAX_QUEUED_INFERENCES):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="inference"
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of tasks currently running on a worker thread"""
+        return min(self._pending, self.max_concurrency)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of tasks waiting for a free worker thread"""
+        return max(0, self._pending - self.max_concurrency)
+
+    def has_capacity(self) -> bool:
+        """Whether ``run`` would currently accept another task"""
+        return self._pending < self.max_concurrency + self.max_queue
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run ``func(*args, **kwargs)`` on the pool and await its result
+
+        The slot is held until the call returns on its worker thread, so a
+        caller that is cancelled while the call runs does not free it early.
+
+        Raises:
+            PoolSaturatedError: if all workers are busy and the queue is full
+        """
+        with self._lock:
+            if not self.has_capacity():
+                raise PoolSaturatedError(
+                    f"Inference queue is full ({self.max_queue} waiting)"
+                )
+            self._pending += 1
+
+        future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run_timed(self, func: Callable[..., Any], *args, **kwargs) -> Tuple[Any, float, float]:
+        """
+        Like ``run``, but also report where the time went
+
+        Returns:
+            Tuple of (result, seconds waiting for a worker, seconds running)
+        """
+        def timed_call():
+            started = time.perf_counter()
+            return func(*args, **kwargs), started
+
+        submitted = time.perf_counter()
+        result, started = await self.run(timed_call)
+        return result, started - submitted, time.perf_counter() - started
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the pool state for health reporting"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth
+        }
+
+    def shutdown(self) -> None:
+        """Stop accepting work and release the worker threads"""
+        self._executor.shutdown(wait=False)
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution"""
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Future"] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await ``func()`` for ``key``, joining an identical call already in flight
+
+        The shared call is shielded so a caller that disconnects does not cancel
+        the work for everyone else waiting on it.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: "asyncio.Future") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of in-flight and coalesced call counts"""
+        return {
+            "in_flight": len(self._calls),
+            "coalesced": self.coalesced
+        }
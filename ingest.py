@@ -0,0 +1,185 @@
+"""
+Image ingestion shared by the API and the analysis scripts.
+
+Only the image header is read to describe the upload. The original bytes are
+forwarded to the model untouched whenever the format is one Ollama accepts, and
+the image is decoded and transcoded only for formats it does not (TIFF, BMP,
+multi-frame files, CMYK JPEGs, ...).
+
+Uploads are checked before anything is decoded: ``sniff_format`` recognizes
+the file from its magic bytes, and ``open_image`` rejects images whose header
+declares more than ``MAX_IMAGE_PIXELS`` pixels (decompression bombs).
+"""
+
+import io
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+# Upload limits
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))
+
+# Pillow's own guard, for code paths that open images directly (0 keeps
+# Pillow's default)
+if MAX_IMAGE_PIXELS > 0:
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Leading bytes of the file types accepted anywhere in the API
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+    (b"%PDF-", "pdf"),
+    (b"PK\x03\x04", "zip")
+)
+IMAGE_KINDS = frozenset({"png", "jpeg", "gif", "tiff", "bmp", "webp"})
+
+# Formats and modes forwarded to the model as-is
+PASSTHROUGH_MODES = {
+    "PNG": {"1", "L", "LA", "P", "RGB", "RGBA"},
+    "JPEG": {"L", "RGB"}
+}
+
+
+class InvalidImageError(ValueError):
+    """Raised when the submitted bytes cannot be read as an image"""
+
+
+class ImageTooLargeError(InvalidImageError):
+    """Raised when an image declares more pixels than ``MAX_IMAGE_PIXELS``"""
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload is larger than ``MAX_UPLOAD_BYTES``"""
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """File type from the first bytes of a file, or None if unrecognized"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, kind in SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+def open_image(image_data: bytes, max_pixels: int = MAX_IMAGE_PIXELS) -> Image.Image:
+    """
+    Open an image lazily (header only) after checking its declared size
+
+    Raises:
+        InvalidImageError: if the bytes are not a readable image
+        ImageTooLargeError: if the image has more than ``max_pixels`` pixels
+    """
+    try:
+        image = Image.open(io.BytesIO(image_data))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"Image exceeds the {max_pixels} pixel limit") from e
+    except Exception as e:
+        raise InvalidImageError(str(e)) from e
+    width, height = image.size
+    if max_pixels > 0 and width * height > max_pixels:
+        raise ImageTooLargeError(f"{width}x{height} image exceeds the {max_pixels} pixel limit")
+    return image
+
+
+def check_upload_head(head: bytes, kinds=IMAGE_KINDS, max_pixels: int = MAX_IMAGE_PIXELS) -> str:
+    """
+    Validate the first bytes of an upload before the rest is read
+
+    The file type comes from the magic bytes, and for images whose header fits
+    in ``head`` the declared dimensions are checked against ``max_pixels``.
+    Headers that do not fit are checked again when the full file is opened.
+
+    Returns:
+        The detected file type
+
+    Raises:
+        InvalidImageError: if the file type is not one of ``kinds``
+        ImageTooLargeError: if the image header declares too many pixels
+    """
+    kind = sniff_format(head)
+    if kind not in kinds:
+        raise InvalidImageError(f"Unsupported file type ({kind or 'unknown'}), expected one of: {', '.join(sorted(kinds))}")
+    if kind in IMAGE_KINDS:
+        try:
+            open_image(head, max_pixels)
+        except ImageTooLargeError:
+            raise
+        except InvalidImageError:
+            pass
+    return kind
+
+
+def _transcode(image: Image.Image) -> bytes:
+    """Decode the first frame and re-encode it in a format the model accepts"""
+    image.seek(0)
+    image_bytes_io = io.BytesIO()
+    if image.format == "JPEG":
+        # Keep photos lossy, but in a colour space the model can read
+        image.convert("RGB").save(image_bytes_io, format="JPEG", quality=95)
+    else:
+        if image.mode not in PASSTHROUGH_MODES["PNG"]:
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        image.save(image_bytes_io, format="PNG")
+    return image_bytes_io.getvalue()
+
+
+def describe_image(image_data: bytes) -> Dict[str, Any]:
+    """
+    Read size, mode and format from the image header without decoding pixels
+
+    Raises:
+        InvalidImageError: if the bytes are not a readable image
+    """
+    image = open_image(image_data)
+    return {
+        "size": image.size,
+        "mode": image.mode,
+        "format": image.format
+    }
+
+
+def ingest_image(image_data: bytes) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Describe an image from its header and return bytes ready for the model
+
+    Args:
+        image_data: Raw bytes as uploaded or downloaded
+
+    Returns:
+        Tuple of (image_bytes, image_info). ``image_bytes`` is ``image_data``
+        itself unless the image had to be transcoded.
+
+    Raises:
+        InvalidImageError: if the bytes are not a readable image
+    """
+    image = open_image(image_data)
+
+    # Get image info (header only, no pixel decode)
+    image_info = {
+        "size": image.size,
+        "mode": image.mode,
+        "format": image.format
+    }
+
+    passthrough = (
+        image.mode in PASSTHROUGH_MODES.get(image.format, ())
+        and getattr(image, "n_frames", 1) == 1
+    )
+    if passthrough:
+        image_info["transcoded"] = False
+        return image_data, image_info
+
+    try:
+        image_bytes = _transcode(image)
+    except Exception as e:
+        raise InvalidImageError(str(e)) from e
+    image_info["transcoded"] = True
+    return image_bytes, image_info
@@ -0,0 +1,383 @@
+"""
+Asynchronous analysis jobs.
+
+``POST /jobs`` stores the upload and returns a job id immediately; a background
+scheduler drains the queue with bounded concurrency and records status, timings
+and the result in a job store that clients poll with ``GET /jobs/{id}``. The
+store is in-memory by default, or SQLite when ``JOB_STORE_PATH`` is set so that
+queued work and finished results survive a restart.
+
+Several worker processes may share one SQLite store: a job is claimed
+atomically before it runs, so each job runs once even when more than one
+worker has it queued.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+# Job configuration
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "")
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", os.getenv("MAX_CONCURRENT_INFERENCES", "2")))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "1000"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "86400"))
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobQueueFullError(Exception):
+    """Raised when no more jobs can be queued"""
+
+
+class JobStore(ABC):
+    """Interface for job persistence; stores hold job records and their inputs"""
+
+    @abstractmethod
+    def create(self, job: Dict[str, Any], payload: bytes) -> None:
+        """Store a new job record and its upload"""
+
+    @abstractmethod
+    def update(self, job_id: str, **fields) -> None:
+        """Merge ``fields`` into a job record"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job record, or None if it is unknown"""
+
+    @abstractmethod
+    def payload(self, job_id: str) -> Optional[bytes]:
+        """Upload of a job, or None once it has been dropped"""
+
+    @abstractmethod
+    def drop_payload(self, job_id: str) -> None:
+        """Delete the upload of a finished job"""
+
+    @abstractmethod
+    def claim(self, job_id: str, worker_pid: int, started_at: float) -> bool:
+        """Mark a queued job as running; False if it is no longer queued"""
+
+    @abstractmethod
+    def requeue(self, job_id: str, worker_pid: Optional[int]) -> bool:
+        """Put a job running under ``worker_pid`` back in the queue; False if it is not"""
+
+    @abstractmethod
+    def unfinished(self) -> List[str]:
+        """Ids of queued or running jobs, oldest first"""
+
+    @abstractmethod
+    def purge(self, older_than: float) -> None:
+        """Remove finished jobs that completed before ``older_than``"""
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryJobStore(JobStore):
+    """Job store kept in process memory; lost on restart"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._payloads: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job, payload):
+        with self._lock:
+            self._jobs[job["job_id"]] = dict(job)
+            self._payloads[job["job_id"]] = payload
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def payload(self, job_id):
+        with self._lock:
+            return self._payloads.get(job_id)
+
+    def drop_payload(self, job_id):
+        with self._lock:
+            self._payloads.pop(job_id, None)
+
+    def claim(self, job_id, worker_pid, started_at):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != QUEUED:
+                return False
+            job.update(status=RUNNING, started_at=started_at, worker_pid=worker_pid)
+            return True
+
+    def requeue(self, job_id, worker_pid):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != RUNNING or job.get("worker_pid") != worker_pid:
+                return False
+            job.update(status=QUEUED, started_at=None, worker_pid=None)
+            return True
+
+    def unfinished(self):
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job["status"] in (QUEUED, RUNNING)]
+        return [job["job_id"] for job in sorted(jobs, key=lambda job: job["created_at"])]
+
+    def purge(self, older_than):
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in (COMPLETED, FAILED) and (job["finished_at"] or 0) < older_than
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._payloads.pop(job_id, None)
+
+
+class SQLiteJobStore(JobStore):
+    """Job store backed by a SQLite file so jobs survive restarts"""
+
+    def __init__(self, path: str):
+        # Worker processes share the file, so wait on each other's writes
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, "
+            "finished_at REAL, record TEXT NOT NULL, payload BLOB)"
+        )
+        self._db.commit()
+
+    def create(self, job, payload):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (job_id, status, created_at, finished_at, record, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job["job_id"], job["status"], job["created_at"], job["finished_at"], json.dumps(job), payload)
+            )
+            self._db.commit()
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            row = self._db.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            job.update(fields)
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, record = ? WHERE job_id = ?",
+                (job["status"], job["finished_at"], json.dumps(job), job_id)
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def payload(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bytes(row[0]) if row is not None and row[0] is not None else None
+
+    def drop_payload(self, job_id):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET payload = NULL WHERE job_id = ?", (job_id,))
+            self._db.commit()
+
+    def claim(self, job_id, worker_pid, started_at):
+        # A single conditional UPDATE, so two processes cannot both claim a job
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, "
+                "record = json_set(record, '$.status', ?, '$.started_at', ?, '$.worker_pid', ?) "
+                "WHERE job_id = ? AND status = ?",
+                (RUNNING, RUNNING, started_at, worker_pid, job_id, QUEUED)
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def requeue(self, job_id, worker_pid):
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, "
+                "record = json_set(record, '$.status', ?, '$.started_at', NULL, '$.worker_pid', NULL) "
+                "WHERE job_id = ? AND status = ? AND json_extract(record, '$.worker_pid') IS ?",
+                (QUEUED, QUEUED, job_id, RUNNING, worker_pid)
+            )
+            self._db.commit()
+        return cursor.rowcount == 1
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (QUEUED, RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge(self, older_than):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (COMPLETED, FAILED, older_than)
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def create_job_store(path: str = JOB_STORE_PATH) -> JobStore:
+    """SQLite store when a path is configured, in-memory otherwise"""
+    return SQLiteJobStore(path) if path else InMemoryJobStore()
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """Whether a process with this pid exists on this host"""
+    if not pid or pid == os.getpid():
+        # Our own pid can only come from an earlier run, e.g. in a container
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobScheduler:
+    """Drain queued jobs with a fixed number of background workers"""
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[bytes], Awaitable[Dict[str, Any]]],
+        concurrency: int = JOB_CONCURRENCY,
+        max_queued: int = MAX_QUEUED_JOBS,
+        result_ttl: float = JOB_RESULT_TTL
+    ):
+        self.store = store
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """
+        Start the workers and requeue jobs left unfinished by a previous run
+
+        Jobs still running in another live worker process are left to it.
+        """
+        self._queue = asyncio.Queue()
+        for job_id in await run_in_threadpool(self.store.unfinished):
+            job = await run_in_threadpool(self.store.get, job_id)
+            if job is None:
+                continue
+            if job["status"] == RUNNING:
+                worker_pid = job.get("worker_pid")
+                if _process_alive(worker_pid) or not await run_in_threadpool(self.store.requeue, job_id, worker_pid):
+                    continue
+            self._queue.put_nowait(job_id)
+        self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        """Cancel the workers; unfinished jobs stay queued in the store"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await run_in_threadpool(self.store.close)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, filename: str, payload: bytes) -> Dict[str, Any]:
+        """
+        Store a new job and queue it for processing
+
+        Raises:
+            JobQueueFullError: if ``max_queued`` jobs are already waiting
+        """
+        if self.queue_depth >= self.max_queued:
+            raise JobQueueFullError(f"Job queue is full ({self.max_queued} waiting)")
+
+        now = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "filename": filename,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "worker_pid": None,
+            "timings": None,
+            "result": None,
+            "error": None
+        }
+        await run_in_threadpool(self.store.create, job, payload)
+        await run_in_threadpool(self.store.purge, now - self.result_ttl)
+        self._queue.put_nowait(job["job_id"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current record for a job, or None if it is unknown or expired"""
+        return await run_in_threadpool(self.store.get, job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = await run_in_threadpool(self.store.get, job_id)
+        payload = await run_in_threadpool(self.store.payload, job_id)
+        if job is None or payload is None:
+            return
+
+        started = time.time()
+        if not await run_in_threadpool(self.store.claim, job_id, os.getpid(), started):
+            # Already taken by another worker sharing the store
+            return
+        fields: Dict[str, Any] = {}
+        try:
+            fields["result"] = await self.handler(payload)
+            fields["status"] = COMPLETED
+        except asyncio.CancelledError:
+            # Leave the job queued so it is picked up again on the next start
+            await run_in_threadpool(self.store.requeue, job_id, os.getpid())
+            raise
+        except Exception as e:
+            fields["status"] = FAILED
+            fields["error"] = str(e)
+
+        finished = time.time()
+        fields["finished_at"] = finished
+        fields["timings"] = {
+            "queued_ms": round((started - job["created_at"]) * 1000, 1),
+            "run_ms": round((finished - started) * 1000, 1),
+            "total_ms": round((finished - job["created_at"]) * 1000, 1)
+        }
+        await run_in_threadpool(self.store.update, job_id, **fields)
+        await run_in_threadpool(self.store.drop_payload, job_id)
@@ -1,154 +1,158 @@
-import ollama
-from PIL import Image
-import io
-import os
-from opik import track
-from dotenv import load_dotenv
-import weaviate
-from weaviate.classes.init import Auth
-from opik.evaluation.metrics import (Hallucination)
-from opik.evaluation import evaluate
-from opik import Opik
-
-
-# Load environment variables from .env file
-load_dotenv()
-weaviate_url = os.getenv("WEAVIATE_URL")
-weaviate_api_key = os.getenv("WEAVIATE_API_KEY")    
+"""
+Analyze checkbox documents with Opik tracing and store the results in Weaviate.
 
+Importing this module has no side effects: the Ollama model, the Opik client
+and the Weaviate connection are created on first use and cached, so
+``analyze_checkbox_document`` can be reused from the API and tests. Run it as
+a script to analyze images:
 
-weaviate_client = weaviate.connect_to_weaviate_cloud(
-    cluster_url=weaviate_url,
-    auth_credentials=Auth.api_key(weaviate_api_key),
-)
+    python main.py sample_photos/3.png [--no-store] [--no-trace] [--evaluate]
+"""
 
-weaviate_client.connect()
+import argparse
+from functools import lru_cache
 
+from ingest import ingest_image
+from parsing import parse_analysis
+from prompts import DOCUMENT_VERIFIER_PROMPT, MODEL_NAME
+from sinks import RESULT_SINK_COLLECTION, ResultSink, WeaviateSink, connect_weaviate, result_record
 
-print(weaviate_client.is_ready())  # Should print: `True`
+# Weaviate collection the results are written to, shared with the API's sink
+COLLECTION_NAME = RESULT_SINK_COLLECTION
 
+# Opik dataset used by --evaluate
+DATASET_NAME = "checkbox"
 
-# Load environment variables from .env file
-load_dotenv()
 
-# Set environment variables for Opik from .env
-os.environ["OPIK_API_KEY"] = os.getenv("OPIK_API_KEY")
-os.environ["OPIK_WORKSPACE"] = os.getenv("OPIK_WORKSPACE")
+@lru_cache(maxsize=None)
+def load_environment() -> None:
+    """Load environment variables (Weaviate and Opik credentials) from .env"""
+    from dotenv import load_dotenv
 
+    load_dotenv()
 
-# Load the granite3.2-vision:2b model
-model_name = "granite3.2-vision:2b"  # Updated to use the correct model name
 
-# Pull the model if not already available
-ollama.pull(model_name)
+@lru_cache(maxsize=None)
+def ensure_model(model_name: str = MODEL_NAME) -> str:
+    """Pull the model if not already available (once per process)"""
+    import ollama
 
-# Run a simple prompt using the model
-response = ollama.chat(model=model_name, messages=[
-    {"role": "user", "content": "Hello, how are you?"}
-])
+    ollama.pull(model_name)
+    return model_name
 
-#print(response['message']['content'])
 
+@lru_cache(maxsize=None)
+def get_opik_client():
+    """Opik client, created on first use"""
+    load_environment()
+    from opik import Opik
 
-# Read the image '1.jpg'
-image_path = "/Users/emtiazahamed/Desktop/check-box-detection/sample_photos/3.png"
+    return Opik()
 
-# Create a prompt for the LLM to act as an intelligent document verifier
-document_verifier_prompt = """
-You are an intelligent document verifier. Your job is to analyze images of documents and determine their meaning.
 
-Specifically, you can understand checkboxes in photos. You can identify which options are checked or unchecked.
+@lru_cache(maxsize=None)
+def get_weaviate_client():
+    """Connected Weaviate Cloud client, created on first use"""
+    load_environment()
+    return connect_weaviate()
 
-IMPORTANT: Only analyze checkboxes that are actually visible in the image. Do not include any fields or options that are not present.
 
-Options may be True/False or multiple choice. For grouped options (like Gender, Race, etc.), use nested JSON structure.
+@lru_cache(maxsize=None)
+def get_result_sink():
+    """Batched background writer to the Weaviate collection, created on first use"""
+    return ResultSink(WeaviateSink(COLLECTION_NAME, client_factory=get_weaviate_client))
 
-For example, if the image contains:
-- A simple checkbox for "Option A" that is checked
-- A simple checkbox for "Option B" that is unchecked  
-- A grouped set like "Gender" with "Male" unchecked and "Female" checked
 
-Your response should look like this:
-{
-    "Option A": "Checked",
-    "Option B": "Unchecked",
-    "Gender": {
-        "Male": "Unchecked",
-        "Female": "Checked"
-    }
-}
+@lru_cache(maxsize=None)
+def _traced_analysis():
+    """``_analyze_checkbox_document`` wrapped in an Opik trace"""
+    load_environment()
+    from opik import track
 
-Use "Checked" for selected options and "Unchecked" for unselected options. For grouped options, create nested objects with the group name as the key.
+    return track(name="analyze_checkbox_document")(_analyze_checkbox_document)
 
-ONLY include checkboxes and options that are actually visible in the image. Do not add any fields that are not present. Don't add any text that doesn't appear in the image.
 
-Analyze the attached image and provide your results. Be as brief and accurate as possible. Do not include any additional text or explanations.
-"""
+def _analyze_checkbox_document(image_path, model_name, document_verifier_prompt):
+    import ollama
 
+    # Load the image, transcoding only if the model can't read it as-is
+    with open(image_path, 'rb') as f:
+        image_bytes, image_info = ingest_image(f.read())
+    print(f"Image size: {image_info['size']}, mode: {image_info['mode']}")
 
-opik_client = Opik()
-
-@track
-def analyze_checkbox_document(image_path, model_name, document_verifier_prompt):
-    """Analyze checkboxes in document image with Opik tracing"""
-    # Load and process the image
-    image = Image.open(image_path)
-    print(f"Image size: {image.size}, mode: {image.mode}")
-    
-    # Convert the image to bytes for sending to the LLM
-    image_bytes_io = io.BytesIO()
-    if image.format == 'PNG':
-        image.save(image_bytes_io, format='PNG')
-    else:
-        image.save(image_bytes_io, format='JPEG')
-    image_bytes = image_bytes_io.getvalue()
-    
-    # Send the prompt and image to the LLM (now with tracing)
     response = ollama.chat(
-            model=model_name,
+            model=ensure_model(model_name),
             messages=[
                     {"role": "user", "content": document_verifier_prompt, "images": [image_bytes]}
             ]
     )
-    
-    return response['message']['content']
 
-# Execute the analysis with tracing
-result = analyze_checkbox_document(image_path, model_name, document_verifier_prompt)
-print(result)
-
-def evaluation_task(dataset_item):
-    # your LLM application is called here
-
-    result_to_eval = {
-
-        "input": image_path,
-        "output": result,
-        "context": "Nothing"
-    }
+    return response['message']['content']
 
-    return result_to_eval
 
-dataset = opik_client.get_dataset(name="checkbox")
+def analyze_checkbox_document(image_path, model_name=MODEL_NAME, document_verifier_prompt=DOCUMENT_VERIFIER_PROMPT, trace=True):
+    """Analyze checkboxes in document image, with Opik tracing unless ``trace`` is False"""
+    analyze = _traced_analysis() if trace else _analyze_checkbox_document
+    return analyze(image_path, model_name, document_verifier_prompt)
 
-metrics = [Hallucination()]
 
-# eval_results = evaluate(
-#   experiment_name="my_evaluation",
-#   dataset=dataset,
-#   task=evaluation_task,
-#   scoring_metrics=metrics
-# )
+def store_result(image_path, result, model_name=MODEL_NAME):
+    """Queue an analysis result for the Weaviate collection; written in batches in the background"""
+    # Parsed like the API's results so both line up in the collection
+    get_result_sink().submit(result_record(image_path, parse_analysis(result), "llm", model_name))
 
 
-questions = weaviate_client.collections.get("Checkbox_task_collection")
+def run_evaluation(image_path, result, dataset_name=DATASET_NAME):
+    """Score a result against the Opik dataset with the Hallucination metric"""
+    from opik.evaluation import evaluate
+    from opik.evaluation.metrics import Hallucination
 
-with questions.batch.fixed_size(batch_size=200) as batch:
-    batch.add_object(
-        {
-            "filepath": image_path,
+    def evaluation_task(dataset_item):
+        return {
+            "input": image_path,
             "output": result,
+            "context": "Nothing"
         }
+
+    return evaluate(
+        experiment_name="my_evaluation",
+        dataset=get_opik_client().get_dataset(name=dataset_name),
+        task=evaluation_task,
+        scoring_metrics=[Hallucination()]
     )
 
-weaviate_client.close()  # Free up resources
+
+def close_clients() -> None:
+    """Write queued results and close the Weaviate connection if one was opened"""
+    if get_result_sink.cache_info().currsize:
+        # Closing the sink flushes it and closes the client it used
+        get_result_sink().close()
+        get_result_sink.cache_clear()
+    elif get_weaviate_client.cache_info().currsize:
+        get_weaviate_client().close()  # Free up resources
+    get_weaviate_client.cache_clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze checkbox documents with Opik tracing")
+    parser.add_argument("images", nargs="+", help="Image files to analyze")
+    parser.add_argument("--model", default=MODEL_NAME, help="Ollama model name")
+    parser.add_argument("--no-trace", action="store_true", help="Skip Opik tracing")
+    parser.add_argument("--no-store", action="store_true", help="Skip writing results to Weaviate")
+    parser.add_argument("--evaluate", action="store_true", help=f"Run the Opik evaluation on the '{DATASET_NAME}' dataset")
+    args = parser.parse_args(argv)
+
+    try:
+        for image_path in args.images:
+            result = analyze_checkbox_document(image_path, args.model, trace=not args.no_trace)
+            print(result)
+            if not args.no_store:
+                store_result(image_path, result, args.model)
+            if args.evaluate:
+                run_evaluation(image_path, result)
+    finally:
+        close_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Minimal Prometheus-style metrics.
+
+Counters, gauges and histograms are kept in process and rendered in the
+Prometheus text exposition format by ``MetricsRegistry.render`` for the
+``/metrics`` endpoint. Metrics are thread-safe because observations are made
+both on the event loop and on inference worker threads.
+
+When the API runs as several worker processes, ``METRICS_DB_PATH`` names a
+SQLite file the workers share: each one writes a snapshot of its samples
+every ``METRICS_FLUSH_INTERVAL`` seconds, and ``render`` adds up the
+snapshots of all of them. Counters and histograms of workers that have exited
+are kept so totals never go backwards; gauges only count live workers.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Shared metrics configuration
+METRICS_DB_PATH = os.getenv("METRICS_DB_PATH", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))
+
+# Default latency buckets in seconds, from cache hits up to slow CPU inference
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Buckets for token counts reported by Ollama
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Tuple[str, Tuple[str, ...], Optional[Tuple[str, str]], float]]:
+        with self._lock:
+            return [("", key, None, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, optionally read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self._func = func
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def samples(self):
+        value = self._func() if self._func is not None else self._value
+        return [("", (), None, value)]
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts followed by the running sum and count
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    rows.append(("_bucket", key, ("le", _format_value(bound)), cumulative))
+                rows.append(("_sum", key, None, series[-2]))
+                rows.append(("_count", key, None, series[-1]))
+        return rows
+
+
+class SharedSamples:
+    """SQLite table of per-process metric snapshots, shared by worker processes"""
+
+    def __init__(self, path: str, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        # Unique per process, so a recycled pid never overwrites an old snapshot
+        self.process_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS samples ("
+            "process TEXT NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL, suffix TEXT NOT NULL, "
+            "labels TEXT NOT NULL, extra TEXT NOT NULL, value REAL NOT NULL, "
+            "PRIMARY KEY (process, name, suffix, labels, extra))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS processes (process TEXT PRIMARY KEY, updated REAL NOT NULL)")
+        self._db.commit()
+
+    def write(self, metrics: List[_Metric]) -> None:
+        """Replace this process's snapshot with the current samples"""
+        rows = [
+            (self.process_id, metric.name, metric.kind, suffix, json.dumps(key), json.dumps(extra or []), value)
+            for metric in metrics
+            for suffix, key, extra, value in metric.samples()
+        ]
+        with self._lock:
+            if self._db is None:
+                return
+            with self._db:
+                self._db.execute("DELETE FROM samples WHERE process = ?", (self.process_id,))
+                self._db.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.execute("INSERT OR REPLACE INTO processes VALUES (?, ?)", (self.process_id, time.time()))
+
+    def totals(self) -> Dict[str, List[Tuple[str, Tuple[str, ...], Optional[Tuple[str, str]], float]]]:
+        """Samples summed over processes, by metric name; gauges of stale processes are left out"""
+        live_since = time.time() - max(5.0, 3 * self.flush_interval)
+        with self._lock:
+            if self._db is None:
+                return {}
+            rows = self._db.execute(
+                "SELECT name, suffix, labels, extra, SUM(value) FROM samples "
+                "JOIN processes USING (process) "
+                "WHERE kind != 'gauge' OR updated >= ? "
+                "GROUP BY name, suffix, labels, extra",
+                (live_since,)
+            ).fetchall()
+        totals: Dict[str, list] = {}
+        for name, suffix, labels, extra, value in rows:
+            extra = tuple(json.loads(extra)) or None
+            totals.setdefault(name, []).append((suffix, tuple(json.loads(labels)), extra, value))
+        for samples in totals.values():
+            samples.sort(key=_sample_order)
+        return totals
+
+    def close(self) -> None:
+        """Stop counting this process's gauges and close the database"""
+        with self._lock:
+            if self._db is not None:
+                with self._db:
+                    self._db.execute(
+                        "DELETE FROM samples WHERE process = ? AND kind = 'gauge'", (self.process_id,)
+                    )
+                    self._db.execute("UPDATE processes SET updated = 0 WHERE process = ?", (self.process_id,))
+                self._db.close()
+                self._db = None
+
+
+def _sample_order(sample) -> Tuple:
+    """Sort key giving each label set its buckets in order, then _sum and _count"""
+    suffix, key, extra, _ = sample
+    bound = float(extra[1]) if extra is not None else 0.0
+    return (key, {"_sum": 1, "_count": 2}.get(suffix, 0), bound)
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together
+
+    With a ``path``, samples are shared with the other processes using the same
+    file and ``render`` reports the totals over all of them.
+    """
+
+    def __init__(self, path: str = METRICS_DB_PATH, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self._metrics: List[_Metric] = []
+        self._shared: Optional[SharedSamples] = None
+        self._stop = threading.Event()
+        if path:
+            self._shared = SharedSamples(path, flush_interval)
+            threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        interval = self._shared.flush_interval
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Warning: Could not write shared metrics: {e}")
+
+    def flush(self) -> None:
+        """Write this process's samples to the shared file, if there is one"""
+        if self._shared is not None:
+            self._shared.write(self._metrics)
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, func))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        totals = None
+        if self._shared is not None:
+            self.flush()
+            totals = self._shared.totals()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.header())
+            samples = metric.samples() if totals is None else totals.get(metric.name, [])
+            for suffix, key, extra, value in samples:
+                labels = _format_labels(metric.labelnames, key, extra)
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        """Write a last snapshot and stop sharing samples"""
+        if self._shared is not None:
+            self._stop.set()
+            self.flush()
+            self._shared.close()
+            self._shared = None
@@ -0,0 +1,248 @@
+"""
+Parsing of model completions into checkbox results.
+
+``parse_analysis`` turns a complete completion into a result in one pass: it
+takes the first balanced JSON object, so code fences and prose around it are
+ignored, repairs trailing commas, and normalizes every checkbox value to
+``Checked`` or ``Unchecked``. ``IncrementalJSONParser`` consumes a completion
+as it streams in and reports each top-level member of the JSON object (a single
+checkbox or a whole group) as soon as it is closed, so clients can render
+fields before the model has finished generating. Like ``parse_analysis``, it
+skips braces in prose before the object: when the first member of a candidate
+object does not decode, the candidate is dropped and scanning resumes after it.
+
+``output_format`` gives the ``format`` argument for Ollama's constrained
+decoding, selected with ``STRUCTURED_OUTPUT``: ``json`` (any valid JSON),
+``schema`` (the checkbox result schema; needs Ollama 0.5 or later) or ``off``.
+
+With ``PROMPT_STYLE=compact`` the model is asked for minified JSON with ``1``
+and ``0`` instead of ``"Checked"`` and ``"Unchecked"``, which cuts the tokens
+it generates per box; normalization expands the answer back into the usual
+result.
+"""
+
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# Constrained decoding mode sent to Ollama
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "json")
+
+# Answer format asked of the model: "full" (state names) or "compact" (1/0)
+PROMPT_STYLE = os.getenv("PROMPT_STYLE", "full")
+
+CHECKED = "Checked"
+UNCHECKED = "Unchecked"
+
+# JSON schema of a checkbox result: options, or groups of options, mapped to a state
+CHECKBOX_RESULT_SCHEMA = {
+    "type": "object",
+    "additionalProperties": {
+        "anyOf": [
+            {"type": "string", "enum": [CHECKED, UNCHECKED]},
+            {
+                "type": "object",
+                "additionalProperties": {"type": "string", "enum": [CHECKED, UNCHECKED]}
+            }
+        ]
+    }
+}
+
+# Compact variant: options, or groups of options, mapped to 1 (checked) or 0
+COMPACT_RESULT_SCHEMA = {
+    "type": "object",
+    "additionalProperties": {
+        "anyOf": [
+            {"type": "integer", "enum": [0, 1]},
+            {
+                "type": "object",
+                "additionalProperties": {"type": "integer", "enum": [0, 1]}
+            }
+        ]
+    }
+}
+
+# Spellings models use for the two states, compared case-insensitively
+CHECKED_VALUES = {"checked", "1", "check", "yes", "y", "true", "x", "[x]", "selected", "ticked", "marked", "filled", "on", "☑", "☒", "✓", "✔"}
+UNCHECKED_VALUES = {"unchecked", "0", "not checked", "no", "n", "false", "", "[ ]", "[]", "unselected", "not selected", "unticked", "empty", "blank", "off", "☐"}
+
+TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def output_format(mode: str = STRUCTURED_OUTPUT, style: str = PROMPT_STYLE) -> Union[str, Dict[str, Any]]:
+    """``format`` argument for Ollama chat calls"""
+    if mode == "schema":
+        return COMPACT_RESULT_SCHEMA if style == "compact" else CHECKBOX_RESULT_SCHEMA
+    if mode == "json":
+        return "json"
+    return ""
+
+
+def normalize_state(value: Any) -> Any:
+    """
+    Map the ways a model may describe a checkbox onto ``Checked``/``Unchecked``
+
+    Groups are normalized recursively, and a list of options inside a group is
+    read as the options that are checked. Values that are not recognizable as
+    a state are left unchanged.
+    """
+    if isinstance(value, dict):
+        return {str(key).strip(): normalize_state(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return {str(item).strip(): CHECKED for item in value}
+    if isinstance(value, bool):
+        return CHECKED if value else UNCHECKED
+    if isinstance(value, (int, float)) and value in (0, 1):
+        # Compact answers
+        return CHECKED if value else UNCHECKED
+    if value is None:
+        return UNCHECKED
+    if isinstance(value, str):
+        text = value.strip().strip(".").casefold()
+        if text in CHECKED_VALUES:
+            return CHECKED
+        if text in UNCHECKED_VALUES:
+            return UNCHECKED
+    return value
+
+
+def _balanced_objects(text: str):
+    """Yield every balanced ``{...}`` span that starts outside another one, in order"""
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        end = None
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    end = index + 1
+                    break
+        if end is None:
+            return
+        yield text[start:end]
+        start = text.find("{", end)
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """First balanced JSON object in ``text`` that decodes, or None"""
+    for candidate in _balanced_objects(text):
+        for attempt in (candidate, TRAILING_COMMA.sub(r"\1", candidate)):
+            try:
+                value = json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(value, dict):
+                return value
+    return None
+
+
+def parse_analysis(text: str) -> Dict[str, Any]:
+    """
+    Parse a completion into a normalized checkbox result
+
+    Returns:
+        The result, or ``{"raw_response": text}`` if it holds no JSON object
+    """
+    value = extract_json_object(text)
+    if value is None:
+        return {"raw_response": text}
+    return normalize_state(value)
+
+
+class IncrementalJSONParser:
+    """Emit completed top-level ``key: value`` members of a streamed JSON object"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start = None
+        self._decoded = False
+        self._discarding = False
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """
+        Add the next chunk of the completion
+
+        Returns:
+            List of (key, value) pairs for members completed by this chunk
+        """
+        completed: List[Tuple[str, Any]] = []
+        if self.done:
+            return completed
+
+        self._buffer += text
+        while self._position < len(self._buffer):
+            char = self._buffer[self._position]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                # Skip code fences or prose until the object starts
+                if char == "{":
+                    self._depth = 1
+                    self._member_start = self._position + 1
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    members = None if self._discarding else self._close_member()
+                    if members is None and not self._decoded:
+                        # Braces in prose, not the object; look for the next one
+                        self._discarding = False
+                    else:
+                        completed.extend(members or [])
+                        self.done = True
+                        self._position += 1
+                        break
+            elif char == "," and self._depth == 1 and not self._discarding:
+                members = self._close_member()
+                if members is None and not self._decoded:
+                    self._discarding = True
+                else:
+                    completed.extend(members or [])
+                    self._decoded = self._decoded or bool(members)
+                    self._member_start = self._position + 1
+
+            self._position += 1
+
+        return completed
+
+    def _close_member(self) -> Optional[List[Tuple[str, Any]]]:
+        """Decode the member ending at the current position; None if it is not JSON"""
+        member = self._buffer[self._member_start:self._position].strip()
+        if not member:
+            return []
+        for attempt in (member, TRAILING_COMMA.sub(r"\1", member)):
+            try:
+                return list(normalize_state(json.loads("{" + attempt + "}")).items())
+            except json.JSONDecodeError:
+                continue
+        return None
@@ -0,0 +1,164 @@
+"""
+Image normalization applied before inference.
+
+Phone photos and high-DPI scans carry far more pixels than the vision model
+uses, so images can be straightened from their EXIF orientation, converted to
+grayscale, cropped to the inked area and shrunk to a maximum long edge before
+they are sent to Ollama. Images that need none of the enabled transforms are
+passed through ``ingest_image`` untouched.
+"""
+
+import io
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image, ImageOps
+
+from ingest import InvalidImageError, ingest_image, open_image
+
+# EXIF tag holding the camera orientation
+EXIF_ORIENTATION = 0x0112
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class PreprocessConfig:
+    """Which normalization steps run before inference"""
+
+    exif_transpose: bool = True
+    grayscale: bool = False
+    max_long_edge: int = 1536
+    autocrop: bool = False
+    autocrop_threshold: int = 32
+    autocrop_padding: int = 16
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        """Build the configuration from ``PREPROCESS_*`` environment variables"""
+        return cls(
+            exif_transpose=_env_flag("PREPROCESS_EXIF_TRANSPOSE", "true"),
+            grayscale=_env_flag("PREPROCESS_GRAYSCALE", "false"),
+            max_long_edge=int(os.getenv("PREPROCESS_MAX_LONG_EDGE", "1536")),
+            autocrop=_env_flag("PREPROCESS_AUTOCROP", "false"),
+            autocrop_threshold=int(os.getenv("PREPROCESS_AUTOCROP_THRESHOLD", "32")),
+            autocrop_padding=int(os.getenv("PREPROCESS_AUTOCROP_PADDING", "16"))
+        )
+
+    def fingerprint(self) -> str:
+        """Stable string identifying the configuration, used in cache keys"""
+        return (
+            f"exif={int(self.exif_transpose)};gray={int(self.grayscale)};"
+            f"edge={self.max_long_edge};crop={int(self.autocrop)}:"
+            f"{self.autocrop_threshold}:{self.autocrop_padding}"
+        )
+
+
+def _orientation(image: Image.Image) -> int:
+    try:
+        return image.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception:
+        return 1
+
+
+def _content_bbox(image: Image.Image, threshold: int, padding: int):
+    """Bounding box of pixels noticeably darker than a white page"""
+    ink = ImageOps.invert(image.convert("L")).point(lambda p: 255 if p > threshold else 0)
+    bbox = ink.getbbox()
+    if bbox is None:
+        return None
+    left, top, right, bottom = bbox
+    return (
+        max(0, left - padding),
+        max(0, top - padding),
+        min(image.width, right + padding),
+        min(image.height, bottom + padding)
+    )
+
+
+def preprocess_image(image_data: bytes, config: PreprocessConfig) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Normalize an image for inference
+
+    Args:
+        image_data: Raw image bytes
+        config: Enabled preprocessing steps
+
+    Returns:
+        Tuple of (image_bytes, image_info). ``image_info`` carries a
+        ``preprocessing`` entry listing the applied transforms and their cost.
+
+    Raises:
+        InvalidImageError: if the bytes are not a readable image
+    """
+    started = time.perf_counter()
+    image = open_image(image_data)
+
+    needs_transpose = config.exif_transpose and _orientation(image) != 1
+    needs_resize = config.max_long_edge > 0 and max(image.size) > config.max_long_edge
+    needs_grayscale = config.grayscale and image.mode not in ("1", "L")
+
+    if not (needs_transpose or needs_resize or needs_grayscale or config.autocrop):
+        image_bytes, image_info = ingest_image(image_data)
+        image_info["preprocessing"] = {
+            "transforms": [],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        return image_bytes, image_info
+
+    image_info = {
+        "size": image.size,
+        "mode": image.mode,
+        "format": image.format
+    }
+    transforms: List[str] = []
+    try:
+        image.seek(0)
+        if needs_resize and not config.autocrop and image.format == "JPEG":
+            # Let the decoder scale by 1/2 to 1/8 while the long edge stays at
+            # least max_long_edge, so a large scan is never held at full size
+            scale = config.max_long_edge / max(image.size)
+            image.draft(image.mode, (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+        image.load()
+        source_format = image.format
+
+        if needs_transpose:
+            image = ImageOps.exif_transpose(image)
+            transforms.append("exif_transpose")
+
+        if needs_grayscale:
+            image = image.convert("L")
+            transforms.append("grayscale")
+
+        if config.autocrop:
+            bbox = _content_bbox(image, config.autocrop_threshold, config.autocrop_padding)
+            if bbox is not None and bbox != (0, 0, image.width, image.height):
+                image = image.crop(bbox)
+                transforms.append("autocrop")
+
+        if config.max_long_edge > 0 and max(image.size) > config.max_long_edge:
+            image.thumbnail((config.max_long_edge, config.max_long_edge), Image.LANCZOS)
+            transforms.append("resize")
+
+        image_bytes_io = io.BytesIO()
+        if source_format == "JPEG":
+            image.convert("L" if image.mode == "L" else "RGB").save(image_bytes_io, format="JPEG", quality=90)
+        else:
+            if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+                image = image.convert("RGB")
+            image.save(image_bytes_io, format="PNG")
+    except Exception as e:
+        raise InvalidImageError(str(e)) from e
+
+    image_info["transcoded"] = True
+    image_info["preprocessing"] = {
+        "transforms": transforms,
+        "output_size": image.size,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+    return image_bytes_io.getvalue(), image_info
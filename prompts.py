@@ -0,0 +1,72 @@
+"""
+Model name and prompts for checkbox analysis.
+
+Shared by the API and the bulk runner so both ask the model the same question.
+``ANALYSIS_PROMPT`` and ``REGION_PROMPT`` are the whole-page and tile prompts
+for the configured ``PROMPT_STYLE``.
+"""
+
+from parsing import PROMPT_STYLE
+
+# Model configuration
+MODEL_NAME = "granite3.2-vision:2b"
+
+# Document verifier prompt
+DOCUMENT_VERIFIER_PROMPT = """
+You are an intelligent document verifier. Your job is to analyze images of documents and determine their meaning.
+
+Specifically, you can understand checkboxes in photos. You can identify which options are checked or unchecked.
+
+IMPORTANT: Only analyze checkboxes that are actually visible in the image. Do not include any fields or options that are not present.
+
+Options may be True/False or multiple choice. For grouped options (like Gender, Race, etc.), use nested JSON structure.
+
+For example, if the image contains:
+- A simple checkbox for "Option A" that is checked
+- A simple checkbox for "Option B" that is unchecked  
+- A grouped set like "Gender" with "Male" unchecked and "Female" checked
+
+Your response should look like this:
+{
+    "Option A": "Checked",
+    "Option B": "Unchecked",
+    "Gender": {
+        "Male": "Unchecked",
+        "Female": "Checked"
+    }
+}
+
+Use "Checked" for selected options and "Unchecked" for unselected options. For grouped options, create nested objects with the group name as the key.
+
+ONLY include checkboxes and options that are actually visible in the image. Do not add any fields that are not present. Don't add any text that doesn't appear in the image.
+
+Analyze the attached image and provide your results. Be as brief and accurate as possible. Do not include any additional text or explanations.
+"""
+
+# Shorter prompt for one region of a page in tiled mode
+TILE_PROMPT = """
+This image is one region of a form. List every checkbox visible in it as JSON, using "Checked" or "Unchecked".
+Nest options under their group name when the group heading is visible, for example:
+{"Gender": {"Male": "Unchecked", "Female": "Checked"}, "Military Service": "Checked"}
+Skip checkboxes that are cut off at the edge. Output only the JSON.
+"""
+
+# Compact prompts (PROMPT_STYLE=compact): 1/0 instead of state names, no
+# whitespace, so the model generates far fewer tokens per checkbox
+COMPACT_PROMPT = """
+List every checkbox visible in this document image as minified JSON: 1 if checked, 0 if not.
+Nest options under their group name, for example:
+{"Option A":1,"Option B":0,"Gender":{"Male":0,"Female":1}}
+Use the labels exactly as printed. Only include checkboxes in the image. Output only the JSON.
+"""
+
+COMPACT_TILE_PROMPT = """
+This image is one region of a form. List every checkbox visible in it as minified JSON: 1 if checked, 0 if not.
+Nest options under their group name when the group heading is visible, for example:
+{"Gender":{"Male":0,"Female":1},"Military Service":1}
+Skip checkboxes cut off at the edge. Output only the JSON.
+"""
+
+# Prompts used for whole pages and for tiles
+ANALYSIS_PROMPT = COMPACT_PROMPT if PROMPT_STYLE == "compact" else DOCUMENT_VERIFIER_PROMPT
+REGION_PROMPT = COMPACT_TILE_PROMPT if PROMPT_STYLE == "compact" else TILE_PROMPT
@@ -0,0 +1,322 @@
+"""
+Background persistence of analysis results.
+
+``ResultSink.submit`` only puts the record on a bounded in-process queue, so
+storing a result never adds latency to the request that produced it. A
+background thread drains the queue in batches, flushing when
+``batch_size`` records are waiting or ``flush_interval`` seconds after the
+first one arrived, and writes each batch to a pluggable backend: Weaviate for
+production, or a local JSONL file or SQLite database for development and
+tests. Failed writes are retried with exponential backoff; when the queue is
+full new records are dropped and counted rather than blocking the caller.
+
+Every writer (the API, ``bulk.py`` and ``main.py``) builds its records with
+``result_record`` so they share one set of fields in the collection.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+
+# Result sink configuration
+RESULT_SINK = os.getenv("RESULT_SINK", "none")
+RESULT_SINK_PATH = os.getenv("RESULT_SINK_PATH", "")
+RESULT_SINK_COLLECTION = os.getenv("RESULT_SINK_COLLECTION", "Checkbox_task_collection")
+RESULT_SINK_BATCH_SIZE = int(os.getenv("RESULT_SINK_BATCH_SIZE", "200"))
+RESULT_SINK_FLUSH_INTERVAL = float(os.getenv("RESULT_SINK_FLUSH_INTERVAL", "2.0"))
+RESULT_SINK_QUEUE_SIZE = int(os.getenv("RESULT_SINK_QUEUE_SIZE", "10000"))
+RESULT_SINK_MAX_RETRIES = int(os.getenv("RESULT_SINK_MAX_RETRIES", "5"))
+
+SINK_KINDS = ("none", "jsonl", "sqlite", "weaviate")
+
+
+def result_record(
+    filepath: str,
+    output: Dict[str, Any],
+    mode: str,
+    model: Optional[str],
+    cached: bool = False,
+    created: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Record stored for one analysed image
+
+    Args:
+        filepath: Uploaded filename or path of the image
+        output: Parsed checkbox analysis, stored as JSON text
+        mode: Analysis mode that produced it (``llm``, ``cv``, ...)
+        model: Vision model asked, or None when no model was used
+        cached: Whether the result came from the result cache
+        created: Unix time of the analysis (defaults to now)
+    """
+    return {
+        "filepath": filepath,
+        "output": json.dumps(output),
+        "mode": mode,
+        "model": model,
+        "cached": cached,
+        "created": time.time() if created is None else created
+    }
+
+
+class SinkWriteError(Exception):
+    """Raised by a sink backend when part of a batch was not stored"""
+
+
+class SinkBackend(ABC):
+    """Interface for result storage; backends write whole batches"""
+
+    name = "backend"
+
+    @abstractmethod
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Store every record of the batch
+
+        Raises:
+            SinkWriteError: if only part of the batch was stored
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlSink(SinkBackend):
+    """Appends records to a JSON Lines file"""
+
+    name = "jsonl"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+
+
+class SQLiteSink(SinkBackend):
+    """Stores records as JSON rows in a SQLite table"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        # Only the flush thread writes, but the connection is created here
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO results (record, created) VALUES (?, ?)",
+                [(json.dumps(record), now) for record in records]
+            )
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def connect_weaviate():
+    """Connect to Weaviate Cloud using ``WEAVIATE_URL`` and ``WEAVIATE_API_KEY``"""
+    import weaviate
+    from weaviate.classes.init import Auth
+
+    client = weaviate.connect_to_weaviate_cloud(
+        cluster_url=os.getenv("WEAVIATE_URL"),
+        auth_credentials=Auth.api_key(os.getenv("WEAVIATE_API_KEY")),
+    )
+    client.connect()
+    return client
+
+
+class WeaviateSink(SinkBackend):
+    """
+    Inserts records into a Weaviate collection, one request per batch
+
+    The client is created on the first write (by ``client_factory``) and kept
+    for the life of the sink. Dict and list values are stored as JSON text.
+    """
+
+    name = "weaviate"
+
+    def __init__(self, collection: str = RESULT_SINK_COLLECTION, client_factory: Callable[[], Any] = connect_weaviate):
+        self.collection = collection
+        self.client_factory = client_factory
+        self._client = None
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        if self._client is None:
+            self._client = self.client_factory()
+        objects = [
+            {
+                key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                for key, value in record.items()
+            }
+            for record in records
+        ]
+        response = self._client.collections.get(self.collection).data.insert_many(objects)
+        if response.has_errors:
+            # Weaviate reports errors per object; retry the whole batch
+            raise SinkWriteError(f"{len(response.errors)} of {len(objects)} objects failed: {next(iter(response.errors.values()))}")
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class ResultSink:
+    """Bounded queue drained in batches by a background flush thread"""
+
+    def __init__(
+        self,
+        backend: SinkBackend,
+        batch_size: int = RESULT_SINK_BATCH_SIZE,
+        flush_interval: float = RESULT_SINK_FLUSH_INTERVAL,
+        max_queue: int = RESULT_SINK_QUEUE_SIZE,
+        max_retries: int = RESULT_SINK_MAX_RETRIES,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0
+    ):
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._idle = threading.Condition()
+        self._pending = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+        self.batches = 0
+        self._thread = threading.Thread(target=self._run, name="result-sink", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """Queue a record without blocking; False if the queue was full"""
+        with self._idle:
+            if self._stopping.is_set():
+                self.dropped += 1
+                return False
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._pending += 1
+        return True
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """Wait for a record, then collect more until the batch is full or the interval passes"""
+        batch: List[Dict[str, Any]] = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                if self._stopping.is_set() and self._queue.empty():
+                    break
+                timeout = 0.1
+            else:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 and not self._stopping.is_set():
+                    break
+            try:
+                record = self._queue.get(timeout=max(0.0, timeout))
+            except queue.Empty:
+                if self._stopping.is_set() and batch:
+                    break
+                continue
+            batch.append(record)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """Write a batch, retrying with exponential backoff before giving up on it"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.backend.write_batch(batch)
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    print(f"Warning: Dropping {len(batch)} results after {attempt + 1} attempts to write to {self.backend.name}: {e}")
+                    return
+                self.retries += 1
+                # While shutting down, retry without waiting the full backoff
+                self._stopping.wait(min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stopping.is_set():
+                    return
+                continue
+            self._write(batch)
+            with self._idle:
+                self._pending -= len(batch)
+                self._idle.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted record was written or given up on"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write what is queued, stop the flush thread and close the backend"""
+        with self._idle:
+            self._stopping.set()
+        self._thread.join(timeout)
+        self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retries": self.retries,
+            "batches": self.batches
+        }
+
+
+def create_sink(kind: str = RESULT_SINK, path: str = RESULT_SINK_PATH, **options) -> Optional[ResultSink]:
+    """
+    Build the sink selected by ``RESULT_SINK``
+
+    Args:
+        kind: ``none``, ``jsonl``, ``sqlite`` or ``weaviate``
+        path: File for the ``jsonl`` and ``sqlite`` backends
+        options: Passed to ``ResultSink`` (batch size, flush interval, ...)
+
+    Returns:
+        The running sink, or None for ``none``
+    """
+    if kind in ("", "none"):
+        return None
+    if kind == "weaviate":
+        backend: SinkBackend = WeaviateSink()
+    elif kind in ("jsonl", "sqlite"):
+        if not path:
+            raise ValueError(f"RESULT_SINK={kind} needs RESULT_SINK_PATH")
+        backend = JsonlSink(path) if kind == "jsonl" else SQLiteSink(path)
+    else:
+        raise ValueError(f"Unknown result sink '{kind}', expected one of: {', '.join(SINK_KINDS)}")
+    return ResultSink(backend, **options)
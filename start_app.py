@@ -1,80 +1,217 @@
 #!/usr/bin/env python3
 """
 Startup script to launch both the FastAPI backend and frontend server.
+
+The backend runs under uvicorn with ``--workers`` processes. The script waits
+for ``/ready`` instead of sleeping, and on Ctrl+C or SIGTERM lets uvicorn
+finish in-flight requests before exiting. With more than one worker the result
+cache, the metrics, the background jobs and the form templates are kept in
+SQLite files under ``--state-dir`` (unless ``RESULT_CACHE_PATH`` /
+``METRICS_DB_PATH`` / ``JOB_STORE_PATH`` / ``TEMPLATE_DB_PATH`` are already
+set), so every worker sees the same cache entries and templates, ``/metrics``
+reports totals for all of them and any worker can answer ``GET /jobs/{id}``.
 """
 
-import subprocess
-import time
+import argparse
+import json
+import os
 import signal
+import socket
+import subprocess
 import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import webbrowser
 from pathlib import Path
 
 # Get the directory of this script
 SCRIPT_DIR = Path(__file__).parent
 
-def start_backend():
+FRONTEND_PORT = 3000
+
+# Set by the signal handler to start a graceful shutdown
+shutdown_requested = threading.Event()
+
+
+def shared_state_env(workers: int, state_dir: Path) -> dict:
+    """Environment for the backend, pointing every worker at the same cache, metrics, job and template files"""
+    env = dict(os.environ)
+    if workers <= 1:
+        return env
+    state_dir.mkdir(parents=True, exist_ok=True)
+    env.setdefault("RESULT_CACHE_PATH", str(state_dir / "result_cache.sqlite3"))
+    if "METRICS_DB_PATH" not in env:
+        # Counters start from zero on every launch, as with a single process
+        metrics_path = state_dir / "metrics.sqlite3"
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{metrics_path}{suffix}").unlink(missing_ok=True)
+        env["METRICS_DB_PATH"] = str(metrics_path)
+    if not env.get("JOB_STORE_PATH"):
+        # Workers claim jobs in the store, so each job runs once
+        env["JOB_STORE_PATH"] = str(state_dir / "jobs.sqlite3")
+    if not env.get("TEMPLATE_DB_PATH"):
+        # Workers reload their templates when another one changes the store
+        env["TEMPLATE_DB_PATH"] = str(state_dir / "templates.sqlite3")
+    return env
+
+
+def start_backend(host: str, port: int, workers: int, graceful_timeout: int, env: dict):
     """Start the FastAPI backend server"""
-    print("🚀 Starting FastAPI backend server...")
+    print(f"🚀 Starting FastAPI backend server with {workers} worker(s)...")
     backend_cmd = [
+        sys.executable,
+        "-m",
         "uvicorn",
         "api:app",
         "--host",
-        "0.0.0.0",
+        host,
         "--port",
-        "8000"
+        str(port),
+        "--workers",
+        str(workers),
+        "--timeout-graceful-shutdown",
+        str(graceful_timeout)
     ]
-    return subprocess.Popen(backend_cmd)
+    return subprocess.Popen(backend_cmd, cwd=SCRIPT_DIR, env=env)
+
 
 def start_frontend():
     """Start the frontend server"""
     print("🌐 Starting frontend server...")
     frontend_cmd = [
-        "python",
+        sys.executable,
         str(SCRIPT_DIR / "serve_frontend.py")
     ]
     return subprocess.Popen(frontend_cmd)
 
+
+def wait_for_ready(url: str, process: subprocess.Popen, timeout: float) -> bool:
+    """
+    Poll the backend's /ready endpoint until the model is loaded
+
+    Returns:
+        True once /ready answers 200; False if the backend exits, the timeout
+        passes or shutdown is requested first
+    """
+    deadline = time.monotonic() + timeout
+    last_state = None
+    while time.monotonic() < deadline and not shutdown_requested.is_set():
+        if process.poll() is not None:
+            return False
+        state = "starting"
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=2) as response:
+                if response.status == 200:
+                    return True
+        except urllib.error.HTTPError as e:
+            # 503 while the model is pulled or warmed up
+            state = f"model {e.code}"
+            try:
+                state = json.loads(e.read())["data"]["state"]
+            except (ValueError, KeyError, TypeError):
+                pass
+        except (urllib.error.URLError, OSError):
+            pass
+        if state != last_state:
+            print(f"⏳ Backend {state}...")
+            last_state = state
+        shutdown_requested.wait(0.5)
+    return False
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float) -> bool:
+    """Wait until something accepts connections on ``port``"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            shutdown_requested.wait(0.2)
+    return False
+
+
+def stop(process: subprocess.Popen, timeout: float) -> None:
+    """SIGTERM a process and kill it if it has not exited after ``timeout`` seconds"""
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
 def signal_handler(sig, frame):
-    """Handle Ctrl+C gracefully"""
-    print("\n🛑 Shutting down servers...")
-    backend_process.terminate()
-    frontend_process.terminate()
-    sys.exit(0)
+    """Handle Ctrl+C and SIGTERM gracefully"""
+    shutdown_requested.set()
 
-if __name__ == "__main__":
-    # Set up signal handler for graceful shutdown
+
+def main():
+    parser = argparse.ArgumentParser(description="Start the Checkbox Detection API and frontend")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")), help="Backend worker processes")
+    parser.add_argument("--host", default="0.0.0.0", help="Backend bind address")
+    parser.add_argument("--port", type=int, default=8000, help="Backend port")
+    parser.add_argument("--state-dir", default=str(SCRIPT_DIR / ".run"), help="Directory for the shared cache and metrics files")
+    parser.add_argument("--ready-timeout", type=float, default=900, help="Seconds to wait for /ready (the first start may pull the model)")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="Seconds in-flight requests get to finish on shutdown")
+    parser.add_argument("--no-frontend", action="store_true", help="Only start the backend")
+    parser.add_argument("--no-browser", action="store_true", help="Do not open the frontend in a browser")
+    args = parser.parse_args()
+
+    # Set up signal handlers for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
-    
+    signal.signal(signal.SIGTERM, signal_handler)
+
     print("📋 Starting Checkbox Detection Application...")
     print("=" * 50)
-    
-    # Start backend server
-    backend_process = start_backend()
-    
-    # Wait a moment for backend to start
-    time.sleep(3)
-    
-    # Start frontend server
-    frontend_process = start_frontend()
-    
-    # Wait a moment for frontend to start
-    time.sleep(2)
-    
-    print("\n Both servers are running!")
-    print("Frontend: http://localhost:3000/frontend.html")
-    print("Backend API: http://localhost:8000")
-    print("API Docs: http://localhost:8000/docs")
-    print("\nPress Ctrl+C to stop both servers")
-    
-    # Try to open the frontend in browser
-    try:
-        webbrowser.open('http://localhost:3000/frontend.html')
-    except:
-        pass
-    
-    # Wait for processes to complete
+
+    backend_url = f"http://127.0.0.1:{args.port}"
+    env = shared_state_env(args.workers, Path(args.state_dir))
+    backend_process = start_backend(args.host, args.port, args.workers, args.graceful_timeout, env)
+    frontend_process = None if args.no_frontend else start_frontend()
+
+    exit_code = 0
     try:
-        backend_process.wait()
-        frontend_process.wait()
-    except KeyboardInterrupt:
-        signal_handler(signal.SIGINT, None)
+        if not wait_for_ready(backend_url, backend_process, args.ready_timeout):
+            if not shutdown_requested.is_set():
+                print("❌ Backend did not become ready")
+                exit_code = 1
+            return exit_code
+        if frontend_process is not None and not wait_for_port(FRONTEND_PORT, frontend_process, 10):
+            print("⚠️  Frontend server did not start")
+
+        print("\n Servers are running!")
+        if frontend_process is not None:
+            print(f"Frontend: http://localhost:{FRONTEND_PORT}/frontend.html")
+        print(f"Backend API: http://localhost:{args.port} ({args.workers} worker(s))")
+        print(f"API Docs: http://localhost:{args.port}/docs")
+        print("\nPress Ctrl+C to stop")
+
+        # Try to open the frontend in browser
+        if frontend_process is not None and not args.no_browser:
+            try:
+                webbrowser.open(f"http://localhost:{FRONTEND_PORT}/frontend.html")
+            except Exception:
+                pass
+
+        # Run until a signal arrives or the backend exits
+        while not shutdown_requested.wait(0.5):
+            if backend_process.poll() is not None:
+                print("❌ Backend exited")
+                exit_code = backend_process.returncode or 1
+                break
+    finally:
+        print("\n🛑 Shutting down servers (finishing in-flight requests)...")
+        # uvicorn stops accepting connections, waits for in-flight requests
+        # and runs the API's shutdown hooks in every worker
+        stop(backend_process, args.graceful_timeout + 10)
+        stop(frontend_process, 5)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
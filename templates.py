@@ -0,0 +1,434 @@
+"""
+Registry of known form layouts.
+
+A template is a blank form registered once. Its checkbox regions come from the
+CV detector and its labels from the nested structure the model produces for it
+(or that the caller supplies), assigned to the boxes in reading order. Incoming
+pages are matched against every template by a perceptual difference hash kept
+in a BK-tree, aligned to the best candidate with ink projection profiles, and
+answered by reading only the known box regions. Templates live in memory and,
+when ``TEMPLATE_DB_PATH`` is set, in SQLite so they survive restarts. Worker
+processes can share the SQLite file: each registry reloads its templates when
+another process has changed the store.
+"""
+
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from cv_detector import CV_FILL_THRESHOLD, CV_WORK_SIZE, box_state, detect_checkboxes, fill_ratio, otsu_threshold, side_coverage
+
+# Template configuration
+TEMPLATE_DB_PATH = os.getenv("TEMPLATE_DB_PATH", "")
+TEMPLATE_MATCH_DISTANCE = int(os.getenv("TEMPLATE_MATCH_DISTANCE", "48"))
+TEMPLATE_MIN_ALIGNMENT = float(os.getenv("TEMPLATE_MIN_ALIGNMENT", "0.7"))
+
+# Side of the difference hash grid; hashes have HASH_SIZE ** 2 bits
+HASH_SIZE = 16
+
+# Candidates verified by alignment per lookup, closest hash first
+MAX_CANDIDATES = 3
+
+
+class TemplateMismatchError(ValueError):
+    """Raised when the labels given for a template do not fit its checkboxes"""
+
+
+def dhash(gray: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """Difference hash: one bit per horizontally adjacent pair on a small grid"""
+    small = np.asarray(gray.resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Metric tree over hashes answering Hamming-radius queries without a full scan"""
+
+    def __init__(self):
+        # Nodes are [hash, keys, {distance: child}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, key: str) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [key], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(key)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [key], {}]
+                return
+            node = child
+
+    def remove(self, value: int, key: str) -> bool:
+        """Forget ``key``; its node stays in place to route other lookups"""
+        node = self._root
+        while node is not None:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                if key in node[1]:
+                    node[1].remove(key)
+                    self._size -= 1
+                    return True
+                return False
+            node = node[2].get(distance)
+        return False
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, str]]:
+        """(distance, key) pairs within ``radius`` of ``value``, closest first"""
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, key) for key in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(found)
+
+
+def flatten_fields(fields: Dict[str, Any], prefix: Tuple[str, ...] = ()) -> List[List[str]]:
+    """Label paths of the leaves of a nested checkbox result, in order"""
+    paths = []
+    for key, value in fields.items():
+        if isinstance(value, dict):
+            paths.extend(flatten_fields(value, prefix + (key,)))
+        else:
+            paths.append(list(prefix + (key,)))
+    return paths
+
+
+def nest_states(paths: List[List[str]], states: List[str]) -> Dict[str, Any]:
+    """Rebuild the nested result shape from label paths and their states"""
+    result: Dict[str, Any] = {}
+    for path, state in zip(paths, states):
+        node = result
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = state
+    return result
+
+
+def _load_gray(image_data: bytes) -> Image.Image:
+    image = Image.open(io.BytesIO(image_data))
+    image.seek(0)
+    return ImageOps.exif_transpose(image).convert("L")
+
+
+def _ink(gray: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    if gray.size != tuple(size):
+        gray = gray.resize(tuple(size), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.uint8)
+    return pixels < otsu_threshold(pixels)
+
+
+def _content_extent(profile: np.ndarray) -> Tuple[int, int]:
+    """First and last index of a projection profile holding more than stray specks"""
+    inked = np.nonzero(profile >= max(2.0, profile.max() * 0.01))[0]
+    if len(inked) == 0:
+        return 0, len(profile) - 1
+    return int(inked[0]), int(inked[-1])
+
+
+def _fit_axis(profile: np.ndarray, reference: np.ndarray) -> Tuple[float, float]:
+    """
+    Map template coordinates to page coordinates along one axis
+
+    The scale comes from the inked extents of both profiles; the offset is then
+    refined by correlating the rescaled page profile with the template's.
+
+    Returns:
+        Tuple of (scale, offset) so that ``page = template * scale + offset``
+    """
+    ref_start, ref_end = _content_extent(reference)
+    start, end = _content_extent(profile)
+    scale = (end - start) / max(1, ref_end - ref_start)
+    scale = min(1.25, max(0.8, scale))
+    offset = start - ref_start * scale
+
+    positions = np.arange(len(reference)) * scale + offset
+    resampled = np.interp(positions, np.arange(len(profile)), profile, left=0.0, right=0.0)
+    max_shift = max(1, len(reference) // 20)
+    correlation = np.correlate(resampled, reference, mode="full")
+    zero = len(reference) - 1
+    shift = int(np.argmax(correlation[zero - max_shift:zero + max_shift + 1])) - max_shift
+    return scale, offset + shift * scale
+
+
+def _snap_outline(summed: np.ndarray, left: int, top: int, width: int, height: int, band: int, reach: int) -> Tuple[int, int]:
+    """
+    Top-left corner within ``reach`` of (left, top) where a box outline best fits
+
+    Every candidate position is scored at once by the ink density of the ring
+    between the box and its interior, using the summed-area table ``summed``.
+    """
+    max_left = summed.shape[1] - 1 - width
+    max_top = summed.shape[0] - 1 - height
+    xs = np.clip(np.arange(left - reach, left + reach + 1), 0, max(0, max_left))
+    ys = np.clip(np.arange(top - reach, top + reach + 1), 0, max(0, max_top))
+    y, x = np.meshgrid(ys, xs, indexing="ij")
+
+    def area_sum(y0, x0, y1, x1):
+        return summed[y1, x1] - summed[y0, x1] - summed[y1, x0] + summed[y0, x0]
+
+    outer = area_sum(y, x, y + height, x + width)
+    inner = area_sum(y + band, x + band, y + height - band, x + width - band)
+    row, column = np.unravel_index(np.argmax(outer - inner), outer.shape)
+    return int(x[row, column]), int(y[row, column])
+
+
+class TemplateRegistry:
+    """Known form layouts indexed by perceptual hash"""
+
+    def __init__(
+        self,
+        path: str = TEMPLATE_DB_PATH,
+        max_distance: int = TEMPLATE_MATCH_DISTANCE,
+        min_alignment: float = TEMPLATE_MIN_ALIGNMENT,
+        work_size: int = CV_WORK_SIZE,
+        fill_threshold: float = CV_FILL_THRESHOLD
+    ):
+        self.path = path
+        self.max_distance = max_distance
+        self.min_alignment = min_alignment
+        self.work_size = work_size
+        self.fill_threshold = fill_threshold
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._index = BKTree()
+        self._lock = threading.Lock()
+        self._db = None
+        self._data_version = None
+        self.matches = 0
+        self.misses = 0
+
+        if path:
+            # WAL lets worker processes read while another one writes
+            self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS templates ("
+                "template_id TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def _refresh(self) -> None:
+        """Reload every template if another connection changed the store; call with the lock held"""
+        if self._db is None:
+            return
+        # data_version only moves when another connection commits
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._templates = {}
+        self._index = BKTree()
+        for (value,) in self._db.execute("SELECT value FROM templates ORDER BY created"):
+            self._add(json.loads(value))
+        self._data_version = version
+
+    def _add(self, template: Dict[str, Any]) -> None:
+        template["profiles"] = [np.asarray(profile, dtype=np.float64) for profile in template["profiles"]]
+        self._templates[template["template_id"]] = template
+        self._index.add(int(template["hash"], 16), template["template_id"])
+
+    @staticmethod
+    def summary(template: Dict[str, Any]) -> Dict[str, Any]:
+        """Public description of a template"""
+        return {
+            "template_id": template["template_id"],
+            "name": template["name"],
+            "checkboxes": len(template["boxes"]),
+            "fields": nest_states(template["labels"], ["Unchecked"] * len(template["labels"])),
+            "created": template["created"]
+        }
+
+    def register(self, image_data: bytes, fields: Dict[str, Any], name: str = "") -> Dict[str, Any]:
+        """
+        Register a blank form
+
+        Args:
+            image_data: Raw bytes of the blank (or any filled) form
+            fields: Nested result describing the form, as the model returns it;
+                its leaves are assigned to the detected boxes in reading order
+            name: Human-readable template name
+
+        Raises:
+            TemplateMismatchError: if the number of leaves differs from the
+                number of checkboxes found on the form
+        """
+        gray = _load_gray(image_data)
+        detection = detect_checkboxes(image_data, self.work_size, self.fill_threshold)
+        labels = flatten_fields(fields)
+        if not detection["boxes"]:
+            raise TemplateMismatchError("No checkboxes were found on the form")
+        if len(labels) != len(detection["boxes"]):
+            raise TemplateMismatchError(
+                f"Form has {len(detection['boxes'])} checkboxes but {len(labels)} fields were given"
+            )
+
+        scale = max(1.0, max(gray.size) / self.work_size) if self.work_size > 0 else 1.0
+        size = [max(1, round(gray.width / scale)), max(1, round(gray.height / scale))]
+        ink = _ink(gray, size)
+        template = {
+            "template_id": uuid.uuid4().hex,
+            "name": name,
+            "hash": format(dhash(gray), "x"),
+            "size": size,
+            "boxes": [
+                [int(coordinate / scale) for coordinate in box["bbox"]]
+                for box in detection["boxes"]
+            ],
+            "labels": labels,
+            "profiles": [ink.sum(axis=1).tolist(), ink.sum(axis=0).tolist()],
+            "created": time.time()
+        }
+
+        with self._lock:
+            self._refresh()
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO templates (template_id, value, created) VALUES (?, ?, ?)",
+                    (template["template_id"], json.dumps(template), template["created"])
+                )
+                self._db.commit()
+            self._add(template)
+        return self.summary(template)
+
+    def delete(self, template_id: str) -> bool:
+        """Remove a template; returns False if it did not exist"""
+        with self._lock:
+            self._refresh()
+            template = self._templates.pop(template_id, None)
+            if template is None:
+                return False
+            self._index.remove(int(template["hash"], 16), template_id)
+            if self._db is not None:
+                self._db.execute("DELETE FROM templates WHERE template_id = ?", (template_id,))
+                self._db.commit()
+            return True
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            return [self.summary(template) for template in self._templates.values()]
+
+    def _read(self, template: Dict[str, Any], gray: Image.Image) -> Dict[str, Any]:
+        """Align a page to ``template`` and read its known box regions"""
+        width, height = template["size"]
+        ink = _ink(gray, (width, height))
+        page_scale_x = gray.width / width
+        page_scale_y = gray.height / height
+        row_profile, column_profile = template["profiles"]
+        scale_y, offset_y = _fit_axis(ink.sum(axis=1).astype(np.float64), row_profile)
+        scale_x, offset_x = _fit_axis(ink.sum(axis=0).astype(np.float64), column_profile)
+
+        summed = np.zeros((height + 1, width + 1), dtype=np.int32)
+        np.cumsum(np.cumsum(ink, axis=0, dtype=np.int32), axis=1, out=summed[1:, 1:])
+
+        boxes = []
+        for path, (x0, y0, x1, y1) in zip(template["labels"], template["boxes"]):
+            # Map the box onto the page, then refine it locally to absorb skew
+            # and the remaining scale error
+            box_width = max(4, round((x1 - x0) * scale_x))
+            box_height = max(4, round((y1 - y0) * scale_y))
+            left = round(x0 * scale_x + offset_x)
+            top = round(y0 * scale_y + offset_y)
+            band = max(2, box_width // 8)
+            reach = max(3, box_width // 4)
+            bx0, by0 = _snap_outline(summed, left, top, box_width, box_height, band, reach)
+            coverage = side_coverage(ink, bx0, by0, bx0 + box_width - 1, by0 + box_height - 1, band)
+            bx1, by1 = bx0 + box_width, by0 + box_height
+            ratio = fill_ratio(ink, bx0, by0, bx1 - 1, by1 - 1)
+            state, confidence = box_state(ratio, self.fill_threshold)
+            boxes.append({
+                "label": path,
+                "bbox": [int(bx0 * page_scale_x), int(by0 * page_scale_y), int(bx1 * page_scale_x), int(by1 * page_scale_y)],
+                "fill_ratio": round(ratio, 4),
+                "state": state,
+                "confidence": confidence,
+                "alignment": round(max(coverage, 0.0), 3)
+            })
+
+        return {
+            "template_id": template["template_id"],
+            "name": template["name"],
+            "alignment": round(float(np.mean([box["alignment"] for box in boxes])), 3),
+            "confidence": min(box["confidence"] for box in boxes),
+            "checkbox_analysis": nest_states(template["labels"], [box["state"] for box in boxes]),
+            "boxes": boxes
+        }
+
+    def match(self, image_data: bytes) -> Optional[Dict[str, Any]]:
+        """
+        Answer a page from the closest matching template
+
+        Returns:
+            Dict with ``template_id``, ``name``, hash ``distance``, mean box
+            ``alignment``, lowest box ``confidence``, the nested
+            ``checkbox_analysis`` and per-box details, or None when no
+            template matches
+        """
+        with self._lock:
+            self._refresh()
+            if not self._templates:
+                return None
+        gray = _load_gray(image_data)
+        page_hash = dhash(gray)
+        with self._lock:
+            candidates = [
+                (distance, self._templates[template_id])
+                for distance, template_id in self._index.search(page_hash, self.max_distance)[:MAX_CANDIDATES]
+            ]
+
+        for distance, template in candidates:
+            result = self._read(template, gray)
+            if result["alignment"] >= self.min_alignment:
+                result["distance"] = distance
+                self.matches += 1
+                return result
+        self.misses += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Template count and match counters for health reporting"""
+        with self._lock:
+            self._refresh()
+        return {
+            "templates": len(self._templates),
+            "disk_enabled": self._db is not None,
+            "matches": self.matches,
+            "misses": self.misses
+        }
+
+    def close(self) -> None:
+        """Close the SQLite store if it is open"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
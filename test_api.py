@@ -1,5 +1,9 @@
 import requests
 import json
+import asyncio
+import http.server
+import os
+import threading
 
 # API base URL
 BASE_URL = "http://localhost:8000"
@@ -47,6 +51,213 @@ def test_url_analysis(image_url):
         print(f"Error testing URL analysis: {e}")
         return False
 
+class StandInImageHandler(http.server.BaseHTTPRequestHandler):
+    """Local stand-in image server that records which connection served each request"""
+
+    protocol_version = "HTTP/1.1"
+    body = b"\x89PNG\r\n\x1a\n" + b"0" * 1024
+    connections = []
+
+    def do_GET(self):
+        StandInImageHandler.connections.append(self.client_address)
+        if self.path == "/large.png":
+            payload = b"0" * (64 * 1024)
+            # No Content-Length, so the limit has to be enforced while streaming
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(payload), 4096):
+                chunk = payload[start:start + 4096]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+def test_image_fetcher():
+    """Test connection reuse, conditional GET and the size cap of the URL fetcher"""
+    from fetcher import FetchTooLargeError, ImageFetcher
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    StandInImageHandler.connections = []
+
+    async def run():
+        fetcher = ImageFetcher(max_bytes=16 * 1024)
+        try:
+            first = await fetcher.fetch(f"{base_url}/form.png")
+            second = await fetcher.fetch(f"{base_url}/form.png")
+            try:
+                await fetcher.fetch(f"{base_url}/large.png")
+                too_large_rejected = False
+            except FetchTooLargeError:
+                too_large_rejected = True
+            stats = fetcher.stats()
+        finally:
+            await fetcher.close()
+        # Bodies above the per-entry threshold are not kept for revalidation
+        small_cache = ImageFetcher(cache_entry_bytes=len(StandInImageHandler.body) - 1)
+        try:
+            for _ in range(2):
+                await small_cache.fetch(f"{base_url}/form.png")
+            small_stats = small_cache.stats()
+        finally:
+            await small_cache.close()
+        return first, second, too_large_rejected, stats, small_stats
+
+    try:
+        first, second, too_large_rejected, stats, small_stats = asyncio.run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print("Fetcher stats:", json.dumps(stats, indent=2))
+    assert first == second == StandInImageHandler.body, "cached body differs from the download"
+    assert stats["downloads"] == 1, stats
+    assert stats["not_modified"] == 1, stats
+    assert stats["cached_bytes"] == len(StandInImageHandler.body), stats
+    assert small_stats["downloads"] == 2 and small_stats["cached_bytes"] == 0, small_stats
+    # Both requests for form.png must share one keep-alive connection
+    assert StandInImageHandler.connections[0] == StandInImageHandler.connections[1], StandInImageHandler.connections
+    assert too_large_rejected, "oversized download was not rejected"
+
+def test_backend_pool():
+    """Test least-outstanding routing and retries across stub Ollama servers"""
+    from backends import BackendPool, OllamaBackend
+    from benchmarks.stub_ollama import start_stub_server
+
+    healthy = [start_stub_server(delay=0.2) for _ in range(2)]
+    failing = start_stub_server(fail_status=500)
+    servers = healthy + [failing]
+    pool = BackendPool(
+        {server.url: OllamaBackend(server.url) for server in servers},
+        max_concurrency=2, failure_threshold=1, health_interval=0
+    )
+
+    results = []
+
+    def call():
+        response = pool.chat(model="granite3.2-vision:2b", messages=[{"role": "user", "content": "test"}])
+        results.append(json.loads(response["message"]["content"]))
+
+    try:
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.stats()
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    print("Backend pool stats:", json.dumps(stats, indent=2))
+    nodes = {node["name"]: node for node in stats["nodes"]}
+    assert len(results) == 8, results
+    # Every call succeeded on a healthy node, spread evenly between them
+    calls = [server.chat_calls for server in healthy]
+    assert sum(calls) == 8, calls
+    assert abs(calls[0] - calls[1]) <= 2, calls
+    assert not nodes[failing.url]["healthy"], nodes[failing.url]
+    assert stats["retries"] >= 1, stats
+
+def test_main_import():
+    """Test that importing main.py is fast and opens no connections"""
+    import subprocess
+    import sys
+
+    # A fresh interpreter, so modules already imported here don't hide the cost
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "elapsed = (time.perf_counter() - start) * 1000\n"
+        "loaded = [name for name in ('ollama', 'opik', 'weaviate', 'dotenv') if name in sys.modules]\n"
+        "created = main.get_weaviate_client.cache_info().currsize + main.get_opik_client.cache_info().currsize\n"
+        "print(json.dumps({'import_ms': round(elapsed, 2), 'loaded': loaded, 'clients': created}))\n"
+    )
+    # Point every client at an unroutable address so any connection attempt fails
+    env = dict(os.environ, OLLAMA_HOST="http://127.0.0.1:9", WEAVIATE_URL="http://127.0.0.1:9")
+    completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, timeout=60)
+    assert completed.returncode == 0, f"import failed: {completed.stderr}"
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    print("main.py import:", json.dumps(report))
+    assert not report["loaded"], f"modules loaded on import: {report['loaded']}"
+    assert report["clients"] == 0, f"{report['clients']} clients created on import"
+
+def test_merge_results():
+    """Test that merging tile results keeps distinct boxes and drops only cross-tile duplicates"""
+    from tiling import merge_results
+
+    # One tile reporting a top-level box and a grouped option of the same name saw two boxes
+    single_tile = merge_results([{"Other": "Checked", "Race": {"Other": "Unchecked", "Asian": "Checked"}}])
+    assert single_tile == {"Other": "Checked", "Race": {"Other": "Unchecked", "Asian": "Checked"}}, single_tile
+
+    # A tile that missed the group heading reports the option at the top level
+    split = merge_results([{"Other": "Checked"}, {"Race": {"Other": "Checked"}}])
+    assert split == {"Race": {"Other": "Checked"}}, split
+
+    # Disagreeing states are not the same box
+    disagree = merge_results([{"Other": "Unchecked"}, {"Race": {"Other": "Checked"}}])
+    assert disagree == {"Other": "Unchecked", "Race": {"Other": "Checked"}}, disagree
+
+    # Fields match ignoring case and spacing, and a mark seen in either tile wins
+    overlap = merge_results([{"Name A": "Unchecked"}, {"name  a": "Checked", "B": "Unchecked"}])
+    assert overlap == {"Name A": "Checked", "B": "Unchecked"}, overlap
+
+def test_parse_analysis():
+    """Test that completions parse the same whole and streamed, whatever surrounds the JSON"""
+    from parsing import IncrementalJSONParser, parse_analysis
+
+    def streamed(text):
+        parser = IncrementalJSONParser()
+        fields = {}
+        # Small chunks, so members and strings are split across feeds
+        for start in range(0, len(text), 3):
+            fields.update(parser.feed(text[start:start + 3]))
+        return fields
+
+    cases = [
+        # Code fences
+        ('```json\n{"Option A": "Checked", "Option B": "Unchecked"}\n```',
+         {"Option A": "Checked", "Option B": "Unchecked"}),
+        # Trailing commas, at the top level and inside a group
+        ('{"Option A": "Checked", "Gender": {"Male": "Unchecked", "Female": "Checked",},}',
+         {"Option A": "Checked", "Gender": {"Male": "Unchecked", "Female": "Checked"}}),
+        # Prose around the object, including braces before it
+        ('Each box is listed as {label: state}. Result: {"Option A": "yes"} Hope this helps!',
+         {"Option A": "Checked"}),
+        # Braces inside strings
+        ('{"Option {1}": "Checked", "Notes }": "no"}',
+         {"Option {1}": "Checked", "Notes }": "Unchecked"}),
+        # A list inside a group names the checked options
+        ('{"Race": ["Asian", "White"], "Veteran": "Unchecked"}',
+         {"Race": {"Asian": "Checked", "White": "Checked"}, "Veteran": "Unchecked"}),
+        # Compact answers
+        ('{"Option A":1,"Option B":0,"Gender":{"Male":0,"Female":1}}',
+         {"Option A": "Checked", "Option B": "Unchecked", "Gender": {"Male": "Unchecked", "Female": "Checked"}}),
+    ]
+    for text, expected in cases:
+        assert parse_analysis(text) == expected, (text, parse_analysis(text))
+        assert streamed(text) == expected, (text, streamed(text))
+
+    assert parse_analysis("No checkboxes found.") == {"raw_response": "No checkboxes found."}
+    assert streamed("No checkboxes found.") == {}
+
 if __name__ == "__main__":
     print("Testing Checkbox Detection API...")
     
@@ -63,5 +274,40 @@ if __name__ == "__main__":
     else:
         print("File upload test failed")
     
+    # Test the URL fetcher against a local stand-in server
+    try:
+        test_image_fetcher()
+        print("Image fetcher test passed")
+    except AssertionError as e:
+        print(f"Image fetcher test failed: {e}")
+    
+    # Test multi-backend routing against local stub Ollama servers
+    try:
+        test_backend_pool()
+        print("Backend pool test passed")
+    except AssertionError as e:
+        print(f"Backend pool test failed: {e}")
+    
+    # Test that main.py can be imported without network access
+    try:
+        test_main_import()
+        print("main.py import test passed")
+    except AssertionError as e:
+        print(f"main.py import test failed: {e}")
+    
+    # Test merging of tiled results
+    try:
+        test_merge_results()
+        print("Tile merge test passed")
+    except AssertionError as e:
+        print(f"Tile merge test failed: {e}")
+    
+    # Test parsing of model completions
+    try:
+        test_parse_analysis()
+        print("Parsing test passed")
+    except AssertionError as e:
+        print(f"Parsing test failed: {e}")
+    
     # You can add URL test here if you have a public image URL
     # test_url_analysis("https://example.com/checkbox-form.png")
@@ -0,0 +1,192 @@
+"""
+Region tiling for dense, multi-section forms.
+
+A full page sent to the model as one image is downscaled until small
+checkboxes are hard to read, and the completion for dozens of fields is long
+and slow. ``plan_tiles`` splits the page into overlapping full-width strips,
+cut between the lines of checkboxes the CV detector found (or on a fixed grid
+when it found none). The strips are analysed separately and
+``merge_results`` folds their answers back into one nested result,
+de-duplicating fields seen in more than one strip.
+"""
+
+import copy
+import io
+import os
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from PIL import Image, ImageOps
+
+# Tiling configuration
+TILE_ROWS = int(os.getenv("TILE_ROWS", "3"))
+TILE_COLUMNS = int(os.getenv("TILE_COLUMNS", "1"))
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.08"))
+
+Box = Tuple[int, int, int, int]
+
+
+def _grid(width: int, height: int, rows: int, columns: int, overlap: float) -> List[Box]:
+    """Overlapping grid cells covering the page"""
+    tiles = []
+    pad_x = int(width * overlap / 2)
+    pad_y = int(height * overlap / 2)
+    for row in range(rows):
+        for column in range(columns):
+            x0 = width * column // columns
+            x1 = width * (column + 1) // columns
+            y0 = height * row // rows
+            y1 = height * (row + 1) // rows
+            tiles.append((max(0, x0 - pad_x), max(0, y0 - pad_y), min(width, x1 + pad_x), min(height, y1 + pad_y)))
+    return tiles
+
+
+def _rows(boxes: Sequence[Box]) -> List[Tuple[int, int]]:
+    """Vertical extents of the lines of checkboxes, top to bottom"""
+    rows: List[List[int]] = []
+    for box in sorted(boxes, key=lambda box: box[1]):
+        if rows and box[1] < rows[-1][1]:
+            rows[-1][1] = max(rows[-1][1], box[3])
+        else:
+            rows.append([box[1], box[3]])
+    return [(top, bottom) for top, bottom in rows]
+
+
+def _pack_rows(rows: List[Tuple[int, int]], target: float) -> List[Tuple[int, int]]:
+    """
+    Group checkbox lines into strips of at most ``target`` pixels where possible
+
+    When a strip is full it is cut at the widest gap in its lower half, which
+    tends to fall between groups rather than inside one.
+    """
+    strips = []
+    current = [rows[0]]
+    for row in rows[1:]:
+        if row[1] - current[0][0] <= target:
+            current.append(row)
+            continue
+        following = current[1:] + [row]
+        cut = max(
+            range(max(1, len(current) // 2), len(current) + 1),
+            key=lambda index: (following[index - 1][0] - current[index - 1][1], index)
+        )
+        strips.append((current[0][0], current[cut - 1][1]))
+        current = current[cut:] + [row]
+    strips.append((current[0][0], current[-1][1]))
+    return strips
+
+
+def plan_tiles(
+    size: Tuple[int, int],
+    boxes: Optional[Sequence[Box]] = None,
+    rows: int = TILE_ROWS,
+    columns: int = TILE_COLUMNS,
+    overlap: float = TILE_OVERLAP
+) -> List[Box]:
+    """
+    Split a page into overlapping regions
+
+    Args:
+        size: Page (width, height) in pixels
+        boxes: Checkbox bounding boxes on the page, if known. Strips are then
+            cut between lines of boxes, preferring the widest gaps so groups
+            stay together, and are full width so the labels next to the
+            boxes stay in the tile.
+        rows, columns: Grid used without boxes; with boxes, ``rows`` is the
+            target number of strips
+        overlap: Fraction of the page height (and width for the grid) shared
+            by neighbouring tiles so group headings are repeated
+
+    Returns:
+        List of (x0, y0, x1, y1) tiles, top to bottom
+    """
+    width, height = size
+    if not boxes:
+        return _grid(width, height, max(1, rows), max(1, columns), overlap)
+
+    strips = _pack_rows(_rows(boxes), height / max(1, rows))
+
+    # Extend each strip halfway to its neighbours, plus the overlap, so text
+    # between clusters (group headings, labels) is kept
+    pad = int(height * overlap / 2)
+    tiles = []
+    for index, (top, bottom) in enumerate(strips):
+        upper = 0 if index == 0 else (strips[index - 1][1] + top) // 2
+        lower = height if index == len(strips) - 1 else (bottom + strips[index + 1][0]) // 2
+        tiles.append((0, max(0, upper - pad), width, min(height, lower + pad)))
+    return tiles
+
+
+def crop_tiles(image_data: bytes, tiles: Sequence[Box]) -> List[bytes]:
+    """Crop tiles out of the upright page and encode each as PNG"""
+    image = Image.open(io.BytesIO(image_data))
+    image.seek(0)
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+        image = image.convert("RGB")
+    crops = []
+    for tile in tiles:
+        image_bytes_io = io.BytesIO()
+        image.crop(tile).save(image_bytes_io, format="PNG")
+        crops.append(image_bytes_io.getvalue())
+    return crops
+
+
+def _normalize(key: str) -> str:
+    return " ".join(str(key).split()).casefold()
+
+
+def _merge_value(existing: Any, value: Any) -> Any:
+    if isinstance(existing, dict) and isinstance(value, dict):
+        return _merge_into(existing, value)
+    if isinstance(existing, dict) or isinstance(value, dict):
+        # A group in one tile and a bare field in another: keep the group
+        return existing if isinstance(existing, dict) else copy.deepcopy(value)
+    # A box cut by a tile edge can lose its mark but not gain one
+    if "Checked" in (existing, value) and "Unchecked" in (existing, value):
+        return "Checked"
+    return existing
+
+
+def _merge_into(target: Dict[str, Any], source: Dict[str, Any]) -> Dict[str, Any]:
+    keys = {_normalize(key): key for key in target}
+    for key, value in source.items():
+        existing_key = keys.get(_normalize(key))
+        if existing_key is None:
+            target[key] = copy.deepcopy(value)
+            keys[_normalize(key)] = key
+        else:
+            target[existing_key] = _merge_value(target[existing_key], value)
+    return target
+
+
+def merge_results(results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-tile results in tile order
+
+    Fields are matched ignoring case and spacing. A field seen in two tiles
+    counts as checked if either saw it checked. A top-level field is dropped
+    in favour of a grouped option with the same name and state only when the
+    two came from different tiles (one tile saw the group heading, the other
+    did not); a tile that reports both saw two separate boxes, so both are
+    kept.
+    """
+    merged: Dict[str, Any] = {}
+    # Tiles that reported each top-level key
+    origins: Dict[str, Set[int]] = {}
+    for index, result in enumerate(results):
+        _merge_into(merged, result)
+        for key in result:
+            origins.setdefault(_normalize(key), set()).add(index)
+
+    def duplicates_grouped_option(key: str, value: Any) -> bool:
+        for group_key, group in merged.items():
+            if not isinstance(group, dict) or origins[_normalize(key)] & origins[_normalize(group_key)]:
+                continue
+            if any(_normalize(option) == _normalize(key) and state == value for option, state in group.items()):
+                return True
+        return False
+
+    return {
+        key: value for key, value in merged.items()
+        if isinstance(value, dict) or not duplicates_grouped_option(key, value)
+    }